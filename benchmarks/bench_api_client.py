@@ -0,0 +1,91 @@
+"""
+Concurrent-update throughput of bot handlers: blocking ``requests`` vs the
+pooled async ``APIClient``.
+
+Each simulated update makes one API call against a local stub server that
+answers after a fixed delay, the way a handler in bot.py does.
+
+Run from the repository root:
+    python -m benchmarks.bench_api_client [--updates 100] [--delay 0.05]
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from medical_bot.api_client import APIClient
+
+
+def start_stub_server(delay):
+    """Starts a keep-alive HTTP server that replies after ``delay`` seconds."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(delay)
+            body = json.dumps([{'id': 1, 'full_name': 'Test User', 'family_members': [], 'addresses': []}]).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run_blocking(base_url, updates):
+    async def handle_update():
+        response = requests.get(f'{base_url}users/profile/', params={'phone_number': '09123456789'})
+        return response.status_code
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(handle_update() for _ in range(updates)))
+    return time.perf_counter() - started, results
+
+
+async def run_pooled(base_url, updates):
+    client = APIClient(base_url=base_url)
+    await client.start()
+
+    async def handle_update():
+        response = await client.get('users/profile/', params={'phone_number': '09123456789'})
+        return response.status_code
+
+    try:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(handle_update() for _ in range(updates)))
+        return time.perf_counter() - started, results
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=100, help='concurrent updates per run')
+    parser.add_argument('--delay', type=float, default=0.05, help='simulated API latency in seconds')
+    args = parser.parse_args()
+
+    server = start_stub_server(args.delay)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}/api/'
+    try:
+        for label, runner in (('blocking requests', run_blocking), ('pooled httpx', run_pooled)):
+            elapsed, results = asyncio.run(runner(base_url, args.updates))
+            assert all(code == 200 for code in results), results
+            print(f"{label:<18} {args.updates} updates in {elapsed:.3f}s -> {args.updates / elapsed:8.1f} updates/s")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
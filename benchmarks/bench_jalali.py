@@ -0,0 +1,88 @@
+"""
+Jalali conversion cost: plain jdatetime vs the ``medical_bot.jalali`` codec.
+
+Converts and formats a list of birth dates spread over the last century,
+the way serializers and the birthday task do for every user.
+
+Run from the repository root:
+    python -m benchmarks.bench_jalali [--dates 10000] [--repeat 5]
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+import jdatetime
+
+from medical_bot import jalali
+
+
+def jdatetime_to_jalali(dates):
+    result = []
+    for value in dates:
+        converted = jdatetime.date.fromgregorian(date=value)
+        result.append((converted.year, converted.month, converted.day))
+    return result
+
+
+def jdatetime_format(dates):
+    return [jdatetime.date.fromgregorian(date=value).strftime('%Y/%m/%d') for value in dates]
+
+
+def jdatetime_to_gregorian(jalali_dates):
+    return [jdatetime.date(*value).togregorian() for value in jalali_dates]
+
+
+def codec_to_jalali(dates):
+    return [jalali.to_jalali(value) for value in dates]
+
+
+def codec_format(dates):
+    return [jalali.format_date(value) for value in dates]
+
+
+def best_of(repeat, func, *args):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dates', type=int, default=10000, help='dates per run')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per case (best is reported)')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    today = date.today()
+    dates = [today - timedelta(days=rng.randrange(100 * 365)) for _ in range(args.dates)]
+    jalali_dates = jdatetime_to_jalali(dates)
+
+    started = time.perf_counter()
+    jalali.to_jalali(today)
+    print(f"table build: {(time.perf_counter() - started) * 1000:.1f} ms (once per process)")
+
+    assert codec_to_jalali(dates) == jalali_dates
+    assert jalali.to_jalali_many(dates) == jalali_dates
+    assert codec_format(dates) == jdatetime_format(dates)
+    assert jalali.to_gregorian_many(jalali_dates) == dates
+
+    cases = [
+        ('gregorian -> jalali', (jdatetime_to_jalali, dates), (codec_to_jalali, dates), (jalali.to_jalali_many, dates)),
+        ('format YYYY/MM/DD', (jdatetime_format, dates), (codec_format, dates), (jalali.format_dates, dates)),
+        ('jalali -> gregorian', (jdatetime_to_gregorian, jalali_dates), None, (jalali.to_gregorian_many, jalali_dates)),
+    ]
+    print(f"{'case':<22}{'jdatetime':>12}{'codec':>12}{'codec batch':>14}{'speedup':>10}")
+    for label, baseline, single, batch in cases:
+        base_time = best_of(args.repeat, *baseline)
+        single_time = best_of(args.repeat, *single) if single else None
+        batch_time = best_of(args.repeat, *batch)
+        single_text = f"{single_time * 1000:10.1f}ms" if single_time is not None else f"{'-':>12}"
+        print(f"{label:<22}{base_time * 1000:10.1f}ms{single_text}{batch_time * 1000:12.1f}ms{base_time / batch_time:9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,421 @@
+"""
+Load test: N simulated users run whole bot conversations against the webhook.
+
+Each user registers, adds a family member and an address, books a service
+and cancels the booking, one update at a time, as Telegram would deliver
+them to ``/telegram/webhook/``. A step is timed from the POST until the
+bot's reply for that chat reaches the stub Bot API server this script runs,
+so it covers handlers, API calls and (in queue mode) queueing. Inline
+keyboards the bot sends are read back from the stub, and users pick their
+next button from them (service, address, day, time, order to cancel).
+
+A step fails when the webhook doesn't answer 200, no reply arrives within
+``--timeout``, the reply is an error message or turns the request down
+(e.g. the slot was taken meanwhile), or the expected button is missing;
+the user's remaining steps are then skipped. Booking needs at least one
+category with a service open to a 30-year-old.
+
+The server must talk to the stub. Workers call the Bot API during startup,
+so start this script first; it waits until telegram/ready/ reports the
+server ready, e.g. in another shell:
+    TELEGRAM_API_BASE_URL=http://127.0.0.1:8081/bot API_BASE_URL=http://127.0.0.1:8000/api/ \\
+        uvicorn medical_bot.asgi:application --port 8000
+
+Run from the repository root:
+    python -m benchmarks.loadtest [--url http://127.0.0.1:8000] [--users 50] [--concurrency 10]
+    python -m benchmarks.loadtest --record trace.jsonl   # Also write every update sent
+    python -m benchmarks.loadtest --replay trace.jsonl   # Send a recorded trace again
+
+Choices are drawn from ``--seed``, so a run is repeatable; a replay sends
+exactly the recorded updates (only update ids are renumbered so the
+webhook's duplicate filter lets them through). Buttons carry database ids,
+so replay against the same database state the trace was recorded on,
+e.g. a fresh copy of it.
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from urllib.parse import parse_qsl
+
+import httpx
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Stub', 'username': 'stub_bot'}
+EMPTY = 'خالی'  # What the bot expects for "skip this field"
+ERROR_PREFIX = 'خطا'  # Replies starting with this report a failed API call
+# Replies containing these turn a request down: invalid input, slot already taken, too late to cancel
+REJECTION_MARKERS = ('نامعتبر', 'آزاد نیست', 'قابل لغو نیست')
+
+# (step, kind, value): 'text' sends a message, 'callback' presses the button
+# with that callback data, 'pick' presses a button whose data starts with
+# the value, as chosen by the user's random generator ('last' for the date,
+# so the booking is far enough ahead to still be cancellable)
+FLOWS = {
+    'register': [
+        ('register', 'callback', 'register'),
+        ('register_name', 'text', '{name}'),
+        ('register_phone', 'text', '{phone}'),
+        ('register_gender', 'callback', 'male'),
+        ('register_conditions', 'text', 'ندارد'),
+        ('register_email', 'text', '{email}'),
+    ],
+    'family': [
+        ('family', 'callback', 'add_family_member'),
+        ('family_name', 'text', 'عضو {name}'),
+        ('family_birth_date', 'text', '1369/05/15'),
+        ('family_gender', 'callback', 'fm_female'),
+        ('family_conditions', 'text', 'ندارد'),
+        ('family_email', 'text', EMPTY),
+        ('family_region', 'text', EMPTY),
+        ('family_relationship', 'callback', 'fm_spouse'),
+    ],
+    'address': [
+        ('address', 'callback', 'add_address'),
+        ('address_title', 'text', 'خانه'),
+        ('address_full', 'text', 'تهران، خیابان آزمایشی {user}'),
+        ('address_location', 'text', EMPTY),
+    ],
+    'order': [
+        ('order', 'callback', 'request_service'),
+        ('order_category', 'pick', 'cat_'),
+        ('order_service', 'pick', 'srv_'),
+        ('order_recipient', 'pick', 'recip_'),
+        ('order_address', 'pick', 'addr_'),
+        ('order_date', 'last', 'date_'),
+        ('order_time', 'pick', 'time_'),
+        ('order_conditions', 'text', 'ندارد'),
+        ('order_gender', 'callback', 'pref_any'),
+    ],
+    'cancel': [
+        ('cancel', 'callback', 'cancel_order'),
+        ('cancel_order', 'pick', 'cancel_'),
+    ],
+}
+
+
+class StubBotAPI:
+    """
+    Answers Bot API calls like Telegram would and hands each chat's replies
+    to the waiting simulated user.
+    """
+
+    def __init__(self, loop, port=0):
+        self.loop = loop
+        self.replies = defaultdict(asyncio.Queue)  # chat id -> replies not yet consumed
+        self.calls = defaultdict(int)
+        self._message_ids = count(1)
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                method = self.path.rsplit('/', 1)[-1]
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    params = json.loads(body or b'{}')
+                else:
+                    params = dict(parse_qsl(body.decode()))
+                payload = json.dumps({'ok': True, 'result': stub.answer(method, params)}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/bot'
+
+    def answer(self, method, params):
+        self.calls[method] += 1
+        if method == 'getMe':
+            return BOT_USER
+        if 'chat_id' not in params:  # answerCallbackQuery and the like
+            return True
+        chat_id = int(params['chat_id'])
+        markup = params.get('reply_markup') or {}
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        reply = {
+            'method': method,
+            'message_id': int(params.get('message_id') or next(self._message_ids)),
+            'text': params.get('text', ''),
+            'buttons': [
+                button['callback_data'] for row in markup.get('inline_keyboard', ()) for button in row
+                if 'callback_data' in button
+            ],
+        }
+        self.loop.call_soon_threadsafe(self._deliver, chat_id, reply)
+        return {
+            'message_id': reply['message_id'],
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': reply['text'] or '.',
+        }
+
+    def _deliver(self, chat_id, reply):
+        self.replies[chat_id].put_nowait(reply)
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+class Results:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # step -> seconds, successful steps only
+        self.errors = defaultdict(lambda: defaultdict(int))  # step -> reason -> count
+        self.completed = 0  # Users that finished every step
+
+    def ok(self, step, seconds):
+        self.latencies[step].append(seconds)
+
+    def error(self, step, reason):
+        self.errors[step][reason] += 1
+
+    def report(self, users, elapsed, steps):
+        total = sum(len(values) for values in self.latencies.values())
+        failed = sum(sum(reasons.values()) for reasons in self.errors.values())
+        print(f"{users} users, {self.completed} completed, {total + failed} steps in {elapsed:.2f}s "
+              f"-> {total / elapsed:.1f} steps/s, {self.completed / elapsed:.2f} conversations/s")
+        print(f"{'step':<22} {'ok':>6} {'errors':>6} {'err%':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for step in steps:
+            values = sorted(self.latencies.get(step, ()))
+            errors = sum(self.errors[step].values()) if step in self.errors else 0
+            if not values and not errors:
+                continue
+            rate = 100 * errors / (len(values) + errors)
+            p50, p95, p99 = (percentile(values, p) * 1000 for p in (50, 95, 99))
+            print(f"{step:<22} {len(values):>6} {errors:>6} {rate:>5.1f}% {p50:>8.1f} {p95:>8.1f} {p99:>8.1f}")
+        for step in steps:
+            for reason, number in self.errors.get(step, {}).items():
+                print(f"  {step}: {number} x {reason}")
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile; 0 for no values."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, -(-len(sorted_values) * p // 100) - 1)]
+
+
+class SimulatedUser:
+    def __init__(self, index, user_id, rng):
+        self.index = index
+        self.user_id = user_id
+        self.rng = rng
+        self.last_reply = None
+        self._message_ids = count(1)
+
+    @property
+    def sender(self):
+        return {'id': self.user_id, 'is_bot': False, 'first_name': f'Load {self.index}', 'language_code': 'fa'}
+
+    @property
+    def chat(self):
+        return {'id': self.user_id, 'type': 'private', 'first_name': f'Load {self.index}'}
+
+    def fill(self, template):
+        return template.format(
+            user=self.index, name=f'کاربر آزمایشی {self.index}', phone=f'09{self.user_id % 10 ** 9:09d}',
+            email=f'load{self.user_id}@example.com',
+        )
+
+    def message(self, text):
+        return {'message': {
+            'message_id': next(self._message_ids), 'date': int(time.time()),
+            'chat': self.chat, 'from': self.sender, 'text': text,
+        }}
+
+    def callback(self, data):
+        reply = self.last_reply or {'message_id': 0, 'text': '.'}
+        return {'callback_query': {
+            'id': f'{self.user_id}-{next(self._message_ids)}', 'from': self.sender, 'chat_instance': str(self.user_id),
+            'data': data,
+            'message': {
+                'message_id': reply['message_id'], 'date': int(time.time()), 'chat': self.chat, 'from': BOT_USER,
+                'text': reply['text'] or '.',
+            },
+        }}
+
+    def build(self, kind, value):
+        """The update for one scripted step; None when the button to press isn't on offer."""
+        if kind == 'text':
+            return self.message(self.fill(value))
+        if kind == 'callback':
+            return self.callback(value)
+        buttons = [data for data in (self.last_reply or {}).get('buttons', ()) if data.startswith(value)]
+        if not buttons:
+            return None
+        return self.callback(buttons[-1] if kind == 'last' else self.rng.choice(buttons))
+
+
+class LoadTest:
+    def __init__(self, url, stub, timeout, think_time, update_ids, recorder=None):
+        self.url = url.rstrip('/') + '/telegram/webhook/'
+        self.stub = stub
+        self.timeout = timeout
+        self.think_time = think_time
+        self.update_ids = update_ids
+        self.recorder = recorder
+        self.results = Results()
+
+    async def step(self, client, user_id, step, update):
+        """Delivers one update; returns the bot's reply, or None after recording the failure."""
+        replies = self.stub.replies[user_id]
+        while not replies.empty():  # Left over from an earlier step
+            replies.get_nowait()
+        update = {'update_id': next(self.update_ids), **update}
+        if self.recorder is not None:
+            self.recorder.write(json.dumps({'user_id': user_id, 'step': step, 'update': update}, ensure_ascii=False) + '\n')
+        started = time.perf_counter()
+        try:
+            response = await client.post(self.url, json=update)
+        except httpx.HTTPError as e:
+            self.results.error(step, type(e).__name__)
+            return None
+        if response.status_code != 200:
+            self.results.error(step, f'HTTP {response.status_code}')
+            return None
+        try:
+            reply = await asyncio.wait_for(replies.get(), self.timeout)
+        except asyncio.TimeoutError:
+            self.results.error(step, 'no reply')
+            return None
+        seconds = time.perf_counter() - started
+        if reply['text'].startswith(ERROR_PREFIX):
+            self.results.error(step, 'error reply')
+            return None
+        if any(marker in reply['text'] for marker in REJECTION_MARKERS):
+            self.results.error(step, 'rejected')
+            return None
+        self.results.ok(step, seconds)
+        return reply
+
+    async def run_user(self, client, user, script):
+        for step, kind, value in script:
+            update = user.build(kind, value)
+            if update is None:
+                self.results.error(step, f'no {value} button')
+                return
+            reply = await self.step(client, user.user_id, step, update)
+            if reply is None:
+                return
+            user.last_reply = reply
+            if self.think_time:
+                await asyncio.sleep(user.rng.uniform(0, 2 * self.think_time))
+        self.results.completed += 1
+
+    async def replay_user(self, client, user_id, steps):
+        for step, update in steps:
+            if await self.step(client, user_id, step, update) is None:
+                return
+        self.results.completed += 1
+
+    async def run(self, conversations, concurrency):
+        """Runs ``(coroutine function, *args)`` conversations, ``concurrency`` at a time."""
+        semaphore = asyncio.Semaphore(concurrency)
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+        async def limited(client, run, *args):
+            async with semaphore:
+                await run(client, *args)
+
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(limited(client, *conversation) for conversation in conversations))
+            return time.perf_counter() - started
+
+
+async def wait_until_ready(url, timeout):
+    """Polls the server's readiness probe until it answers 200 (or isn't there at all)."""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=1.0) as client:
+        while True:
+            try:
+                response = await client.get(url.rstrip('/') + '/telegram/ready/')
+                if response.status_code in (200, 404):
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise SystemExit(f"{url} was not ready after {timeout:.0f}s")
+            await asyncio.sleep(0.5)
+
+
+def load_trace(path):
+    """Recorded steps grouped by user, in the order they were sent."""
+    users = {}
+    with open(path, encoding='utf-8') as trace:
+        for line in trace:
+            if line.strip():
+                entry = json.loads(line)
+                update = {key: value for key, value in entry['update'].items() if key != 'update_id'}
+                users.setdefault(entry['user_id'], []).append((entry['step'], update))
+    return users
+
+
+async def main_async(args):
+    stub = StubBotAPI(asyncio.get_running_loop(), args.stub_port)
+    recorder = open(args.record, 'w', encoding='utf-8') if args.record else None
+    test = LoadTest(args.url, stub, args.timeout, args.think_time, count(args.update_id_base), recorder)
+    print(f"Stub Bot API listening on {stub.base_url} (set TELEGRAM_API_BASE_URL to this)")
+    try:
+        await wait_until_ready(args.url, args.ready_timeout)
+        if args.replay:
+            trace = load_trace(args.replay)
+            steps = list(dict.fromkeys(step for user_steps in trace.values() for step, _ in user_steps))
+            conversations = [(test.replay_user, user_id, user_steps) for user_id, user_steps in trace.items()]
+        else:
+            script = [entry for flow in args.flows for entry in FLOWS[flow]]
+            steps = [step for step, _, _ in script]
+            conversations = [
+                (test.run_user, SimulatedUser(index, args.user_id_base + index, random.Random(f'{args.seed}-{index}')), script)
+                for index in range(args.users)
+            ]
+        elapsed = await test.run(conversations, args.concurrency)
+    finally:
+        if recorder is not None:
+            recorder.close()
+        stub.shutdown()
+    test.results.report(len(conversations), elapsed, steps)
+    print("Bot API calls: " + ', '.join(f'{method}={number}' for method, number in sorted(stub.calls.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='server under test')
+    parser.add_argument('--users', type=int, default=50, help='simulated users')
+    parser.add_argument('--concurrency', type=int, default=10, help='users in a conversation at the same time')
+    parser.add_argument('--flows', nargs='+', choices=list(FLOWS), default=list(FLOWS), help='conversations each user runs, in order')
+    parser.add_argument('--think-time', type=float, default=0.0, help='mean seconds a user waits between steps')
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds to wait for each reply')
+    parser.add_argument('--ready-timeout', type=float, default=120.0, help='seconds to wait for the server to become ready')
+    parser.add_argument('--stub-port', type=int, default=8081, help='port of the stub Bot API server')
+    parser.add_argument('--seed', default='0', help='seed for the users\' choices')
+    parser.add_argument('--user-id-base', type=int, default=7_000_000_000, help='Telegram id of the first user; change it to register new users')
+    parser.add_argument('--update-id-base', type=int, default=int(time.time()) * 1000, help='first update id sent')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', metavar='TRACE', help='write the updates sent to this JSON lines file')
+    group.add_argument('--replay', metavar='TRACE', help='send the updates of a recorded trace instead of simulating users')
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
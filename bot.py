@@ -8,19 +8,26 @@ from telegram.ext import (
     filters,
     ContextTypes,
 )
-from decouple import config
-import requests
-import jdatetime
-from datetime import datetime
+from medical_bot.api_client import api_client
+from medical_bot.backends import build_backend
+from medical_bot.profile_cache import profile_cache
+from medical_bot.callback_router import CallbackRouter
+from medical_bot.metrics import observe_route, timed_handler
+from medical_bot.keyboards import PAGE_SIZE, cursor_keyboard, page_items, page_keyboard, show_page, slice_page
+from medical_bot import jalali
+from users.uploads import UPLOAD_CHUNK_SIZE
+from datetime import datetime, timedelta
+from django.conf import settings
 from django.utils import timezone
 import warnings
 from telegram.warnings import PTBUserWarning
 warnings.filterwarnings('ignore', category=PTBUserWarning)
 
-# Enable logging
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# HTTP calls to the API, or direct service-layer calls when co-located with Django (BOT_BACKEND)
+backend = build_backend()
+
 # States for registration conversation
 FULL_NAME, PHONE_NUMBER, GENDER, MEDICAL_CONDITIONS, EMAIL = range(5)
 
@@ -45,204 +52,346 @@ UPLOAD_DOCUMENT, DOCUMENT_DESCRIPTION = range(28, 30)
 # States for profile edit conversation
 EDIT_PROFILE, EDIT_BIRTH_DATE, EDIT_REGION = range(30, 33)
 
-# API Base URL
-API_BASE_URL = config('API_BASE_URL', default='https://your-render-app.onrender.com/api/')
+async def get_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Returns the caller's profile, fetching it from the API only on a cache miss."""
+    user_id = update.effective_user.id
+    user_data = profile_cache.get(user_id)
+    if user_data is None:
+        response = await backend.get_profile(update.effective_user.id)
+        if response.status_code != 200:  # 404: not registered
+            return None
+        user_data = response.json()
+        profile_cache.set(user_id, user_data)
+    return user_data
+
+async def bootstrap_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Loads the profile, cancellable orders and catalog version in one call.
+
+    Called once at the start of a conversation; the profile goes into the
+    profile cache, so later steps of the flow don't hit the API again.
+    """
+    response = await backend.bootstrap(update.effective_user.id)
+    if response.status_code != 200:
+        return None
+    session = response.json()
+    profile_cache.set(update.effective_user.id, session['profile'])
+    return session
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [
         [InlineKeyboardButton("ثبت‌نام", callback_data='register')],
         [InlineKeyboardButton("پروفایل", callback_data='profile')],
         [InlineKeyboardButton("درخواست خدمت", callback_data='request_service')],
+        [InlineKeyboardButton("سفارش‌های من", callback_data='my_orders')],
         [InlineKeyboardButton("لغو درخواست", callback_data='cancel_order')],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text('به ربات خدمات پزشکی خوش آمدید!', reply_markup=reply_markup)
 
+# Inline-keyboard callbacks, dispatched through the router by button()
+router = CallbackRouter()
+router.add_timing_hook(observe_route)  # Per-route latency metrics
+
 async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    return await router.dispatch(update, context)
+
+@router.route('register')
+async def register(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.message.reply_text('لطفاً نام و نام خانوادگی خود را وارد کنید:')
+    return FULL_NAME
+
+@router.route('profile')
+async def profile_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    keyboard = [
+        [InlineKeyboardButton("نمایش اطلاعات", callback_data='show_profile')],
+        [InlineKeyboardButton("ویرایش پروفایل", callback_data='edit_profile')],
+        [InlineKeyboardButton("افزودن عضو خانواده", callback_data='add_family_member')],
+        [InlineKeyboardButton("ویرایش/حذف عضو خانواده", callback_data='manage_family_member')],
+        [InlineKeyboardButton("افزودن آدرس", callback_data='add_address')],
+        [InlineKeyboardButton("ویرایش/حذف آدرس", callback_data='manage_address')],
+        [InlineKeyboardButton("آپلود مدارک پزشکی", callback_data='upload_document')],
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await update.callback_query.message.reply_text('گزینه مورد نظر را انتخاب کنید:', reply_markup=reply_markup)
+    return ConversationHandler.END
+
+@router.route('show_profile')
+async def show_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
+    user_data = await get_profile(update, context)
+    if user_data:
+        family_members = "\n".join([f"{fm['full_name']} ({fm['relationship']})" for fm in user_data['family_members']])
+        addresses = "\n".join([addr['title'] for addr in user_data['addresses']])
+        documents = "\n".join([f"{fm['full_name']}: {doc['description']}" for fm in user_data['family_members'] for doc in fm.get('documents', [])])
+        birth_date = user_data['birth_date_jalali'] or 'وارد نشده'  # Formatted by the API
+        region = user_data['region'] or 'وارد نشده'
+        age = user_data['age'] or 'محاسبه نشده'
+        await query.message.reply_text(
+            f"نام: {user_data['full_name']}\n"
+            f"تلفن: {user_data['phone_number']}\n"
+            f"تاریخ تولد: {birth_date}\n"
+            f"سن: {age}\n"
+            f"جنسیت: {user_data['gender']}\n"
+            f"بیماری‌ها: {user_data['medical_conditions']}\n"
+            f"ایمیل: {user_data['email']}\n"
+            f"منطقه: {region}\n"
+            f"اعضای خانواده:\n{family_members or 'هیچ عضوی ثبت نشده'}\n"
+            f"آدرس‌ها:\n{addresses or 'هیچ آدرسی ثبت نشده'}\n"
+            f"مدارک پزشکی:\n{documents or 'هیچ مدرکی ثبت نشده'}"
+        )
+    else:
+        await query.message.reply_text('لطفاً ابتدا ثبت‌نام کنید.')
+    return ConversationHandler.END
 
-    if query.data == 'register':
-        await query.message.reply_text('لطفاً نام و نام خانوادگی خود را وارد کنید:')
-        return FULL_NAME
-    elif query.data == 'profile':
+@router.route('edit_profile')
+async def edit_profile_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    keyboard = [
+        [InlineKeyboardButton("ویرایش تاریخ تولد", callback_data='edit_birth_date')],
+        [InlineKeyboardButton("ویرایش منطقه", callback_data='edit_region')],
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await update.callback_query.message.reply_text('کدام اطلاعات را می‌خواهید ویرایش کنید؟', reply_markup=reply_markup)
+    return EDIT_PROFILE
+
+@router.route('edit_birth_date')
+async def ask_birth_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.message.reply_text('لطفاً تاریخ تولد خود را به فرمت جلالی وارد کنید (مثال: 1369/05/15):')
+    return EDIT_BIRTH_DATE
+
+@router.route('edit_region')
+async def ask_region(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.message.reply_text('لطفاً منطقه محل زندگی خود را وارد کنید (مثال: تهران، سعادت‌آباد) یا "خالی" برای حذف:')
+    return EDIT_REGION
+
+@router.route('add_family_member')
+async def add_family_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.message.reply_text('لطفاً نام و نام خانوادگی عضو خانواده را وارد کنید:')
+    return FM_FULL_NAME
+
+@router.route('manage_family_member')
+async def manage_family_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    return await show_family_members(update, context, 0)
+
+@router.route('page_fm_<int:offset>')
+async def family_members_page(update: Update, context: ContextTypes.DEFAULT_TYPE, offset):
+    await show_family_members(update, context, offset, edit=True)
+
+async def show_family_members(update: Update, context: ContextTypes.DEFAULT_TYPE, offset, edit=False):
+    query = update.callback_query
+    telegram_id = update.effective_user.id
+    response = await backend.list_family_members(telegram_id, limit=PAGE_SIZE, offset=offset)
+    if response.status_code == 200 and response.json()['count']:
+        family_members, total = page_items(response.json())
         keyboard = [
-            [InlineKeyboardButton("نمایش اطلاعات", callback_data='show_profile')],
-            [InlineKeyboardButton("ویرایش پروفایل", callback_data='edit_profile')],
-            [InlineKeyboardButton("افزودن عضو خانواده", callback_data='add_family_member')],
-            [InlineKeyboardButton("ویرایش/حذف عضو خانواده", callback_data='manage_family_member')],
-            [InlineKeyboardButton("افزودن آدرس", callback_data='add_address')],
-            [InlineKeyboardButton("ویرایش/حذف آدرس", callback_data='manage_address')],
-            [InlineKeyboardButton("آپلود مدارک پزشکی", callback_data='upload_document')],
+            [InlineKeyboardButton(f"{fm['full_name']} (ویرایش)", callback_data=f'edit_fm_{fm["id"]}'),
+             InlineKeyboardButton(f"{fm['full_name']} (حذف)", callback_data=f'delete_fm_{fm["id"]}')]
+            for fm in family_members
         ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text('گزینه مورد نظر را انتخاب کنید:', reply_markup=reply_markup)
-    elif query.data == 'show_profile':
-        phone_number = context.user_data.get('phone_number')
-        if not phone_number:
-            await query.message.reply_text('لطفاً ابتدا ثبت‌نام کنید.')
-            return ConversationHandler.END
-        response = requests.get(f'{API_BASE_URL}users/profile/', params={'phone_number': phone_number})
-        if response.status_code == 200:
-            user_data = response.json()[0]
-            family_members = "\n".join([f"{fm['full_name']} ({fm['relationship']})" for fm in user_data['family_members']])
-            addresses = "\n".join([addr['title'] for addr in user_data['addresses']])
-            documents = "\n".join([f"{fm['full_name']}: {doc['description']}" for fm in user_data['family_members'] for doc in fm.get('documents', [])])
-            birth_date = user_data['birth_date']
-            if birth_date:
-                birth_date = jdatetime.date.fromgregorian(date=datetime.strptime(birth_date, '%Y-%m-%d')).strftime('%Y/%m/%d')
-            else:
-                birth_date = 'وارد نشده'
-            region = user_data['region'] or 'وارد نشده'
-            age = user_data['age'] or 'محاسبه نشده'
-            await query.message.reply_text(
-                f"نام: {user_data['full_name']}\n"
-                f"تلفن: {user_data['phone_number']}\n"
-                f"تاریخ تولد: {birth_date}\n"
-                f"سن: {age}\n"
-                f"جنسیت: {user_data['gender']}\n"
-                f"بیماری‌ها: {user_data['medical_conditions']}\n"
-                f"ایمیل: {user_data['email']}\n"
-                f"منطقه: {region}\n"
-                f"اعضای خانواده:\n{family_members or 'هیچ عضوی ثبت نشده'}\n"
-                f"آدرس‌ها:\n{addresses or 'هیچ آدرسی ثبت نشده'}\n"
-                f"مدارک پزشکی:\n{documents or 'هیچ مدرکی ثبت نشده'}"
-            )
-        else:
-            await query.message.reply_text('لطفاً ابتدا ثبت‌نام کنید.')
-    elif query.data == 'edit_profile':
+        reply_markup = page_keyboard(keyboard, 'page_fm', offset, total)
+        await show_page(query, 'عضو خانواده را برای ویرایش یا حذف انتخاب کنید:', reply_markup, edit)
+        return FM_FULL_NAME
+    await query.message.reply_text('هیچ عضوی یافت نشد.')
+    return ConversationHandler.END
+
+@router.route('edit_fm_<int:fm_id>')
+async def edit_family_member(update: Update, context: ContextTypes.DEFAULT_TYPE, fm_id):
+    context.user_data['fm_id'] = fm_id
+    await update.callback_query.message.reply_text('لطفاً نام و نام خانوادگی جدید را وارد کنید:')
+    return FM_FULL_NAME
+
+@router.route('delete_fm_<int:fm_id>')
+async def delete_family_member(update: Update, context: ContextTypes.DEFAULT_TYPE, fm_id):
+    query = update.callback_query
+    telegram_id = update.effective_user.id
+    response = await backend.delete_family_member(telegram_id, fm_id)
+    profile_cache.invalidate(update.effective_user.id)
+    if response.status_code == 204:
+        await query.message.reply_text('عضو خانواده با موفقیت حذف شد.')
+    else:
+        await query.message.reply_text('خطا در حذف عضو خانواده.')
+    return ConversationHandler.END
+
+@router.route('add_address')
+async def add_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.message.reply_text('لطفاً عنوان آدرس (مثل "خانه" یا "محل کار") را وارد کنید:')
+    return ADDR_TITLE
+
+@router.route('manage_address')
+async def manage_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    return await show_addresses(update, context, 0)
+
+@router.route('page_addr_<int:offset>')
+async def addresses_page(update: Update, context: ContextTypes.DEFAULT_TYPE, offset):
+    await show_addresses(update, context, offset, edit=True)
+
+async def show_addresses(update: Update, context: ContextTypes.DEFAULT_TYPE, offset, edit=False):
+    query = update.callback_query
+    telegram_id = update.effective_user.id
+    response = await backend.list_addresses(telegram_id, limit=PAGE_SIZE, offset=offset)
+    if response.status_code == 200 and response.json()['count']:
+        addresses, total = page_items(response.json())
         keyboard = [
-            [InlineKeyboardButton("ویرایش تاریخ تولد", callback_data='edit_birth_date')],
-            [InlineKeyboardButton("ویرایش منطقه", callback_data='edit_region')],
+            [InlineKeyboardButton(f"{addr['title']} (ویرایش)", callback_data=f'edit_addr_{addr["id"]}'),
+             InlineKeyboardButton(f"{addr['title']} (حذف)", callback_data=f'delete_addr_{addr["id"]}')]
+            for addr in addresses
         ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text('کدام اطلاعات را می‌خواهید ویرایش کنید؟', reply_markup=reply_markup)
-        return EDIT_PROFILE
-    elif query.data == 'edit_birth_date':
-        await query.message.reply_text('لطفاً تاریخ تولد خود را به فرمت جلالی وارد کنید (مثال: 1369/05/15):')
-        return EDIT_BIRTH_DATE
-    elif query.data == 'edit_region':
-        await query.message.reply_text('لطفاً منطقه محل زندگی خود را وارد کنید (مثال: تهران، سعادت‌آباد) یا "خالی" برای حذف:')
-        return EDIT_REGION
-    elif query.data == 'add_family_member':
-        await query.message.reply_text('لطفاً نام و نام خانوادگی عضو خانواده را وارد کنید:')
-        return FM_FULL_NAME
-    elif query.data == 'manage_family_member':
-        phone_number = context.user_data.get('phone_number')
-        response = requests.get(f'{API_BASE_URL}users/family-members/', params={'phone_number': phone_number})
-        if response.status_code == 200:
-            family_members = response.json()
-            keyboard = [
-                [InlineKeyboardButton(f"{fm['full_name']} (ویرایش)", callback_data=f'edit_fm_{fm["id"]}'),
-                 InlineKeyboardButton(f"{fm['full_name']} (حذف)", callback_data=f'delete_fm_{fm["id"]}')]
-                for fm in family_members
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.message.reply_text('عضو خانواده را برای ویرایش یا حذف انتخاب کنید:', reply_markup=reply_markup)
-            return FM_FULL_NAME
-        await query.message.reply_text('هیچ عضوی یافت نشد.')
-        return ConversationHandler.END
-    elif query.data.startswith('edit_fm_'):
-        fm_id = query.data.split('_')[2]
-        context.user_data['fm_id'] = fm_id
-        await query.message.reply_text('لطفاً نام و نام خانوادگی جدید را وارد کنید:')
-        return FM_FULL_NAME
-    elif query.data.startswith('delete_fm_'):
-        fm_id = query.data.split('_')[2]
-        phone_number = context.user_data.get('phone_number')
-        response = requests.delete(f'{API_BASE_URL}users/family-members/{fm_id}/', params={'phone_number': phone_number})
-        if response.status_code == 204:
-            await query.message.reply_text('عضو خانواده با موفقیت حذف شد.')
-        else:
-            await query.message.reply_text('خطا در حذف عضو خانواده.')
-        return ConversationHandler.END
-    elif query.data == 'add_address':
-        await query.message.reply_text('لطفاً عنوان آدرس (مثل "خانه" یا "محل کار") را وارد کنید:')
-        return ADDR_TITLE
-    elif query.data == 'manage_address':
-        phone_number = context.user_data.get('phone_number')
-        response = requests.get(f'{API_BASE_URL}users/addresses/', params={'phone_number': phone_number})
-        if response.status_code == 200:
-            addresses = response.json()
-            keyboard = [
-                [InlineKeyboardButton(f"{addr['title']} (ویرایش)", callback_data=f'edit_addr_{addr["id"]}'),
-                 InlineKeyboardButton(f"{addr['title']} (حذف)", callback_data=f'delete_addr_{addr["id"]}')]
-                for addr in addresses
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.message.reply_text('آدرس مورد نظر برای ویرایش یا حذف را انتخاب کنید:', reply_markup=reply_markup)
-            return EDIT_ADDRESS
-        await query.message.reply_text('هیچ آدرسی یافت نشد.')
-        return ConversationHandler.END
-    elif query.data.startswith('edit_addr_'):
-        addr_id = query.data.split('_')[2]
-        context.user_data['addr_id'] = addr_id
-        await query.message.reply_text('لطفاً عنوان جدید آدرس را وارد کنید:')
-        return EDIT_ADDR_TITLE
-    elif query.data.startswith('delete_addr_'):
-        addr_id = query.data.split('_')[2]
-        phone_number = context.user_data.get('phone_number')
-        response = requests.delete(f'{API_BASE_URL}users/addresses/{addr_id}/', params={'phone_number': phone_number})
-        if response.status_code == 204:
-            await query.message.reply_text('آدرس با موفقیت حذف شد.')
-        else:
-            await query.message.reply_text('خطا در حذف آدرس.')
-        return ConversationHandler.END
-    elif query.data == 'upload_document':
-        phone_number = context.user_data.get('phone_number')
-        response = requests.get(f'{API_BASE_URL}users/family-members/', params={'phone_number': phone_number})
-        if response.status_code == 200:
-            family_members = response.json()
-            keyboard = [[InlineKeyboardButton(fm['full_name'], callback_data=f'upload_doc_{fm["id"]}')] for fm in family_members]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.message.reply_text('لطفاً عضو خانواده‌ای که می‌خواهید مدرک برای او آپلود کنید را انتخاب کنید:', reply_markup=reply_markup)
-            return UPLOAD_DOCUMENT
-        await query.message.reply_text('لطفاً ابتدا عضو خانواده اضافه کنید.')
-        return ConversationHandler.END
-    elif query.data.startswith('upload_doc_'):
-        fm_id = query.data.split('_')[2]
-        context.user_data['fm_id'] = fm_id
-        await query.message.reply_text('لطفاً فایل مدرک پزشکی (PDF، JPEG، یا PNG، حداکثر 5MB) را آپلود کنید:')
+        reply_markup = page_keyboard(keyboard, 'page_addr', offset, total)
+        await show_page(query, 'آدرس مورد نظر برای ویرایش یا حذف را انتخاب کنید:', reply_markup, edit)
+        return EDIT_ADDRESS
+    await query.message.reply_text('هیچ آدرسی یافت نشد.')
+    return ConversationHandler.END
+
+@router.route('edit_addr_<int:addr_id>')
+async def edit_address(update: Update, context: ContextTypes.DEFAULT_TYPE, addr_id):
+    context.user_data['addr_id'] = addr_id
+    await update.callback_query.message.reply_text('لطفاً عنوان جدید آدرس را وارد کنید:')
+    return EDIT_ADDR_TITLE
+
+@router.route('delete_addr_<int:addr_id>')
+async def delete_address(update: Update, context: ContextTypes.DEFAULT_TYPE, addr_id):
+    query = update.callback_query
+    telegram_id = update.effective_user.id
+    response = await backend.delete_address(telegram_id, addr_id)
+    profile_cache.invalidate(update.effective_user.id)
+    if response.status_code == 204:
+        await query.message.reply_text('آدرس با موفقیت حذف شد.')
+    else:
+        await query.message.reply_text('خطا در حذف آدرس.')
+    return ConversationHandler.END
+
+@router.route('upload_document')
+async def choose_document_owner(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    return await show_document_owners(update, context, 0)
+
+@router.route('page_doc_<int:offset>')
+async def document_owners_page(update: Update, context: ContextTypes.DEFAULT_TYPE, offset):
+    await show_document_owners(update, context, offset, edit=True)
+
+async def show_document_owners(update: Update, context: ContextTypes.DEFAULT_TYPE, offset, edit=False):
+    query = update.callback_query
+    telegram_id = update.effective_user.id
+    response = await backend.list_family_members(telegram_id, limit=PAGE_SIZE, offset=offset)
+    if response.status_code == 200 and response.json()['count']:
+        family_members, total = page_items(response.json())
+        keyboard = [[InlineKeyboardButton(fm['full_name'], callback_data=f'upload_doc_{fm["id"]}')] for fm in family_members]
+        reply_markup = page_keyboard(keyboard, 'page_doc', offset, total)
+        await show_page(query, 'لطفاً عضو خانواده‌ای که می‌خواهید مدرک برای او آپلود کنید را انتخاب کنید:', reply_markup, edit)
         return UPLOAD_DOCUMENT
-    elif query.data == 'request_service':
-        response = requests.get(f'{API_BASE_URL}services/categories/')
-        if response.status_code == 200:
-            categories = response.json()
-            keyboard = [[InlineKeyboardButton(cat['name'], callback_data=f'cat_{cat["id"]}')] for cat in categories]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.message.reply_text('لطفاً یک دسته‌بندی انتخاب کنید:', reply_markup=reply_markup)
-            return CATEGORY
-    elif query.data == 'cancel_order':
-        phone_number = context.user_data.get('phone_number')
-        response = requests.get(f'{API_BASE_URL}orders/orders/', params={'phone_number': phone_number})
-        if response.status_code == 200:
-            orders = response.json()
-            now = jdatetime.datetime.now()
-            keyboard = [
-                [InlineKeyboardButton(
-                    f"{order['service']['name']} - {order['scheduled_time']}",
-                    callback_data=f'cancel_{order["id"]}'
-                )] for order in orders if (
-                    jdatetime.datetime.strptime(order['scheduled_time'], '%Y-%m-%d %H:%M:%S') > now + jdatetime.timedelta(hours=24)
-                    and order['status'] != 'canceled'
-                )
-            ]
-            if keyboard:
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.message.reply_text('درخواست مورد نظر برای لغو را انتخاب کنید:', reply_markup=reply_markup)
-                return CANCEL_ORDER
-            await query.message.reply_text('هیچ درخواست قابل لغوی یافت نشد.')
+    await query.message.reply_text('لطفاً ابتدا عضو خانواده اضافه کنید.')
+    return ConversationHandler.END
+
+def max_upload_megabytes():
+    """DOCUMENT_MAX_UPLOAD_SIZE as shown to users."""
+    return settings.DOCUMENT_MAX_UPLOAD_SIZE // (1024 * 1024)
+
+@router.route('upload_doc_<int:fm_id>')
+async def ask_document(update: Update, context: ContextTypes.DEFAULT_TYPE, fm_id):
+    context.user_data['fm_id'] = fm_id
+    await update.callback_query.message.reply_text(
+        f'لطفاً فایل مدرک پزشکی (PDF، JPEG، یا PNG، حداکثر {max_upload_megabytes()}MB) را آپلود کنید:'
+    )
+    return UPLOAD_DOCUMENT
+
+@router.route('request_service')
+async def request_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    session = await bootstrap_session(update, context)
+    context.user_data['catalog_version'] = session['catalog_version'] if session else None
+    return await show_categories(update, context, 0)
+
+@router.route('page_cat_<int:offset>')
+async def categories_page(update: Update, context: ContextTypes.DEFAULT_TYPE, offset):
+    await show_categories(update, context, offset, edit=True)
+
+async def show_categories(update: Update, context: ContextTypes.DEFAULT_TYPE, offset, edit=False):
+    # The catalog is cached as a whole; only the requested page is rendered
+    catalog = await backend.get_catalog(context.user_data.get('catalog_version'))
+    if catalog:
+        categories, total = slice_page(catalog['categories'], offset)
+        keyboard = [[InlineKeyboardButton(cat['name'], callback_data=f'cat_{cat["id"]}')] for cat in categories]
+        reply_markup = page_keyboard(keyboard, 'page_cat', offset, total)
+        await show_page(update.callback_query, 'لطفاً یک دسته‌بندی انتخاب کنید:', reply_markup, edit)
+        return CATEGORY
+    return ConversationHandler.END
+
+@router.route('cancel_order')
+async def choose_order_to_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    return await show_cancellable_orders(update, context, 0)
+
+@router.route('page_cancel_<int:offset>')
+async def cancellable_orders_page(update: Update, context: ContextTypes.DEFAULT_TYPE, offset):
+    await show_cancellable_orders(update, context, offset, edit=True)
+
+async def show_cancellable_orders(update: Update, context: ContextTypes.DEFAULT_TYPE, offset, edit=False):
+    query = update.callback_query
+    telegram_id = update.effective_user.id
+    # The API applies the cancellation window and returns only what the buttons need
+    response = await backend.list_cancellable_orders(telegram_id, limit=PAGE_SIZE, offset=offset)
+    if response.status_code == 200:
+        orders, total = page_items(response.json())
+        if total:
+            keyboard = []
+            for order in orders:
+                scheduled_time = timezone.localtime(datetime.fromisoformat(order['scheduled_time']))
+                label = f"{order['service_name']} - {jalali.format_datetime(scheduled_time)}"
+                keyboard.append([InlineKeyboardButton(label, callback_data=f'cancel_{order["id"]}')])
+            reply_markup = page_keyboard(keyboard, 'page_cancel', offset, total)
+            await show_page(query, 'درخواست مورد نظر برای لغو را انتخاب کنید:', reply_markup, edit)
+            return CANCEL_ORDER
+        await query.message.reply_text('هیچ درخواست قابل لغوی یافت نشد.')
+    return ConversationHandler.END
+
+ORDER_STATUS_LABELS = {'pending': 'در انتظار', 'confirmed': 'تأیید شده', 'completed': 'تکمیل شده', 'canceled': 'لغو شده'}
+
+@router.route('my_orders')
+async def my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    return await show_orders(update, context)
+
+@router.route('page_orders_<str:cursor>')
+async def orders_page(update: Update, context: ContextTypes.DEFAULT_TYPE, cursor):
+    await show_orders(update, context, cursor, edit=True)
+
+async def show_orders(update: Update, context: ContextTypes.DEFAULT_TYPE, cursor=None, edit=False):
+    """Lists the user's orders by date, one page at a time; the page buttons carry the API's cursors."""
+    query = update.callback_query
+    response = await backend.list_orders(update.effective_user.id, limit=PAGE_SIZE, cursor=cursor)
+    if response.status_code != 200:
+        await query.message.reply_text('خطا در دریافت سفارش‌ها. لطفاً دوباره تلاش کنید.')
         return ConversationHandler.END
-    elif query.data == 'contact_support':
-        await query.message.reply_text('لطفاً با پشتیبانی در شماره 123456789 تماس بگیرید یا پیام دهید.')
-    elif query.data.startswith('confirm_'):
-        order_id = query.data.split('_')[1]
-        phone_number = context.user_data.get('phone_number')
-        response = requests.patch(f'{API_BASE_URL}orders/orders/{order_id}/', json={'status': 'confirmed'}, params={'phone_number': phone_number})
-        if response.status_code == 200:
-            await query.message.reply_text('حضور شما تأیید شد.')
-        else:
-            await query.message.reply_text('خطا در تأیید حضور.')
+    page = response.json()
+    if not page['results']:
+        await query.message.reply_text('هیچ سفارشی ثبت نشده است.')
+        return ConversationHandler.END
+    lines = []
+    for order in page['results']:
+        scheduled_time = timezone.localtime(datetime.fromisoformat(order['scheduled_time']))
+        recipient = f" ({order['recipient']['full_name']})" if order['recipient'] else ''
+        status = ORDER_STATUS_LABELS.get(order['status'], order['status'])
+        lines.append(f"{order['service']['name']}{recipient} - {jalali.format_datetime(scheduled_time)} - {status}")
+    text = 'سفارش‌های شما:\n' + '\n'.join(lines)
+    reply_markup = cursor_keyboard([], 'page_orders', page['previous_cursor'], page['next_cursor'])
+    if edit:
+        await query.edit_message_text(text, reply_markup=reply_markup)
+    else:
+        await query.message.reply_text(text, reply_markup=reply_markup)
+    return ConversationHandler.END
+
+@router.route('contact_support')
+async def contact_support(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.message.reply_text('لطفاً با پشتیبانی در شماره 123456789 تماس بگیرید یا پیام دهید.')
+    return ConversationHandler.END
+
+@router.route('confirm_<int:order_id>')
+async def confirm_order(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id):
+    query = update.callback_query
+    telegram_id = update.effective_user.id
+    response = await backend.confirm_order(telegram_id, order_id)
+    if response.status_code == 200:
+        await query.message.reply_text('حضور شما تأیید شد.')
+    elif response.status_code == 400:  # Canceled, completed or already past
+        await query.message.reply_text(response.json()['detail'])
+    else:
+        await query.message.reply_text('خطا در تأیید حضور.')
     return ConversationHandler.END
 
 async def full_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -260,8 +409,16 @@ async def full_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return PHONE_NUMBER
 
 async def phone_number(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.message.contact:
-        phone_number = update.message.contact.phone_number
+    contact = update.message.contact
+    if contact and contact.user_id == update.effective_user.id:
+        # Telegram vouches for the user's own number: reconnect an account registered before
+        response = await backend.link_account(update.effective_user.id, contact.phone_number)
+        if response.status_code == 200:
+            profile_cache.set(update.effective_user.id, response.json())
+            await update.message.reply_text('حساب شما قبلاً ثبت شده بود و به این حساب تلگرام متصل شد.')
+            return ConversationHandler.END
+    if contact:
+        phone_number = contact.phone_number
     else:
         phone_number = update.message.text
     if not phone_number or len(phone_number) < 10:
@@ -294,20 +451,22 @@ async def medical_conditions(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 async def email(update: Update, context: ContextTypes.DEFAULT_TYPE):
     email = update.message.text
-    if email and '@' not in email:
+    if email and email != 'خالی' and '@' not in email:
         await update.message.reply_text('ایمیل نامعتبر است. لطفاً دوباره وارد کنید یا برای خالی گذاشتن، "خالی" بنویسید:')
         return EMAIL
     context.user_data['email'] = email if email != 'خالی' else ''
     # Register user via API
     data = {
         'phone_number': context.user_data['phone_number'],
+        'telegram_id': update.effective_user.id,
         'full_name': context.user_data['full_name'],
         'gender': context.user_data['gender'],
         'medical_conditions': context.user_data['medical_conditions'],
         'email': context.user_data['email'],
     }
-    response = requests.post(f'{API_BASE_URL}users/profile/register/', json=data)
-    if response.status_code == 200:
+    response = await backend.register(data)
+    profile_cache.invalidate(update.effective_user.id)
+    if response.status_code in (200, 201):
         await update.message.reply_text('ثبت‌نام با موفقیت انجام شد!')
     else:
         await update.message.reply_text(f'خطا در ثبت‌نام: {response.json().get("error", "لطفاً دوباره تلاش کنید")}')
@@ -316,22 +475,18 @@ async def email(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def edit_birth_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     birth_date_text = update.message.text
     try:
-        year, month, day = map(int, birth_date_text.split('/'))
-        jalali_date = jdatetime.date(year, month, day)
-        if jalali_date > jdatetime.date.today():
+        birth_date = jalali.parse_date(birth_date_text)  # Gregorian for storage
+        today = timezone.localdate()
+        if birth_date > today:
             await update.message.reply_text('تاریخ تولد نمی‌تواند در آینده باشد. دوباره وارد کنید:')
             return EDIT_BIRTH_DATE
-        if jdatetime.date.today().year - year < 18:
+        if jalali.to_jalali(today)[0] - jalali.to_jalali(birth_date)[0] < 18:
             await update.message.reply_text('کاربر باید حداقل 18 سال سن داشته باشد. دوباره وارد کنید:')
             return EDIT_BIRTH_DATE
-        birth_date = jalali_date.togregorian()  # Convert to Gregorian for storage
         context.user_data['birth_date'] = birth_date
-        phone_number = context.user_data.get('phone_number')
-        response = requests.put(
-            f'{API_BASE_URL}users/profile/',
-            json={'birth_date': birth_date.strftime('%Y-%m-%d')},
-            params={'phone_number': phone_number}
-        )
+        telegram_id = update.effective_user.id
+        response = await backend.update_profile(telegram_id, {'birth_date': birth_date.strftime('%Y-%m-%d')})
+        profile_cache.invalidate(update.effective_user.id)  # age is derived server-side
         if response.status_code == 200:
             await update.message.reply_text('تاریخ تولد با موفقیت به‌روزرسانی شد!')
         else:
@@ -343,9 +498,10 @@ async def edit_birth_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def edit_region(update: Update, context: ContextTypes.DEFAULT_TYPE):
     region = update.message.text if update.message.text != 'خالی' else ''
-    phone_number = context.user_data.get('phone_number')
-    response = requests.put(f'{API_BASE_URL}users/profile/', json={'region': region}, params={'phone_number': phone_number})
+    telegram_id = update.effective_user.id
+    response = await backend.update_profile(telegram_id, {'region': region})
     if response.status_code == 200:
+        profile_cache.patch(update.effective_user.id, region=region)
         await update.message.reply_text('منطقه با موفقیت به‌روزرسانی شد!')
     else:
         await update.message.reply_text('خطا در به‌روزرسانی منطقه.')
@@ -366,12 +522,10 @@ async def fm_birth_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data['fm_birth_date'] = None
     else:
         try:
-            year, month, day = map(int, birth_date_text.split('/'))
-            jalali_date = jdatetime.date(year, month, day)
-            if jalali_date > jdatetime.date.today():
+            birth_date = jalali.parse_date(birth_date_text)  # Gregorian for storage
+            if birth_date > timezone.localdate():
                 await update.message.reply_text('تاریخ تولد نمی‌تواند در آینده باشد. دوباره وارد کنید:')
                 return FM_BIRTH_DATE
-            birth_date = jalali_date.togregorian()  # Convert to Gregorian for storage
             context.user_data['fm_birth_date'] = birth_date
         except ValueError:
             await update.message.reply_text('فرمت تاریخ نامعتبر است. لطفاً به فرمت 1369/05/15 وارد کنید یا "خالی" بنویسید:')
@@ -397,7 +551,7 @@ async def fm_medical_conditions(update: Update, context: ContextTypes.DEFAULT_TY
 
 async def fm_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
     email = update.message.text
-    if email and '@' not in email:
+    if email and email != 'خالی' and '@' not in email:
         await update.message.reply_text('ایمیل نامعتبر است. لطفاً دوباره وارد کنید یا برای خالی گذاشتن، "خالی" بنویسید:')
         return FM_EMAIL
     context.user_data['fm_email'] = email if email != 'خالی' else ''
@@ -422,7 +576,7 @@ async def fm_region(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def fm_relationship(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     relationship = query.data.split('_')[1]
-    phone_number = context.user_data.get('phone_number')
+    telegram_id = update.effective_user.id
 
     # Register or update family member via API
     data = {
@@ -434,11 +588,8 @@ async def fm_relationship(update: Update, context: ContextTypes.DEFAULT_TYPE):
         'region': context.user_data['fm_region'],
         'relationship': relationship,
     }
-    if 'fm_id' in context.user_data:
-        response = requests.put(f'{API_BASE_URL}users/family-members/{context.user_data["fm_id"]}/', json=data, params={'phone_number': phone_number})
-        context.user_data.pop('fm_id')
-    else:
-        response = requests.post(f'{API_BASE_URL}users/family-members/', json=data, params={'phone_number': phone_number})
+    response = await backend.save_family_member(telegram_id, data, context.user_data.pop('fm_id', None))
+    profile_cache.invalidate(update.effective_user.id)
     if response.status_code in (200, 201):
         await query.message.reply_text('عضو خانواده با موفقیت اضافه/ویرایش شد!')
     else:
@@ -460,7 +611,7 @@ async def addr_full_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ADDR_LOCATION
 
 async def addr_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    phone_number = context.user_data.get('phone_number')
+    telegram_id = update.effective_user.id
     if update.message.text == 'خالی':
         latitude, longitude = None, None
     else:
@@ -477,7 +628,8 @@ async def addr_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
         'latitude': latitude,
         'longitude': longitude,
     }
-    response = requests.post(f'{API_BASE_URL}users/addresses/', json=data, params={'phone_number': phone_number})
+    response = await backend.save_address(telegram_id, data)
+    profile_cache.invalidate(update.effective_user.id)
     if response.status_code == 201:
         await update.message.reply_text('آدرس با موفقیت اضافه شد!')
     else:
@@ -499,7 +651,7 @@ async def edit_addr_full_address(update: Update, context: ContextTypes.DEFAULT_T
     return EDIT_ADDR_LOCATION
 
 async def edit_addr_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    phone_number = context.user_data.get('phone_number')
+    telegram_id = update.effective_user.id
     if update.message.text == 'خالی':
         latitude, longitude = None, None
     else:
@@ -516,7 +668,8 @@ async def edit_addr_location(update: Update, context: ContextTypes.DEFAULT_TYPE)
         'latitude': latitude,
         'longitude': longitude,
     }
-    response = requests.put(f'{API_BASE_URL}users/addresses/{context.user_data["addr_id"]}/', json=data, params={'phone_number': phone_number})
+    response = await backend.save_address(telegram_id, data, context.user_data['addr_id'])
+    profile_cache.invalidate(update.effective_user.id)
     if response.status_code == 200:
         await update.message.reply_text('آدرس با موفقیت ویرایش شد!')
     else:
@@ -529,10 +682,10 @@ async def upload_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text('لطفاً یک فایل معتبر (PDF، JPEG، یا PNG) آپلود کنید:')
         return UPLOAD_DOCUMENT
     document = update.message.document
-    if document.file_size > 5 * 1024 * 1024:  # 5MB limit
-        await update.message.reply_text('فایل باید کمتر از 5MB باشد. لطفاً فایل دیگری آپلود کنید:')
+    if document.file_size > settings.DOCUMENT_MAX_UPLOAD_SIZE:  # The API would refuse it after the download
+        await update.message.reply_text(f'فایل باید کمتر از {max_upload_megabytes()}MB باشد. لطفاً فایل دیگری آپلود کنید:')
         return UPLOAD_DOCUMENT
-    if document.mime_type not in ['application/pdf', 'image/jpeg', 'image/png']:
+    if document.mime_type not in settings.DOCUMENT_ALLOWED_TYPES:
         await update.message.reply_text('فقط فایل‌های PDF، JPEG، یا PNG مجاز هستند. لطفاً فایل دیگری آپلود کنید:')
         return UPLOAD_DOCUMENT
     context.user_data['document'] = document
@@ -541,20 +694,23 @@ async def upload_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def document_description(update: Update, context: ContextTypes.DEFAULT_TYPE):
     description = update.message.text
-    phone_number = context.user_data.get('phone_number')
     document = context.user_data['document']
-    file = await document.get_file()
-    file_data = await file.download_as_bytearray()
-    
-    # Upload document via API
-    files = {'file': (document.file_name, file_data, document.mime_type)}
-    data = {
-        'description': description,
-        'family_member_id': context.user_data['fm_id'],
-        'phone_number': phone_number,
-    }
-    response = requests.post(f'{API_BASE_URL}users/documents/', files=files, data=data)
-    if response.status_code == 201:
+    file = await context.bot.get_file(document.file_id)  # document may come from persistence without a bot
+
+    # Stream the file from Telegram straight into the backend, one chunk at a time
+    async with api_client.stream('GET', file.file_path) as download:
+        if download.status_code != 200:
+            logger.error(f"Downloading document from Telegram failed with status {download.status_code}")
+            response = None
+        else:
+            response = await backend.upload_document(
+                update.effective_user.id, context.user_data['fm_id'], description,
+                document.file_name or 'document', document.mime_type,
+                file.file_size or int(download.headers['Content-Length']),
+                download.aiter_raw(UPLOAD_CHUNK_SIZE),
+            )
+    profile_cache.invalidate(update.effective_user.id)
+    if response is not None and response.status_code == 201:
         await update.message.reply_text('مدرک پزشکی با موفقیت آپلود شد!')
     else:
         await update.message.reply_text('خطا در آپلود مدرک.')
@@ -565,29 +721,37 @@ async def document_description(update: Update, context: ContextTypes.DEFAULT_TYP
 async def category(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    category_id = query.data.split('_')[1]
+    category_id = int(query.data.split('_')[1])
     context.user_data['category_id'] = category_id
-    phone_number = context.user_data.get('phone_number')
-    response = requests.get(f'{API_BASE_URL}users/profile/', params={'phone_number': phone_number})
-    if response.status_code == 200:
-        user_data = response.json()[0]
-        recipient_age = user_data['age'] or 30  # Default age if not provided
+    return await show_services(update, context, category_id, 0)
+
+@router.route('page_srv_<int:category_id>_<int:offset>')
+async def services_page(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id, offset):
+    await show_services(update, context, category_id, offset, edit=True)
+
+async def show_services(update: Update, context: ContextTypes.DEFAULT_TYPE, category_id, offset, edit=False):
+    query = update.callback_query
+    user_data = await get_profile(update, context)
+    if user_data:
+        recipient_age = user_data['age'] if user_data['age'] is not None else 30  # Default age if not provided
+        recipient_gender = user_data['gender'] or None
         family_members = user_data['family_members']
         recipient_id = context.user_data.get('recipient_id')
         if recipient_id:
             recipient = next((fm for fm in family_members if fm['id'] == int(recipient_id)), None)
-            recipient_age = recipient['age'] if recipient else recipient_age
-        response = requests.get(f'{API_BASE_URL}services/services/', params={'category': category_id})
-        if response.status_code == 200:
-            services = response.json()
-            filtered_services = [srv for srv in services if (
-                (recipient_age < 18 and 'کودکان' in srv['name']) or
-                (recipient_age >= 60 and 'سالمندان' in srv['name']) or
-                (18 <= recipient_age < 60)
-            )]
-            keyboard = [[InlineKeyboardButton(srv['name'], callback_data=f'srv_{srv["id"]}')] for srv in filtered_services]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.message.reply_text('لطفاً یک خدمت انتخاب کنید:', reply_markup=reply_markup)
+            if recipient:
+                if recipient['age'] is not None:  # 0 for infants
+                    recipient_age = recipient['age']
+                recipient_gender = recipient['gender'] or None
+        # Eligibility (age range, gender) is filtered by the API in the database
+        response = await backend.list_services(
+            category_id, age=recipient_age, gender=recipient_gender, limit=PAGE_SIZE, offset=offset,
+        )
+        if response.status_code == 200 and response.json()['count']:
+            services, total = page_items(response.json())
+            keyboard = [[InlineKeyboardButton(srv['name'], callback_data=f'srv_{srv["id"]}')] for srv in services]
+            reply_markup = page_keyboard(keyboard, f'page_srv_{category_id}', offset, total)
+            await show_page(query, 'لطفاً یک خدمت انتخاب کنید:', reply_markup, edit)
             return SERVICE
         await query.message.reply_text('خدمتی یافت نشد.')
         return ConversationHandler.END
@@ -599,10 +763,8 @@ async def service(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     service_id = query.data.split('_')[1]
     context.user_data['service_id'] = service_id
-    phone_number = context.user_data.get('phone_number')
-    response = requests.get(f'{API_BASE_URL}users/profile/', params={'phone_number': phone_number})
-    if response.status_code == 200:
-        user_data = response.json()[0]
+    user_data = await get_profile(update, context)
+    if user_data:
         keyboard = [[InlineKeyboardButton(user_data['full_name'], callback_data='recip_self')]]
         keyboard.extend([[InlineKeyboardButton(fm['full_name'], callback_data=f'recip_{fm["id"]}')] for fm in user_data['family_members']])
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -616,10 +778,9 @@ async def recipient(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     recipient_data = query.data.split('_')
     context.user_data['recipient_id'] = None if recipient_data[1] == 'self' else recipient_data[1]
-    phone_number = context.user_data.get('phone_number')
-    response = requests.get(f'{API_BASE_URL}users/addresses/', params={'phone_number': phone_number})
-    if response.status_code == 200:
-        addresses = response.json()
+    user_data = await get_profile(update, context)
+    if user_data:
+        addresses = user_data['addresses']
         keyboard = [[InlineKeyboardButton(addr['title'], callback_data=f'addr_{addr["id"]}')] for addr in addresses]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.message.reply_text('لطفاً آدرس مورد نظر را انتخاب کنید:', reply_markup=reply_markup)
@@ -632,11 +793,16 @@ async def address(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     address_id = query.data.split('_')[1]
     context.user_data['address_id'] = address_id
-    today = jdatetime.date.today()
-    keyboard = [
-        [InlineKeyboardButton(str(today + jdatetime.timedelta(days=i)), callback_data=f'date_{i}')]
-        for i in range(7)
-    ]
+    # Only days on which the service still has a free slot are offered
+    response = await backend.get_availability(update.effective_user.id, context.user_data['service_id'])
+    days = [day['date'] for day in response.json()['days'] if day['slots']] if response.status_code == 200 else []
+    if not days:
+        await query.message.reply_text('در روزهای پیش رو زمان آزادی برای این خدمت وجود ندارد.')
+        return ConversationHandler.END
+    today = timezone.localdate()
+    dates = [datetime.fromisoformat(day).date() for day in days]
+    labels = jalali.format_dates(dates)
+    keyboard = [[InlineKeyboardButton(label, callback_data=f'date_{(day - today).days}')] for day, label in zip(dates, labels)]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await query.message.reply_text('لطفاً تاریخ دریافت خدمت را انتخاب کنید:', reply_markup=reply_markup)
     return DATE
@@ -645,11 +811,16 @@ async def date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     days = int(query.data.split('_')[1])
-    selected_date = jdatetime.date.today() + jdatetime.timedelta(days=days)
-    context.user_data['selected_date'] = selected_date
-    keyboard = [
-        [InlineKeyboardButton(f"{h}:00", callback_data=f'time_{h}')] for h in range(8, 18)
-    ]
+    selected_date = timezone.localdate() + timedelta(days=days)
+    context.user_data['selected_date'] = selected_date.isoformat()  # Gregorian, as the API expects
+    response = await backend.get_availability(
+        update.effective_user.id, context.user_data['service_id'], selected_date,
+    )
+    slots = response.json()['days'][0]['slots'] if response.status_code == 200 else []
+    if not slots:
+        await query.message.reply_text('برای این روز زمان آزادی باقی نمانده است.')
+        return ConversationHandler.END
+    keyboard = [[InlineKeyboardButton(slot, callback_data=f'time_{slot.replace(":", "")}')] for slot in slots]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await query.message.reply_text('لطفاً ساعت دریافت خدمت را انتخاب کنید:', reply_markup=reply_markup)
     return TIME
@@ -657,9 +828,8 @@ async def date(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    hour = int(query.data.split('_')[1])
-    selected_datetime = jdatetime.datetime.combine(context.user_data['selected_date'], jdatetime.time(hour, 0))
-    context.user_data['scheduled_time'] = selected_datetime.strftime('%Y-%m-%d %H:%M:%S')
+    slot = query.data.split('_')[1]  # HHMM
+    context.user_data['scheduled_time'] = f"{context.user_data['selected_date']} {slot[:2]}:{slot[2:]}:00"
     await query.message.reply_text('لطفاً شرایط خاص (در صورت وجود) را وارد کنید یا بنویسید "ندارد":')
     return SPECIAL_CONDITIONS
 
@@ -689,10 +859,13 @@ async def preferred_gender(update: Update, context: ContextTypes.DEFAULT_TYPE):
         'special_conditions': context.user_data['special_conditions'],
         'scheduled_time': context.user_data['scheduled_time'],
     }
-    response = requests.post(f'{API_BASE_URL}orders/orders/', json=data)
+    response = await backend.create_order(update.effective_user.id, data)
     if response.status_code == 201:
         order = response.json()
-        recipient_name = order['recipient']['full_name'] if order['recipient'] else order['user']['full_name']
+        if order['recipient']:
+            recipient_name = order['recipient']['full_name']
+        else:  # The order only carries the user's id; the profile is cached by now
+            recipient_name = (await get_profile(update, context) or {}).get('full_name', '')
         await query.message.reply_text(
             f"درخواست شما ثبت شد:\n"
             f"دریافت‌کننده: {recipient_name}\n"
@@ -702,18 +875,22 @@ async def preferred_gender(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"جنسیت درمانگر: {pref_gender}\n"
             f"شرایط خاص: {order['special_conditions']}"
         )
+    elif response.status_code == 400 and 'scheduled_time' in response.json():
+        # Someone else booked the last free capacity after the time picker was shown
+        await query.message.reply_text(response.json()['scheduled_time'][0])
     else:
         await query.message.reply_text('خطا در ثبت درخواست.')
     return ConversationHandler.END
 
-async def cancel_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@router.route('cancel_<int:order_id>')
+async def cancel_order(update: Update, context: ContextTypes.DEFAULT_TYPE, order_id):
     query = update.callback_query
-    await query.answer()
-    order_id = query.data.split('_')[1]
-    phone_number = context.user_data.get('phone_number')
-    response = requests.patch(f'{API_BASE_URL}orders/orders/{order_id}/', json={'status': 'canceled'}, params={'phone_number': phone_number})
+    telegram_id = update.effective_user.id
+    response = await backend.cancel_order(telegram_id, order_id)
     if response.status_code == 200:
         await query.message.reply_text('درخواست با موفقیت لغو شد.')
+    elif response.status_code == 400:  # The cancellation window began after the list was shown
+        await query.message.reply_text(response.json()['detail'])
     else:
         await query.message.reply_text('خطا در لغو درخواست.')
     return ConversationHandler.END
@@ -724,7 +901,10 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def setup_handlers(application):
     conv_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(button, pattern='^(register|request_service|add_family_member|add_address|manage_family_member|cancel_order|manage_address|upload_document|edit_profile)$')],
+        entry_points=[CallbackQueryHandler(button, pattern=router.pattern(
+            'register', 'request_service', 'add_family_member', 'add_address', 'manage_family_member',
+            'cancel_order', 'manage_address', 'upload_document', 'edit_profile',
+        ))],
         states={
             FULL_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, full_name)],
             PHONE_NUMBER: [MessageHandler(filters.TEXT & ~filters.COMMAND | filters.CONTACT, phone_number)],
@@ -741,7 +921,7 @@ def setup_handlers(application):
             ADDR_TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, addr_title)],
             ADDR_FULL_ADDRESS: [MessageHandler(filters.TEXT & ~filters.COMMAND, addr_full_address)],
             ADDR_LOCATION: [MessageHandler(filters.TEXT | filters.LOCATION, addr_location)],
-            EDIT_ADDRESS: [CallbackQueryHandler(button, pattern='^(edit_addr_|delete_addr_)')],
+            EDIT_ADDRESS: [CallbackQueryHandler(button, pattern=router.pattern('edit_addr_<int:addr_id>', 'delete_addr_<int:addr_id>'))],
             EDIT_ADDR_TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_addr_title)],
             EDIT_ADDR_FULL_ADDRESS: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_addr_full_address)],
             EDIT_ADDR_LOCATION: [MessageHandler(filters.TEXT | filters.LOCATION, edit_addr_location)],
@@ -755,16 +935,29 @@ def setup_handlers(application):
             TIME: [CallbackQueryHandler(time, pattern='^time_')],
             SPECIAL_CONDITIONS: [MessageHandler(filters.TEXT & ~filters.COMMAND, special_conditions)],
             PREFERRED_GENDER: [CallbackQueryHandler(preferred_gender, pattern='^pref_')],
-            CANCEL_ORDER: [CallbackQueryHandler(cancel_order, pattern='^cancel_')],
-            EDIT_PROFILE: [CallbackQueryHandler(button, pattern='^(edit_birth_date|edit_region)$')],
+            CANCEL_ORDER: [CallbackQueryHandler(button, pattern=router.pattern('cancel_<int:order_id>'))],
+            EDIT_PROFILE: [CallbackQueryHandler(button, pattern=router.pattern('edit_birth_date', 'edit_region'))],
             EDIT_BIRTH_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_birth_date)],
             EDIT_REGION: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_region)],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
-        per_message=False
+        per_message=False,
+        name='main',
+        persistent=application.persistence is not None,
     )
 
-    application.add_handler(CommandHandler('start', start))
+    instrument_handlers(conv_handler)
+    application.add_handler(CommandHandler('start', timed_handler(start, 'command', 'start')))
     application.add_handler(conv_handler)
-    application.add_handler(CallbackQueryHandler(button))
+    application.add_handler(CallbackQueryHandler(button, pattern=router.matches))
+
+def instrument_handlers(conv_handler):
+    """Records the latency of conversation steps by state name (callback routes are timed by the router)."""
+    state_names = {value: name for name, value in globals().items() if name.isupper() and type(value) is int}
+    for state, handlers in conv_handler.states.items():
+        for handler in handlers:
+            if handler.callback is not button:
+                handler.callback = timed_handler(handler.callback, 'state', state_names.get(state, str(state)))
+    for handler in conv_handler.fallbacks:
+        handler.callback = timed_handler(handler.callback, 'command', handler.callback.__name__)
     
\ No newline at end of file
@@ -0,0 +1,130 @@
+import logging
+import time
+import httpx
+from decouple import config
+from .metrics import API_SECONDS, endpoint_label
+from .service_auth import signature_headers
+
+logger = logging.getLogger(__name__)
+
+# API Base URL
+API_BASE_URL = config('API_BASE_URL', default='https://your-render-app.onrender.com/api/')
+BOT_API_SECRET = config('BOT_API_SECRET', default='')  # Signs requests; must match the API's
+
+
+class APIClient:
+    """
+    Async client for the bot's calls to the Django API.
+
+    Wraps a single ``httpx.AsyncClient`` so every handler shares one keep-alive
+    connection pool per process instead of opening a new blocking connection
+    for each request. With a ``secret``, each request is HMAC-signed (see
+    ``service_auth``) and the API acts as the user in its ``telegram_id``
+    parameter.
+    """
+
+    def __init__(self, base_url=API_BASE_URL, timeout=30.0, max_connections=20, max_keepalive_connections=10,
+                 secret=BOT_API_SECRET):
+        self.base_url = base_url
+        self.secret = secret
+        self.timeout = httpx.Timeout(timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        self._client = None
+        self._catalog = None
+        self._catalog_etag = None
+
+    @property
+    def is_started(self):
+        return self._client is not None and not self._client.is_closed
+
+    async def start(self):
+        """Opens the connection pool (no-op if it is already open)."""
+        if not self.is_started:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+            logger.info(f"API client started for {self.base_url}")
+
+    async def close(self):
+        """Closes the connection pool."""
+        if self.is_started:
+            await self._client.aclose()
+            logger.info("API client closed.")
+        self._client = None
+
+    async def request(self, method, path, **kwargs) -> httpx.Response:
+        if not self.is_started:
+            await self.start()
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            request = self._client.build_request(method, path, **kwargs)
+            if self.secret:
+                request.headers.update(signature_headers(self.secret, method, request.url.raw_path.decode('ascii')))
+            response = await self._client.send(request)
+            status = response.status_code
+            return response
+        finally:
+            API_SECONDS.observe(
+                time.perf_counter() - started, backend='http', method=method, endpoint=endpoint_label(path), status=status,
+            )
+
+    def stream(self, method, url, **kwargs):
+        """
+        Returns an ``async with`` context manager over a streamed response.
+
+        ``url`` may be absolute (e.g. a Telegram file URL) to reuse the pool for
+        downloads that should not be read into memory at once.
+        """
+        if not self.is_started:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+        return self._client.stream(method, url, **kwargs)
+
+    async def get(self, path, **kwargs) -> httpx.Response:
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path, **kwargs) -> httpx.Response:
+        return await self.request('POST', path, **kwargs)
+
+    async def put(self, path, **kwargs) -> httpx.Response:
+        return await self.request('PUT', path, **kwargs)
+
+    async def patch(self, path, **kwargs) -> httpx.Response:
+        return await self.request('PATCH', path, **kwargs)
+
+    async def delete(self, path, **kwargs) -> httpx.Response:
+        return await self.request('DELETE', path, **kwargs)
+
+    async def get_catalog(self, known_version=None):
+        """
+        Returns the service catalog (categories and services).
+
+        The last copy is kept in memory and revalidated with ``If-None-Match``,
+        so an unchanged catalog costs a bodiless 304. If ``known_version``
+        (e.g. from the session bootstrap) matches the cached copy, no request
+        is made at all. Returns None if the API fails and no copy is cached yet.
+        """
+        if known_version is not None and self._catalog is not None and self._catalog.get('version') == known_version:
+            return self._catalog
+        headers = {'If-None-Match': self._catalog_etag} if self._catalog_etag else {}
+        response = await self.get('services/catalog/', headers=headers)
+        if response.status_code == 304 and self._catalog is not None:
+            return self._catalog
+        if response.status_code == 200:
+            self._catalog = response.json()
+            self._catalog_etag = response.headers.get('ETag')
+            return self._catalog
+        logger.warning(f"Catalog request failed with status {response.status_code}.")
+        return self._catalog
+
+
+# Process-wide client shared by all bot handlers
+api_client = APIClient()
+
+
+async def start_api_client(application=None):
+    """Opens the shared client. Signature matches ``Application.post_init``."""
+    await api_client.start()
+
+
+async def close_api_client(application=None):
+    """Closes the shared client. Signature matches ``Application.post_shutdown``."""
+    await api_client.close()
@@ -2,6 +2,8 @@
 ASGI config for medical_bot project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Lifespan events initialize and shut down the Telegram application once per
+worker (see medical_bot/lifespan.py).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medical_bot.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+django_application = get_asgi_application()
+
+from medical_bot.lifespan import LifespanMiddleware  # noqa: E402 (needs the app registry loaded above)
+
+application = LifespanMiddleware(django_application)
\ No newline at end of file
@@ -0,0 +1,263 @@
+import json
+import logging
+import time
+from decouple import config
+from .api_client import api_client
+from .metrics import API_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 'http' calls the API at API_BASE_URL; 'local' calls the Django operations in-process
+# (only when the bot runs inside the Django process, e.g. through the webhook view).
+BOT_BACKEND = config('BOT_BACKEND', default='http')
+
+
+class BackendResponse:
+    """Result of a local backend call, with the parts of ``httpx.Response`` the bot uses."""
+
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+def page_params(limit=None, offset=0):
+    """Query parameters for one page of a list endpoint; none means the whole list."""
+    return {} if limit is None else {'limit': limit, 'offset': offset}
+
+
+def cursor_params(limit=None, cursor=None):
+    """Query parameters for one page of a keyset-paginated list (orders)."""
+    params = {} if limit is None else {'limit': limit}
+    if cursor is not None:
+        params['cursor'] = cursor
+    return params
+
+
+class HTTPBackend:
+    """
+    Bot operations over HTTP through the pooled API client.
+
+    Every method returns the API response; ``get_catalog`` returns the
+    catalog dict (or None). List methods take ``limit``/``offset`` and then
+    return ``{'count': ..., 'results': [...]}`` instead of a plain list;
+    ``list_orders`` takes ``limit``/``cursor`` and returns
+    ``{'next_cursor': ..., 'previous_cursor': ..., 'results': [...]}``.
+    """
+
+    def __init__(self, client=api_client):
+        self.client = client
+
+    async def get_profile(self, telegram_id):
+        return await self.client.get('users/profile/me/', params={'telegram_id': telegram_id})
+
+    async def bootstrap(self, telegram_id):
+        return await self.client.get('users/profile/bootstrap/', params={'telegram_id': telegram_id})
+
+    async def register(self, data):
+        return await self.client.post('users/profile/register/', json=data)
+
+    async def link_account(self, telegram_id, phone_number):
+        return await self.client.post('users/profile/link/', json={'telegram_id': telegram_id, 'phone_number': phone_number})
+
+    async def update_profile(self, telegram_id, data):
+        return await self.client.patch('users/profile/me/', json=data, params={'telegram_id': telegram_id})
+
+    async def list_family_members(self, telegram_id, limit=None, offset=0):
+        params = {'telegram_id': telegram_id, **page_params(limit, offset)}
+        return await self.client.get('users/family-members/', params=params)
+
+    async def save_family_member(self, telegram_id, data, fm_id=None):
+        if fm_id is not None:
+            return await self.client.put(f'users/family-members/{fm_id}/', json=data, params={'telegram_id': telegram_id})
+        return await self.client.post('users/family-members/', json=data, params={'telegram_id': telegram_id})
+
+    async def delete_family_member(self, telegram_id, fm_id):
+        return await self.client.delete(f'users/family-members/{fm_id}/', params={'telegram_id': telegram_id})
+
+    async def list_addresses(self, telegram_id, limit=None, offset=0):
+        params = {'telegram_id': telegram_id, **page_params(limit, offset)}
+        return await self.client.get('users/addresses/', params=params)
+
+    async def save_address(self, telegram_id, data, addr_id=None):
+        if addr_id is not None:
+            return await self.client.put(f'users/addresses/{addr_id}/', json=data, params={'telegram_id': telegram_id})
+        return await self.client.post('users/addresses/', json=data, params={'telegram_id': telegram_id})
+
+    async def delete_address(self, telegram_id, addr_id):
+        return await self.client.delete(f'users/addresses/{addr_id}/', params={'telegram_id': telegram_id})
+
+    async def upload_document(self, telegram_id, family_member_id, description, filename, content_type, size, chunks):
+        """Streams ``chunks`` (an async iterator of bytes, ``size`` bytes in total) to the upload endpoint."""
+        params = {'telegram_id': telegram_id, 'family_member': family_member_id, 'description': description, 'filename': filename}
+        headers = {'Content-Type': content_type, 'Content-Length': str(size)}
+        return await self.client.post('users/documents/upload/', params=params, headers=headers, content=chunks)
+
+    async def get_catalog(self, known_version=None):
+        return await self.client.get_catalog(known_version)
+
+    async def list_services(self, category_id, age=None, gender=None, limit=None, offset=0):
+        params = {'category': category_id, 'age': age, 'gender': gender}
+        params = {k: v for k, v in params.items() if v is not None}
+        return await self.client.get('services/services/', params={**params, **page_params(limit, offset)})
+
+    async def list_orders(self, telegram_id, limit=None, cursor=None):
+        params = {'telegram_id': telegram_id, **cursor_params(limit, cursor)}
+        return await self.client.get('orders/orders/', params=params)
+
+    async def list_cancellable_orders(self, telegram_id, limit=None, offset=0):
+        params = {'telegram_id': telegram_id, **page_params(limit, offset)}
+        return await self.client.get('orders/orders/cancellable/', params=params)
+
+    async def get_availability(self, telegram_id, service_id, day=None):
+        params = {'telegram_id': telegram_id, 'service': service_id}
+        if day is not None:
+            params['date'] = day.isoformat()
+        return await self.client.get('orders/orders/availability/', params=params)
+
+    async def create_order(self, telegram_id, data):
+        return await self.client.post('orders/orders/', json=data, params={'telegram_id': telegram_id})
+
+    async def confirm_order(self, telegram_id, order_id):
+        return await self.client.post(f'orders/orders/{order_id}/confirm/', params={'telegram_id': telegram_id})
+
+    async def cancel_order(self, telegram_id, order_id):
+        return await self.client.post(f'orders/orders/{order_id}/cancel/', params={'telegram_id': telegram_id})
+
+
+class LocalBackend:
+    """
+    Bot operations as direct calls into the users, orders and services apps.
+
+    Skips the HTTP loopback, middleware and the JSON round trip. The ORM
+    code runs through ``sync_to_async``, and results use the API's status
+    codes and payloads so handlers work unchanged with either backend.
+    """
+
+    def __init__(self):
+        # Imported here so the HTTP backend works without a configured Django project
+        from asgiref.sync import sync_to_async
+        from users import operations as users
+        from orders import operations as orders
+        from services import operations as services
+        from services.catalog import get_catalog_snapshot
+        self._sync_to_async = sync_to_async
+        self._users = users
+        self._orders = orders
+        self._services = services
+        self._get_catalog_snapshot = get_catalog_snapshot
+        self._catalog = None
+        self._catalog_version = None
+
+    async def _call(self, status, func, *args, **kwargs):
+        from django.core.exceptions import ObjectDoesNotExist
+        from rest_framework.exceptions import ValidationError
+        started = time.perf_counter()
+        try:
+            data = await self._sync_to_async(func)(*args, **kwargs)
+        except ObjectDoesNotExist:
+            response = BackendResponse(404, {'detail': 'Not found.'})
+        except ValidationError as e:
+            response = BackendResponse(400, e.detail)
+        except Exception as e:
+            logger.error(f"Local backend call {func.__name__} failed: {e}", exc_info=True)
+            response = BackendResponse(500, {'error': 'Internal error.'})
+        else:
+            response = BackendResponse(status, data)
+        API_SECONDS.observe(
+            time.perf_counter() - started, backend='local', method='call', endpoint=func.__name__, status=response.status_code,
+        )
+        return response
+
+    async def get_profile(self, telegram_id):
+        return await self._call(200, self._users.get_profile, telegram_id)
+
+    async def bootstrap(self, telegram_id):
+        return await self._call(200, self._users.bootstrap, telegram_id)
+
+    async def register(self, data):
+        return await self._call(201, self._users.register_user, data)
+
+    async def link_account(self, telegram_id, phone_number):
+        return await self._call(200, self._users.link_telegram_id, telegram_id, phone_number)
+
+    async def update_profile(self, telegram_id, data):
+        return await self._call(200, self._users.update_profile, telegram_id, data)
+
+    async def list_family_members(self, telegram_id, limit=None, offset=0):
+        return await self._call(200, self._users.list_family_members, telegram_id, limit, offset)
+
+    async def save_family_member(self, telegram_id, data, fm_id=None):
+        return await self._call(201 if fm_id is None else 200, self._users.save_family_member, telegram_id, data, fm_id)
+
+    async def delete_family_member(self, telegram_id, fm_id):
+        return await self._call(204, self._users.delete_family_member, telegram_id, fm_id)
+
+    async def list_addresses(self, telegram_id, limit=None, offset=0):
+        return await self._call(200, self._users.list_addresses, telegram_id, limit, offset)
+
+    async def save_address(self, telegram_id, data, addr_id=None):
+        return await self._call(201 if addr_id is None else 200, self._users.save_address, telegram_id, data, addr_id)
+
+    async def delete_address(self, telegram_id, addr_id):
+        return await self._call(204, self._users.delete_address, telegram_id, addr_id)
+
+    async def upload_document(self, telegram_id, family_member_id, description, filename, content_type, size, chunks):
+        from users.uploads import UploadWriter, UploadRejected
+        try:
+            writer = UploadWriter(content_type, size, filename)
+        except UploadRejected as e:
+            return BackendResponse(e.status, {'error': str(e)})
+        try:
+            async for chunk in chunks:
+                writer.write(chunk)
+            upload = writer.finish()
+        except UploadRejected as e:
+            writer.abort()
+            return BackendResponse(e.status, {'error': str(e)})
+        except BaseException:
+            writer.abort()
+            raise
+        try:
+            return await self._call(201, self._users.upload_document, telegram_id, family_member_id, description[:200], upload)
+        finally:
+            upload.close()
+
+    async def get_catalog(self, known_version=None):
+        snapshot = await self._sync_to_async(self._get_catalog_snapshot)()
+        if snapshot.version != self._catalog_version:
+            self._catalog = json.loads(snapshot.body)
+            self._catalog_version = snapshot.version
+        return self._catalog
+
+    async def list_services(self, category_id, age=None, gender=None, limit=None, offset=0):
+        return await self._call(200, self._services.list_services, category_id, age, gender, limit, offset)
+
+    async def list_orders(self, telegram_id, limit=None, cursor=None):
+        return await self._call(200, self._orders.list_orders, telegram_id, limit, cursor)
+
+    async def list_cancellable_orders(self, telegram_id, limit=None, offset=0):
+        return await self._call(200, self._orders.list_cancellable_orders, telegram_id, limit, offset)
+
+    async def get_availability(self, telegram_id, service_id, day=None):
+        return await self._call(200, self._orders.get_availability, service_id, day)
+
+    async def create_order(self, telegram_id, data):
+        return await self._call(201, self._orders.create_order, telegram_id, data)
+
+    async def confirm_order(self, telegram_id, order_id):
+        return await self._call(200, self._orders.confirm_order, telegram_id, order_id)
+
+    async def cancel_order(self, telegram_id, order_id):
+        return await self._call(200, self._orders.cancel_order, telegram_id, order_id)
+
+
+def build_backend(name=BOT_BACKEND):
+    if name == 'local':
+        logger.info("Bot uses the in-process backend.")
+        return LocalBackend()
+    if name == 'http':
+        return HTTPBackend()
+    raise ValueError(f"Unsupported BOT_BACKEND: {name}")
@@ -0,0 +1,148 @@
+import logging
+import re
+import time
+from telegram.ext import ConversationHandler
+
+logger = logging.getLogger(__name__)
+
+# Converters for typed route parameters, e.g. 'edit_fm_<int:fm_id>'
+CONVERTERS = {
+    'int': int,
+    'str': str,
+}
+
+# Splits a route pattern on underscores that are not inside <...>
+SEGMENT_SEPARATOR = re.compile(r'_(?![^<]*>)')
+
+
+class Route:
+    def __init__(self, pattern, handler):
+        self.pattern = pattern
+        self.handler = handler
+
+    def __repr__(self):
+        return f"Route({self.pattern!r}, {self.handler.__name__})"
+
+
+class _Node:
+    __slots__ = ('children', 'param', 'route')
+
+    def __init__(self):
+        self.children = {}  # literal segment -> _Node
+        self.param = None  # (name, converter, _Node) for a typed segment
+        self.route = None
+
+
+class CallbackRouter:
+    """
+    Declarative dispatch for inline-keyboard callback data.
+
+    Routes without parameters (``'show_profile'``) live in a dict and are
+    resolved with one lookup. Parameterized routes (``'edit_fm_<int:fm_id>'``)
+    live in a trie keyed by ``_``-separated segments, so resolving costs the
+    number of segments in the callback data, not the number of routes.
+    Parsed parameters are passed to the handler as keyword arguments.
+    """
+
+    def __init__(self):
+        self._exact = {}
+        self._root = _Node()
+        self._timing_hooks = []
+
+    def route(self, pattern):
+        """Decorator registering ``handler(update, context, **params)`` for ``pattern``."""
+        def decorator(handler):
+            self.add_route(pattern, handler)
+            return handler
+        return decorator
+
+    def add_route(self, pattern, handler):
+        route = Route(pattern, handler)
+        if '<' not in pattern:
+            if pattern in self._exact:
+                raise ValueError(f"Duplicate callback route: {pattern}")
+            self._exact[pattern] = route
+            return route
+
+        node = self._root
+        for segment in SEGMENT_SEPARATOR.split(pattern):
+            if segment.startswith('<') and segment.endswith('>'):
+                type_name, _, name = segment[1:-1].partition(':')
+                if not name:
+                    type_name, name = 'str', type_name
+                converter = CONVERTERS[type_name]
+                if node.param is None:
+                    node.param = (name, converter, _Node())
+                elif node.param[:2] != (name, converter):
+                    raise ValueError(f"Conflicting parameter in callback route: {pattern}")
+                node = node.param[2]
+            else:
+                node = node.children.setdefault(segment, _Node())
+        if node.route is not None:
+            raise ValueError(f"Duplicate callback route: {pattern}")
+        node.route = route
+        return route
+
+    def resolve(self, data):
+        """Returns ``(route, params)`` for callback data, or ``(None, None)``."""
+        route = self._exact.get(data)
+        if route is not None:
+            return route, {}
+        if not isinstance(data, str):
+            return None, None
+        params = {}
+        route = self._match(self._root, data.split('_'), 0, params)
+        return (route, params) if route is not None else (None, None)
+
+    def _match(self, node, segments, index, params):
+        if index == len(segments):
+            return node.route
+        child = node.children.get(segments[index])
+        if child is not None:
+            route = self._match(child, segments, index + 1, params)
+            if route is not None:
+                return route
+        if node.param is not None:
+            name, converter, child = node.param
+            try:
+                params[name] = converter(segments[index])
+            except ValueError:
+                return None
+            route = self._match(child, segments, index + 1, params)
+            if route is not None:
+                return route
+            params.pop(name, None)
+        return None
+
+    def matches(self, data):
+        """``CallbackQueryHandler`` pattern accepting any registered route."""
+        return self.resolve(data)[0] is not None
+
+    def pattern(self, *patterns):
+        """``CallbackQueryHandler`` pattern accepting only the given routes."""
+        allowed = frozenset(patterns)
+
+        def check(data):
+            route, _ = self.resolve(data)
+            return route is not None and route.pattern in allowed
+        return check
+
+    def add_timing_hook(self, hook):
+        """Registers ``hook(route_pattern, seconds)``, called after every dispatch."""
+        self._timing_hooks.append(hook)
+
+    async def dispatch(self, update, context):
+        query = update.callback_query
+        await query.answer()
+        route, params = self.resolve(query.data)
+        if route is None:
+            logger.warning("Unhandled callback data: %r", query.data)
+            return ConversationHandler.END
+        started = time.perf_counter()
+        try:
+            return await route.handler(update, context, **params)
+        finally:
+            elapsed = time.perf_counter() - started
+            logger.debug("Callback %s handled in %.1f ms", route.pattern, elapsed * 1000)
+            for hook in self._timing_hooks:
+                hook(route.pattern, elapsed)
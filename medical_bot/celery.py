@@ -1,6 +1,7 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_shutdown
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medical_bot.settings')
@@ -23,4 +24,11 @@ app.conf.beat_schedule = {
     },
 }
 
-app.conf.timezone = 'Asia/Tehran'  # Ensure Celery uses the correct timezone
\ No newline at end of file
+app.conf.timezone = 'Asia/Tehran'  # Ensure Celery uses the correct timezone
+
+
+@worker_process_shutdown.connect
+def stop_dispatcher(**kwargs):
+    """Closes the worker's outbound dispatcher (and its Bot API connections)."""
+    from .dispatcher import shutdown_dispatcher
+    shutdown_dispatcher()
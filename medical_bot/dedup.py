@@ -0,0 +1,89 @@
+import logging
+from collections import deque
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+UPDATE_DEDUP_WINDOW = config('UPDATE_DEDUP_WINDOW', default=10000, cast=int)
+# Also record update_ids in the Django cache so duplicates delivered to another worker are caught
+UPDATE_DEDUP_SHARED = config('UPDATE_DEDUP_SHARED', default=False, cast=bool)
+UPDATE_DEDUP_TTL = config('UPDATE_DEDUP_TTL', default=3600, cast=int)
+
+
+class UpdateDeduplicator:
+    """
+    Remembers the last ``window`` Telegram update_ids to drop re-deliveries.
+
+    Lookups go to a set; a deque keeps arrival order so the oldest id is
+    evicted once the window is full, bounding memory. With ``cache`` set,
+    ids are also claimed with ``cache.add`` so only one worker accepts an
+    update; the local window still answers repeats without a round trip.
+    """
+
+    def __init__(self, window=UPDATE_DEDUP_WINDOW, cache=None, ttl=UPDATE_DEDUP_TTL, prefix='tg-update:'):
+        self.window = window
+        self.cache = cache
+        self.ttl = ttl
+        self.prefix = prefix
+        self._seen = set()
+        self._order = deque()
+        self.accepted = 0
+        self.duplicates = 0
+
+    def _remember(self, update_id):
+        self._seen.add(update_id)
+        self._order.append(update_id)
+        if len(self._order) > self.window:
+            self._seen.discard(self._order.popleft())
+
+    async def claim(self, update_id):
+        """Returns True the first time an update_id is seen, False for duplicates."""
+        if update_id in self._seen:
+            self.duplicates += 1
+            return False
+        self._remember(update_id)
+        if self.cache is not None:
+            try:
+                claimed = await self.cache.aadd(f'{self.prefix}{update_id}', 1, self.ttl)
+            except Exception as e:
+                # Fail open: a cache outage must not stop the bot
+                logger.warning(f"Shared update dedup unavailable: {e}")
+                claimed = True
+            if not claimed:
+                self.duplicates += 1
+                return False
+        self.accepted += 1
+        return True
+
+    async def release(self, update_id):
+        """Forgets an update_id that was not processed, so Telegram's retry is accepted."""
+        if update_id in self._seen:
+            self._seen.discard(update_id)
+            try:
+                self._order.remove(update_id)
+            except ValueError:
+                pass
+        if self.cache is not None:
+            try:
+                await self.cache.adelete(f'{self.prefix}{update_id}')
+            except Exception as e:
+                logger.warning(f"Shared update dedup unavailable: {e}")
+        self.accepted -= 1
+
+    def stats(self):
+        total = self.accepted + self.duplicates
+        return {
+            'window': self.window,
+            'tracked': len(self._seen),
+            'shared': self.cache is not None,
+            'accepted': self.accepted,
+            'duplicates': self.duplicates,
+            'hit_rate': self.duplicates / total if total else 0.0,
+        }
+
+
+def build_deduplicator():
+    if UPDATE_DEDUP_SHARED:
+        from django.core.cache import cache
+        return UpdateDeduplicator(cache=cache)
+    return UpdateDeduplicator()
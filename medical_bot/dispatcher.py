@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from decouple import config
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Bot API limits: about 30 messages per second overall and one per second per chat
+TELEGRAM_SEND_RATE = config('TELEGRAM_SEND_RATE', default=30, cast=float)
+TELEGRAM_CHAT_SEND_RATE = config('TELEGRAM_CHAT_SEND_RATE', default=1, cast=float)
+TELEGRAM_SEND_CONCURRENCY = config('TELEGRAM_SEND_CONCURRENCY', default=8, cast=int)  # Requests in flight (and pooled connections)
+TELEGRAM_SEND_ATTEMPTS = config('TELEGRAM_SEND_ATTEMPTS', default=5, cast=int)
+TELEGRAM_API_BASE_URL = config('TELEGRAM_API_BASE_URL', default='https://api.telegram.org/bot')  # A stub server under load tests
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Allows ``rate`` events per second on average, with bursts of up to ``burst``."""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = burst or rate
+        self._clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until a token is available, without taking it."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def take(self):
+        """Takes a token, going into debt if needed; returns how long to wait before using it."""
+        self._refill()
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+
+class _Message:
+    __slots__ = ('chat_id', 'kwargs', 'future', 'attempts')
+
+    def __init__(self, chat_id, kwargs, future):
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+
+
+class OutboundDispatcher:
+    """
+    Sends bot messages at the highest rate the Bot API allows.
+
+    One initialized ``Bot`` (with a pooled HTTP client) is shared by
+    ``concurrency`` sender tasks. Every send takes a token from the global
+    bucket; a message whose chat bucket is empty is set aside until that
+    chat may receive again, so a busy chat never holds up the others. On a
+    429 the message is requeued and all sending pauses for ``retry_after``;
+    network errors are retried up to ``attempts`` times in total, while
+    rejected messages (blocked bot, bad chat) fail right away.
+
+    Runs on an event loop: call ``start`` from async code, or
+    ``start_in_thread`` to give it a background loop of its own (as Celery
+    workers do through ``get_dispatcher``).
+    """
+
+    def __init__(self, bot_factory, rate=TELEGRAM_SEND_RATE, chat_rate=TELEGRAM_CHAT_SEND_RATE,
+                 concurrency=TELEGRAM_SEND_CONCURRENCY, attempts=TELEGRAM_SEND_ATTEMPTS, backoff=1.0, clock=time.monotonic):
+        self._bot_factory = bot_factory
+        self.bot = None
+        self.chat_rate = chat_rate
+        self.concurrency = concurrency
+        self.attempts = attempts
+        self.backoff = backoff  # Seconds before the first network-error retry, doubling after that
+        self._clock = clock
+        self._bucket = TokenBucket(rate, clock=clock)
+        self._chat_buckets = OrderedDict()
+        self._queue = None
+        self._tasks = []
+        self._loop = None
+        self._thread = None
+        self._resume_at = 0.0
+        self.pid = os.getpid()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.throttled = 0
+
+    @property
+    def running(self):
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self.bot = self._bot_factory()
+        await self.bot.initialize()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._sender()) for _ in range(self.concurrency)]
+        logger.info(f"Outbound dispatcher started with {self.concurrency} senders.")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.bot is not None:
+            await self.bot.shutdown()
+        logger.info(f"Outbound dispatcher stopped ({self.sent} sent, {self.failed} failed).")
+
+    async def deliver(self, chat_id, text, **kwargs):
+        """Queues a ``send_message`` and waits until it was sent (or finally failed)."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Message(chat_id, {'text': text, **kwargs}, future))
+        return await future
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, burst=1, clock=self._clock)
+            if len(self._chat_buckets) > MAX_CHAT_BUCKETS:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    def _requeue(self, message, delay):
+        self._loop.call_later(delay, self._queue.put_nowait, message)
+
+    async def _sender(self):
+        while True:
+            message = await self._queue.get()
+            try:
+                await self._send(message)
+            except Exception as e:  # Never let one message stop a sender
+                logger.error(f"Unexpected error sending to chat {message.chat_id}: {e}", exc_info=True)
+                if not message.future.done():
+                    message.future.set_exception(e)
+
+    async def _send(self, message):
+        chat_bucket = self._chat_bucket(message.chat_id)
+        wait = chat_bucket.delay()
+        if wait > 0:
+            self._requeue(message, wait)
+            return
+        chat_bucket.take()
+        await asyncio.sleep(max(self._bucket.take(), self._resume_at - self._clock()))
+        message.attempts += 1
+        try:
+            result = await self.bot.send_message(chat_id=message.chat_id, **message.kwargs)
+        except RetryAfter as e:
+            self.throttled += 1
+            self._resume_at = max(self._resume_at, self._clock() + e.retry_after)
+            logger.warning(f"Bot API flood control: pausing sends for {e.retry_after}s.")
+            self._retry(message, e, e.retry_after)
+        except BadRequest as e:  # Subclass of NetworkError, but retrying won't help
+            self._fail(message, e)
+        except NetworkError as e:
+            self._retry(message, e, self.backoff * 2 ** (message.attempts - 1))
+        except Exception as e:
+            self._fail(message, e)
+        else:
+            self.sent += 1
+            message.future.set_result(result)
+
+    def _retry(self, message, error, delay):
+        if message.attempts >= self.attempts:
+            self._fail(message, error)
+            return
+        self.retried += 1
+        self._requeue(message, delay)
+
+    def _fail(self, message, error):
+        self.failed += 1
+        logger.error(f"Sending to chat {message.chat_id} failed after {message.attempts} attempts: {error}")
+        message.future.set_exception(error)
+
+    def stats(self):
+        return {
+            'pending': self._queue.qsize() if self._queue is not None else 0,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'throttled': self.throttled,
+        }
+
+    # Synchronous interface for code outside the event loop (Celery tasks)
+
+    def start_in_thread(self):
+        """Runs the dispatcher on a daemon thread with its own event loop."""
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+        errors = []
+
+        def run():
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.start())
+            except Exception as e:
+                errors.append(e)
+                return
+            finally:
+                started.set()
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='telegram-dispatcher', daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            self._thread = None
+            raise errors[0]
+
+    def send(self, chat_id, text, **kwargs):
+        """Thread-safe ``deliver``; returns a ``concurrent.futures.Future`` of the sent message."""
+        return asyncio.run_coroutine_threadsafe(self.deliver(chat_id, text, **kwargs), self._loop)
+
+    def send_many(self, messages):
+        """
+        Sends ``messages`` (dicts of ``send_message`` arguments) concurrently.
+
+        Blocks until all are done and returns, in order, the sent message
+        or the exception each one finally failed with.
+        """
+        futures = [self.send(**message) for message in messages]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def close(self):
+        """Stops a dispatcher started with ``start_in_thread``."""
+        if self._thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+
+def default_bot():
+    from telegram import Bot
+    from telegram.request import HTTPXRequest
+    request = HTTPXRequest(connection_pool_size=TELEGRAM_SEND_CONCURRENCY)
+    return Bot(token=config('TELEGRAM_BOT_TOKEN'), request=request, base_url=TELEGRAM_API_BASE_URL)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """Returns this process's dispatcher, started on first use (i.e. after a worker fork)."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None or _dispatcher.pid != os.getpid():
+            _dispatcher = OutboundDispatcher(default_bot)
+            _dispatcher.start_in_thread()
+        return _dispatcher
+
+
+def shutdown_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is not None and _dispatcher.pid == os.getpid():
+            _dispatcher.close()
+        _dispatcher = None
@@ -0,0 +1,33 @@
+"""
+Migration operation for adding indexes to large, busy tables.
+
+``AddIndexConcurrently`` builds the index with ``CREATE INDEX CONCURRENTLY``
+on PostgreSQL, so writes to the table keep going while it is built, and
+falls back to a plain ``CREATE INDEX`` on other databases (SQLite in
+tests and local development). PostgreSQL can't build an index
+concurrently inside a transaction: migrations using it set
+``atomic = False``.
+"""
+from django.db import NotSupportedError, migrations
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    def _concurrently(self, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return {}
+        if schema_editor.connection.in_atomic_block:
+            raise NotSupportedError('AddIndexConcurrently needs a non-atomic migration (atomic = False).')
+        return {'concurrently': True}
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, **self._concurrently(schema_editor))
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, **self._concurrently(schema_editor))
+
+    def describe(self):
+        return f'{super().describe()} concurrently'
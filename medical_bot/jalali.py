@@ -0,0 +1,170 @@
+"""
+Gregorian <-> Jalali conversion shared by the bot, serializers and tasks.
+
+Dates between FIRST_YEAR and LAST_YEAR (Jalali; 1900-2100 Gregorian) are
+converted with lookup tables built once from jdatetime: a Gregorian date is
+an index into per-day year/month/day arrays, and a Jalali date is the
+ordinal of its year's 1 Farvardin plus a fixed month offset. Dates outside
+the range fall back to jdatetime. Formatting and parsing are memoized, and
+the ``*_many`` functions convert whole sequences in one pass.
+"""
+from array import array
+from datetime import date
+from functools import lru_cache
+import jdatetime
+
+FIRST_YEAR = 1279  # starts 1900-03-21
+LAST_YEAR = 1479  # ends 2101-03-20
+
+# Day-of-year offset of the first day of each Jalali month
+MONTH_OFFSETS = (0, 31, 62, 93, 124, 155, 186, 216, 246, 276, 306, 336)
+
+
+class _Tables:
+    def __init__(self):
+        # Ordinal of 1 Farvardin for every year in range, plus the year after
+        self.year_starts = array('l', (
+            jdatetime.date(year, 1, 1).togregorian().toordinal() for year in range(FIRST_YEAR, LAST_YEAR + 2)
+        ))
+        self.base = self.year_starts[0]
+        self.years, self.months, self.days = array('H'), array('B'), array('B')
+        for index, year in enumerate(range(FIRST_YEAR, LAST_YEAR + 1)):
+            leap = self.year_starts[index + 1] - self.year_starts[index] == 366
+            for month in range(1, 13):
+                length = _month_length(month, leap)
+                self.years.extend([year] * length)
+                self.months.extend([month] * length)
+                self.days.extend(range(1, length + 1))
+
+
+def _month_length(month, leap):
+    if month <= 6:
+        return 31
+    if month <= 11:
+        return 30
+    return 30 if leap else 29
+
+
+@lru_cache(maxsize=None)
+def _tables():
+    return _Tables()
+
+
+def is_leap(year):
+    if FIRST_YEAR <= year <= LAST_YEAR:
+        starts = _tables().year_starts
+        return starts[year - FIRST_YEAR + 1] - starts[year - FIRST_YEAR] == 366
+    return jdatetime.date(year, 1, 1).isleap()
+
+
+def _from_ordinal(ordinal):
+    tables = _tables()
+    index = ordinal - tables.base
+    if 0 <= index < len(tables.years):
+        return tables.years[index], tables.months[index], tables.days[index]
+    value = jdatetime.date.fromgregorian(date=date.fromordinal(ordinal))
+    return value.year, value.month, value.day
+
+
+def to_jalali(value):
+    """Returns ``(year, month, day)`` for a ``date`` or ``datetime``, or None for None."""
+    if value is None:
+        return None
+    return _from_ordinal(value.toordinal())
+
+
+def to_gregorian(year, month, day):
+    """Returns the ``date`` for a Jalali date; raises ValueError if it doesn't exist."""
+    if not (1 <= month <= 12 and 1 <= day <= _month_length(month, is_leap(year))):
+        raise ValueError(f"Invalid Jalali date: {year}/{month}/{day}")
+    if FIRST_YEAR <= year <= LAST_YEAR:
+        return date.fromordinal(_tables().year_starts[year - FIRST_YEAR] + MONTH_OFFSETS[month - 1] + day - 1)
+    return jdatetime.date(year, month, day).togregorian()
+
+
+@lru_cache(maxsize=4096)
+def _format_ordinal(ordinal, sep):
+    year, month, day = _from_ordinal(ordinal)
+    return f'{year:04d}{sep}{month:02d}{sep}{day:02d}'
+
+
+def format_date(value, sep='/'):
+    """Formats a date as ``YYYY/MM/DD`` in Jalali; None stays None."""
+    if value is None:
+        return None
+    return _format_ordinal(value.toordinal(), sep)
+
+
+def format_datetime(value, sep='/'):
+    """
+    Formats a datetime as ``YYYY/MM/DD HH:MM:SS`` in Jalali.
+
+    Aware datetimes are formatted in their own timezone; convert them with
+    ``timezone.localtime`` first to show local time.
+    """
+    if value is None:
+        return None
+    return '%s %02d:%02d:%02d' % (_format_ordinal(value.toordinal(), sep), value.hour, value.minute, value.second)
+
+
+@lru_cache(maxsize=4096)
+def parse_date(text):
+    """Parses a Jalali ``YYYY/MM/DD`` (or ``YYYY-MM-DD``) string into a Gregorian ``date``."""
+    parts = text.strip().replace('-', '/').split('/')
+    if len(parts) != 3:
+        raise ValueError(f"Invalid Jalali date: {text}")
+    year, month, day = map(int, parts)
+    return to_gregorian(year, month, day)
+
+
+def age(birth_date, today=None):
+    """Age in full Jalali years on ``today`` (default: the current date)."""
+    if birth_date is None:
+        return None
+    born_year, born_month, born_day = to_jalali(birth_date)
+    year, month, day = to_jalali(today or date.today())
+    return year - born_year - ((month, day) < (born_month, born_day))
+
+
+def to_jalali_many(values):
+    """``to_jalali`` for a sequence of dates (None entries stay None)."""
+    tables = _tables()
+    years, months, days, base, size = tables.years, tables.months, tables.days, tables.base, len(tables.years)
+    result = []
+    for value in values:
+        if value is None:
+            result.append(None)
+            continue
+        index = value.toordinal() - base
+        result.append((years[index], months[index], days[index]) if 0 <= index < size else _from_ordinal(index + base))
+    return result
+
+
+def format_dates(values, sep='/'):
+    """``format_date`` for a sequence of dates."""
+    return [
+        None if parts is None else f'{parts[0]:04d}{sep}{parts[1]:02d}{sep}{parts[2]:02d}'
+        for parts in to_jalali_many(values)
+    ]
+
+
+def to_gregorian_many(jalali_dates):
+    """``to_gregorian`` for a sequence of ``(year, month, day)`` tuples."""
+    return [to_gregorian(*value) for value in jalali_dates]
+
+
+def anniversaries(month, day, first_year=FIRST_YEAR, last_year=LAST_YEAR):
+    """
+    Gregorian dates of Jalali ``month``/``day`` in every year of the range.
+
+    Lets "birthday today" become one ``birth_date__in`` query instead of
+    converting every stored date. Years without that day (30 Esfand in
+    common years) are skipped.
+    """
+    dates = []
+    for year in range(first_year, last_year + 1):
+        try:
+            dates.append(to_gregorian(year, month, day))
+        except ValueError:
+            continue
+    return dates
@@ -0,0 +1,63 @@
+"""
+Paginated inline keyboards for lists that can outgrow one Telegram message.
+
+A list is shown one page at a time: the handler fetches only that page
+(``limit``/``offset`` on the API), builds its rows, and ``page_keyboard``
+appends prev/next buttons whose callback data is ``<prefix>_<offset>``,
+e.g. ``page_fm_16``. The matching router route (``page_fm_<int:offset>``)
+renders the requested page by editing the keyboard in place.
+
+Keyset-paginated lists (orders) page by cursor instead: ``cursor_keyboard``
+puts the API's ``previous_cursor``/``next_cursor`` in the callback data,
+e.g. ``page_orders_n18c2b7e4a1f000.2a``, for a ``page_orders_<cursor>`` route.
+"""
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+PAGE_SIZE = 8
+PREVIOUS_LABEL = '« قبلی'
+NEXT_LABEL = 'بعدی »'
+
+
+def page_items(data):
+    """Splits a paginated API payload into ``(items, total)``."""
+    return data['results'], data['count']
+
+
+def slice_page(items, offset, page_size=PAGE_SIZE):
+    """One page of an in-memory list (e.g. the cached catalog) as ``(items, total)``."""
+    offset = max(offset, 0)  # A negative offset would slice from the end
+    return items[offset:offset + page_size], len(items)
+
+
+def page_keyboard(rows, prefix, offset, total, page_size=PAGE_SIZE):
+    """Returns the rows of one page plus a prev/next row when there are other pages."""
+    rows = list(rows)
+    navigation = []
+    if offset > 0:
+        navigation.append(InlineKeyboardButton(PREVIOUS_LABEL, callback_data=f'{prefix}_{max(offset - page_size, 0)}'))
+    if offset + page_size < total:
+        navigation.append(InlineKeyboardButton(NEXT_LABEL, callback_data=f'{prefix}_{offset + page_size}'))
+    if navigation:
+        rows.append(navigation)
+    return InlineKeyboardMarkup(rows)
+
+
+def cursor_keyboard(rows, prefix, previous_cursor=None, next_cursor=None):
+    """Returns ``rows`` plus a prev/next row for the cursors that are set, or None if that leaves no buttons."""
+    rows = list(rows)
+    navigation = []
+    if previous_cursor:
+        navigation.append(InlineKeyboardButton(PREVIOUS_LABEL, callback_data=f'{prefix}_{previous_cursor}'))
+    if next_cursor:
+        navigation.append(InlineKeyboardButton(NEXT_LABEL, callback_data=f'{prefix}_{next_cursor}'))
+    if navigation:
+        rows.append(navigation)
+    return InlineKeyboardMarkup(rows) if rows else None
+
+
+async def show_page(query, text, reply_markup, edit=False):
+    """Sends the first page as a new message; page turns only replace its keyboard."""
+    if edit:
+        await query.edit_message_reply_markup(reply_markup=reply_markup)
+    else:
+        await query.message.reply_text(text, reply_markup=reply_markup)
@@ -0,0 +1,88 @@
+"""
+Per-worker startup and shutdown of the Telegram application.
+
+asgi.py wraps Django in ``LifespanMiddleware``, so the ASGI server's
+lifespan events initialize the Application (with its persistence and the
+pooled API client) once per worker, on the loop that serves its requests,
+before the first request arrives, and shut it down when the worker stops.
+``telegram/ready/`` answers 503 until then, so probes and load balancers
+only route to workers that are ready.
+
+Servers without lifespan support leave the state at 'lazy': the webhook
+initializes the application with the first update, as before.
+"""
+import logging
+import os
+import time
+from django.http import JsonResponse
+from .metrics import STARTUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 'lazy' (no lifespan events), 'starting', 'ready', 'failed' or 'stopping'
+state = 'lazy'
+startup_seconds = None
+READY_STATES = ('lazy', 'ready')
+
+
+def accepting_updates():
+    """Whether the webhook may process updates in this worker right now."""
+    return state in READY_STATES
+
+
+async def startup():
+    from .views import initialize_telegram_app
+    await initialize_telegram_app()
+
+
+async def shutdown():
+    from .views import shutdown_telegram_app
+    await shutdown_telegram_app()
+
+
+class LifespanMiddleware:
+    """Runs ``on_startup``/``on_shutdown`` on ASGI lifespan events and passes everything else to ``app``."""
+
+    def __init__(self, app, on_startup=startup, on_shutdown=shutdown):
+        self.app = app
+        self.on_startup = on_startup
+        self.on_shutdown = on_shutdown
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+        global state, startup_seconds
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                state, started = 'starting', time.perf_counter()
+                try:
+                    await self.on_startup()
+                except Exception as e:
+                    state = 'failed'
+                    logger.error(f"Worker {os.getpid()} failed to start: {e}", exc_info=True)
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                startup_seconds = time.perf_counter() - started
+                STARTUP_SECONDS.observe(startup_seconds)
+                state = 'ready'
+                logger.info(f"Worker {os.getpid()} ready in {startup_seconds:.3f}s.")
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                state = 'stopping'
+                try:
+                    await self.on_shutdown()
+                except Exception as e:
+                    logger.error(f"Worker {os.getpid()} failed to shut down cleanly: {e}", exc_info=True)
+                    await send({'type': 'lifespan.shutdown.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def ready_view(request):
+    """Readiness probe: 200 once this worker can process updates, 503 otherwise."""
+    return JsonResponse(
+        {'status': state, 'startup_seconds': startup_seconds},
+        status=200 if accepting_updates() else 503,
+    )
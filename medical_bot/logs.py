@@ -0,0 +1,165 @@
+"""
+Non-blocking logging and the webhook log viewer.
+
+Handlers only put records on a bounded in-memory queue; a listener thread
+formats them and writes them to stderr and, when LOG_FILE is set, to a
+rotating log file. A request thread therefore never waits on console or
+disk I/O: it merges the message arguments and enqueues, while timestamps,
+the format string and tracebacks are rendered in the listener. When the
+queue is full the record is dropped and counted instead of blocking.
+
+``SamplingFilter`` keeps only a fraction of the records below WARNING from
+chatty loggers, configured with LOG_SAMPLE_RATES, e.g.
+``httpx=0.05,orders.models=0.2`` (the longest matching logger prefix wins).
+
+``tail_lines`` reads a log file backwards from a byte offset, so the viewer
+at telegram/logs/ costs the same however large the file has grown.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+TAIL_BLOCK_SIZE = 8192
+
+
+def parse_sample_rates(value):
+    """``'httpx=0.05,orders=0.5'`` -> ``{'httpx': 0.05, 'orders': 0.5}``."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, rate = item.partition('=')
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Passes records below WARNING from the configured loggers with the given probability."""
+
+    def __init__(self, rates=None, random=random.random):
+        super().__init__()
+        self.rates = parse_sample_rates(rates) if isinstance(rates, str) else dict(rates or {})
+        self._random = random
+        self._resolved = {}  # Logger name -> rate of its longest configured prefix
+
+    def rate(self, name):
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate, prefix = 1.0, name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition('.')[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1.0 or self._random() < rate
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a listener thread that writes them to ``targets``.
+
+    Started once per process: a forked worker (gunicorn, Celery prefork)
+    gets a fresh queue and listener with its first record, since threads
+    don't survive the fork.
+    """
+
+    def __init__(self, targets, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.targets = targets
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._start()
+        atexit.register(self.close)
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:  # Forked: the parent's listener thread isn't running here
+                self.queue = queue.Queue(self.maxsize)
+            self.listener = logging.handlers.QueueListener(self.queue, *self.targets, respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Merge the arguments now (they may change once we return); everything else is formatted by the listener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        super().emit(record)
+
+    def close(self):
+        with self._start_lock:
+            if self.listener is not None and self._pid == os.getpid():
+                self.listener.stop()  # Writes out what is still queued
+                self.listener = None
+        for target in self.targets:
+            target.close()
+        super().close()
+
+
+def build_queue_handler(filename='', max_bytes=10 * 1024 * 1024, backup_count=5, maxsize=10000):
+    """Factory for ``LOGGING``: a queue handler writing to stderr and, if given, ``filename``."""
+    formatter = logging.Formatter(LOG_FORMAT)
+    targets = [logging.StreamHandler()]
+    if filename:
+        targets.append(logging.handlers.RotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True,
+        ))
+    for target in targets:
+        target.setFormatter(formatter)
+    return QueueHandler(targets, maxsize)
+
+
+def tail_lines(path, limit, before=None, block_size=TAIL_BLOCK_SIZE):
+    """
+    Returns up to ``limit`` lines that end before byte offset ``before``
+    (default: the end of the file), oldest first, and the offset where the
+    first of them starts, to pass as ``before`` for the previous page (0
+    when the start of the file was reached).
+
+    Reads whole blocks backwards from ``before``, stopping once enough
+    lines were found, so a page costs about ``limit`` lines of I/O.
+    """
+    with open(path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size if before is None else min(before, size)
+        position, data = end, b''
+        while position > 0 and data.count(b'\n') <= limit:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    if not data:
+        return [], end
+    terminated = data.endswith(b'\n')
+    lines = data.split(b'\n')
+    if terminated:
+        lines.pop()  # Nothing after the final newline
+    # The first line read may have started before ``position``; with enough lines read it is never returned
+    lines = lines[-limit:] if limit else []
+    start = end - len(b'\n'.join(lines)) - (1 if terminated and lines else 0)
+    return [line.decode('utf-8', errors='replace') for line in lines], start
@@ -0,0 +1,233 @@
+"""
+Latency metrics in the Prometheus text format, served at telegram/metrics/.
+
+The endpoint (like the webhook stats and log viewer) is wrapped in
+``monitoring_view``: staff users, or scrapers sending
+``Authorization: Bearer <MONITORING_TOKEN>``, only.
+
+Histograms live in process memory and cost a lock and a bisect per
+observation. Each worker process serves its own numbers, so scrape every
+worker (or aggregate with ``sum by``) when running several.
+
+Recorded:
+  bot_handler_duration_seconds     handler latency by callback route or conversation state
+  bot_api_request_duration_seconds bot -> API call latency by endpoint (HTTP or local backend)
+  telegram_update_duration_seconds webhook receipt -> handlers and persistence done
+  http_request_duration_seconds    Django view latency
+  http_request_db_queries          database queries per request
+  http_request_db_duration_seconds database time per request
+  app_startup_duration_seconds     worker startup until ready (ASGI lifespan)
+"""
+import functools
+import hmac
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, JsonResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+STARTUP_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Numeric path segments are collapsed so endpoints don't explode into one series per object
+ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key))
+            prefix = labels + ',' if labels else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                yield f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}'
+            yield f'{self.name}_bucket{{{prefix}le="+Inf"}} {values[-2]}'
+            block = f'{{{labels}}}' if labels else ''
+            yield f'{self.name}_count{block} {values[-2]}'
+            yield f'{self.name}_sum{block} {values[-1]}'
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+HANDLER_SECONDS = Histogram(
+    'bot_handler_duration_seconds', 'Bot handler latency by callback route or conversation state.', ['kind', 'handler'],
+)
+API_SECONDS = Histogram(
+    'bot_api_request_duration_seconds', 'Bot to API call latency by endpoint.', ['backend', 'method', 'endpoint', 'status'],
+)
+UPDATE_SECONDS = Histogram(
+    'telegram_update_duration_seconds', 'Time from webhook receipt until an update was processed and persisted.', ['mode'],
+)
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Django view latency.', ['view', 'method', 'status'],
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per request.', ['view'], buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_SECONDS = Histogram(
+    'http_request_db_duration_seconds', 'Database time per request.', ['view'],
+)
+STARTUP_SECONDS = Histogram(
+    'app_startup_duration_seconds', 'Time a worker took to initialize the Telegram application.', [], buckets=STARTUP_BUCKETS,
+)
+REGISTRY = [
+    HANDLER_SECONDS, API_SECONDS, UPDATE_SECONDS, REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_DB_SECONDS, STARTUP_SECONDS,
+]
+
+
+def render():
+    return '\n'.join(histogram.render() for histogram in REGISTRY) + '\n'
+
+
+def has_monitoring_access(request):
+    token = settings.MONITORING_TOKEN
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode()):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_active and user.is_staff)
+
+
+def monitoring_view(view):
+    """Refuses the view (403) to everyone but staff users and holders of MONITORING_TOKEN."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not has_monitoring_access(request):
+            return JsonResponse({'error': 'Forbidden'}, status=403)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint."""
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def endpoint_label(path):
+    """``users/family-members/12/`` -> ``users/family-members/{id}/``."""
+    return ID_SEGMENT.sub('/{id}', '/' + str(path).lstrip('/'))[1:]
+
+
+def observe_route(pattern, seconds):
+    """``CallbackRouter`` timing hook."""
+    HANDLER_SECONDS.observe(seconds, kind='callback', handler=pattern)
+
+
+def timed_handler(callback, kind, handler):
+    """Wraps a PTB handler callback to record its latency."""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, kind=kind, handler=handler)
+    return wrapper
+
+
+# Per-request database counters: [queries, seconds], or None outside a request.
+# A context variable reaches the threads sync_to_async runs ORM code in.
+_db_stats = ContextVar('request_db_stats', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _db_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - started
+
+
+def install_query_recorder(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+class MetricsMiddleware:
+    """Records view latency and the database queries each request made."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):  # Opened before this module was imported
+            install_query_recorder(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token, started = _db_stats.set([0, 0.0]), time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stats = _db_stats.get()
+            _db_stats.reset(token)
+        self._observe(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        token, started = _db_stats.set([0, 0.0]), time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stats = _db_stats.get()
+            _db_stats.reset(token)
+        self._observe(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def _observe(self, request, response, stats, seconds):
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        REQUEST_SECONDS.observe(seconds, view=view, method=request.method, status=response.status_code)
+        REQUEST_QUERIES.observe(stats[0], view=view)
+        REQUEST_DB_SECONDS.observe(stats[1], view=view)
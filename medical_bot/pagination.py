@@ -0,0 +1,151 @@
+import re
+from datetime import datetime, timedelta, timezone
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+CURSOR_RE = re.compile(r'([np])([0-9a-f]{1,16})\.([0-9a-f]{1,16})')
+MAX_PK = 2 ** 63 - 1  # bigint; larger keys would fail in the database instead of here
+
+
+class OptionalLimitOffsetPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination that only applies when the request sends ``limit``.
+
+    Without it, list endpoints keep returning plain arrays, so existing
+    clients are unaffected; the bot asks for one keyboard page at a time.
+    """
+    max_limit = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.limit_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+def clamp(limit, max_limit):
+    """``limit`` within ``0..max_limit``."""
+    return max(0, min(limit, max_limit))
+
+
+def paginate(queryset, serializer_class, limit=None, offset=0):
+    """
+    In-process counterpart of ``OptionalLimitOffsetPagination``.
+
+    Returns the serialized list without ``limit``, otherwise
+    ``{'count': ..., 'results': [...]}`` for the requested slice.
+    """
+    if limit is None:
+        return serializer_class(queryset, many=True).data
+    # Querysets can't be sliced with negative bounds; crafted callback data may carry them
+    limit, offset = clamp(limit, OptionalLimitOffsetPagination.max_limit), max(offset, 0)
+    return {'count': queryset.count(), 'results': serializer_class(queryset[offset:offset + limit], many=True).data}
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over ``ordering``: a datetime field, then the primary key.
+
+    Like ``OptionalLimitOffsetPagination`` it only applies when the request
+    sends ``limit``. Pages start after (or, going back, before) the row in
+    ``?cursor=``, so the database seeks through the index instead of
+    counting past an offset and a deep page costs as much as the first.
+    Responses carry ``next_cursor``/``previous_cursor`` (None at either
+    end) and the matching ``next``/``previous`` URLs, but no total count.
+    """
+    ordering = ('scheduled_time', 'id')
+    max_limit = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if 'limit' not in request.query_params:
+            return None
+        try:
+            limit = int(request.query_params['limit'])
+        except ValueError:
+            raise ValidationError({'limit': 'A whole number is required.'})
+        self.request = request
+        page, self.next_cursor, self.previous_cursor = keyset_page(
+            queryset, self.ordering, clamp(limit, self.max_limit), request.query_params.get('cursor'),
+        )
+        return page
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), 'cursor', cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self._link(self.next_cursor),
+            'previous': self._link(self.previous_cursor),
+            'next_cursor': self.next_cursor,
+            'previous_cursor': self.previous_cursor,
+            'results': data,
+        })
+
+
+def encode_cursor(direction, item, ordering):
+    """``'n'`` (rows after ``item``) or ``'p'`` (rows before it) plus its key, e.g. ``n62a1c3e5f2b40.1f``."""
+    moment, pk = (getattr(item, name) for name in ordering)
+    micros = (moment - EPOCH) // timedelta(microseconds=1)
+    return f'{direction}{micros:x}.{pk:x}'
+
+
+def decode_cursor(cursor):
+    """Returns ``(direction, (moment, pk))``; raises ``ValidationError`` for a malformed cursor."""
+    # int(..., 16) alone would also take whitespace, signs, underscores and non-ASCII digits
+    match = CURSOR_RE.fullmatch(cursor)
+    if match is None or int(match[3], 16) > MAX_PK:
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+    direction, micros, pk = match[1], int(match[2], 16), int(match[3], 16)
+    try:
+        return direction, (EPOCH + timedelta(microseconds=micros), pk)
+    except OverflowError:
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+
+
+def keyset_page(queryset, ordering, limit, cursor=None):
+    """
+    Returns ``(rows, next_cursor, previous_cursor)`` for ``limit`` rows of
+    ``queryset`` in ``ordering`` order, starting at ``cursor`` (None: the first page).
+    """
+    first, second = ordering
+    direction, key = decode_cursor(cursor) if cursor else ('n', None)
+    if direction == 'n':
+        rows = queryset.order_by(first, second)
+        if key is not None:
+            rows = rows.filter(Q(**{f'{first}__gt': key[0]}) | Q(**{first: key[0], f'{second}__gt': key[1]}))
+    else:
+        rows = queryset.order_by(f'-{first}', f'-{second}')
+        rows = rows.filter(Q(**{f'{first}__lt': key[0]}) | Q(**{first: key[0], f'{second}__lt': key[1]}))
+    rows = list(rows[:limit + 1])  # One extra row tells whether there is another page this way
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == 'p':
+        rows.reverse()
+    if not rows:
+        return rows, None, None
+    # Coming from a cursor, the rows it was taken from lie the other way
+    has_next = more if direction == 'n' else True
+    has_previous = more if direction == 'p' else key is not None
+    return (
+        rows,
+        encode_cursor('n', rows[-1], ordering) if has_next else None,
+        encode_cursor('p', rows[0], ordering) if has_previous else None,
+    )
+
+
+def paginate_keyset(queryset, serializer_class, ordering, limit=None, cursor=None):
+    """
+    In-process counterpart of ``KeysetPagination``.
+
+    Returns the serialized list without ``limit``, otherwise
+    ``{'next_cursor': ..., 'previous_cursor': ..., 'results': [...]}``.
+    """
+    if limit is None:
+        return serializer_class(queryset.order_by(*ordering), many=True).data
+    rows, next_cursor, previous_cursor = keyset_page(queryset, ordering, clamp(limit, KeysetPagination.max_limit), cursor)
+    return {'next_cursor': next_cursor, 'previous_cursor': previous_cursor, 'results': serializer_class(rows, many=True).data}
@@ -0,0 +1,263 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import pickle
+import sqlite3
+import threading
+from decouple import config
+from telegram import Update
+from telegram.ext import BasePersistence, ConversationHandler, PersistenceInput, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+# redis://... for production, sqlite:///path/to/file.db as a local/test stand-in, empty to disable
+BOT_PERSISTENCE_URL = config('BOT_PERSISTENCE_URL', default='')
+
+
+class RedisStore:
+    """Key/value store backed by Redis, shared by every worker."""
+
+    def __init__(self, url, prefix='bot:'):
+        import redis.asyncio as redis  # Only needed when Redis persistence is configured
+        self._redis = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key):
+        return await self._redis.get(self.prefix + key)
+
+    async def write(self, items):
+        """Applies ``{key: bytes or None}`` in one round trip; None deletes the key."""
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                if value is None:
+                    pipe.delete(self.prefix + key)
+                else:
+                    pipe.set(self.prefix + key, value)
+            await pipe.execute()
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+class SQLiteStore:
+    """Key/value store in a local SQLite file, for tests and single-host setups."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS bot_persistence (key TEXT PRIMARY KEY, value BLOB NOT NULL)')
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM bot_persistence WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _write(self, items):
+        with self._lock, self._conn:
+            for key, value in items.items():
+                if value is None:
+                    self._conn.execute('DELETE FROM bot_persistence WHERE key = ?', (key,))
+                else:
+                    self._conn.execute('INSERT OR REPLACE INTO bot_persistence (key, value) VALUES (?, ?)', (key, value))
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._get, key)
+
+    async def write(self, items):
+        await asyncio.to_thread(self._write, items)
+
+    async def close(self):
+        self._conn.close()
+
+
+class SharedPersistence(BasePersistence):
+    """
+    PTB persistence for ``user_data`` and conversation states on a shared store.
+
+    * Lazy: nothing is loaded at startup; a user's data and conversation
+      state are read when one of their updates arrives.
+    * Dirty-only: values are pickled and compared with the last version read
+      or written, so unchanged entries are never rewritten.
+    * Batched: writes are buffered and sent to the store in one batch, either
+      right after PTB's persistence round or from ``flush()``.
+    """
+
+    def __init__(self, store, update_interval=60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.store = store
+        self._digests = {}  # key -> digest of the value last read from / written to the store
+        self._pending = {}  # key -> pickled value, or None for deletion
+        self._flush_lock = asyncio.Lock()
+        self._flush_scheduled = False
+
+    @staticmethod
+    def _user_key(user_id):
+        return f'user:{user_id}'
+
+    @staticmethod
+    def _conversation_key(name, key):
+        return f'conv:{name}:' + ':'.join(str(part) for part in key)
+
+    async def _load(self, key):
+        value = await self.store.get(key)
+        if value is None:
+            self._digests.pop(key, None)
+            return None
+        self._digests[key] = hashlib.blake2b(value, digest_size=16).digest()
+        return pickle.loads(value)
+
+    def _stage(self, key, data):
+        """Buffers a write if ``data`` differs from what the store holds."""
+        if data is None:
+            if key in self._digests or key in self._pending:
+                self._digests.pop(key, None)
+                self._pending[key] = None
+        else:
+            value = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+            digest = hashlib.blake2b(value, digest_size=16).digest()
+            if self._digests.get(key) == digest:
+                return
+            self._digests[key] = digest
+            self._pending[key] = value
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        # PTB gathers all update_* calls of one persistence round in the same
+        # loop iteration, so a flush scheduled for the next iteration batches them.
+        if self._flush_scheduled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._flush_scheduled = True
+        loop.call_soon(lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        """Writes every buffered change to the store in one batch."""
+        async with self._flush_lock:
+            self._flush_scheduled = False
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            try:
+                await self.store.write(pending)
+            except Exception:
+                # Keep the changes for the next flush, without overwriting newer ones
+                self._pending = {**pending, **self._pending}
+                raise
+            logger.debug("Persisted %d bot entries.", len(pending))
+
+    # user_data: loaded per user right before each of their updates
+
+    async def get_user_data(self):
+        return {}
+
+    async def refresh_user_data(self, user_id, user_data):
+        key = self._user_key(user_id)
+        if key in self._pending:
+            return  # Newer than the store; it was written by this process
+        stored = await self._load(key)
+        user_data.clear()
+        if stored:
+            user_data.update(stored)
+
+    async def update_user_data(self, user_id, data):
+        self._stage(self._user_key(user_id), data or None)
+
+    async def drop_user_data(self, user_id):
+        self._stage(self._user_key(user_id), None)
+
+    # Conversation states: loaded per update by load_conversations()
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        self._stage(self._conversation_key(name, key), new_state)
+
+    async def load_conversations(self, update, context):
+        """
+        Loads the stored conversation states for the update's user and chat.
+
+        Registered by ``install`` as a group -1 handler so it runs before the
+        ConversationHandlers look up their state. PTB only reads conversations
+        once at startup, so the state is injected into each handler's tracking
+        dict (PTB 20.x internals) without marking it as changed.
+        """
+        for handler in itertools.chain.from_iterable(context.application.handlers.values()):
+            if not (isinstance(handler, ConversationHandler) and handler.persistent):
+                continue
+            try:
+                key = handler._get_key(update)
+            except RuntimeError:
+                continue
+            store_key = self._conversation_key(handler.name, key)
+            if store_key in self._pending:
+                continue
+            state = await self._load(store_key)
+            # Write to the TrackingDict's underlying dict so the load isn't seen as a change
+            conversations = getattr(handler._conversations, 'data', handler._conversations)
+            if state is None or state == ConversationHandler.END:
+                conversations.pop(key, None)
+            else:
+                conversations[key] = state
+
+    def install(self, application):
+        """Registers the conversation loader on an application using this persistence."""
+        application.add_handler(TypeHandler(Update, self.load_conversations), group=-1)
+
+    # chat_data, bot_data and callback_data are not persisted
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+
+def build_persistence(url=BOT_PERSISTENCE_URL):
+    """Returns a SharedPersistence for ``url``, or None if persistence is disabled."""
+    if not url:
+        return None
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        store = RedisStore(url)
+    elif url.startswith('sqlite:///'):
+        store = SQLiteStore(url[len('sqlite:///'):])
+    else:
+        raise ValueError(f"Unsupported BOT_PERSISTENCE_URL: {url}")
+    logger.info(f"Using shared bot persistence ({type(store).__name__}).")
+    return SharedPersistence(store)
+
+
+async def persist(application):
+    """Hands the application's changed data to the persistence and writes it out."""
+    if application.persistence is not None:
+        await application.update_persistence()
+        await application.persistence.flush()
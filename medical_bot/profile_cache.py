@@ -0,0 +1,72 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileCache:
+    """
+    In-process cache of ``users/profile/me/`` payloads keyed by Telegram user id.
+
+    Entries expire after ``ttl`` seconds and the least recently used entry is
+    evicted once ``maxsize`` entries are stored. Bot write paths call
+    ``invalidate`` or ``patch`` so reads never serve data the bot itself has
+    just changed.
+    """
+
+    def __init__(self, ttl=300, maxsize=1024, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._entries = OrderedDict()  # user_id -> (expires_at, profile)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id):
+        """Returns the cached profile, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= self._clock():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user_id, profile):
+        with self._lock:
+            self._entries[user_id] = (self._clock() + self.ttl, profile)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def patch(self, user_id, **fields):
+        """Updates top-level fields of a cached profile in place, keeping its expiry."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                entry[1].update(fields)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Process-wide cache shared by all bot handlers
+profile_cache = ProfileCache(
+    ttl=config('PROFILE_CACHE_TTL', default=300, cast=int),
+    maxsize=config('PROFILE_CACHE_SIZE', default=1024, cast=int),
+)
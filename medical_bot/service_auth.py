@@ -0,0 +1,38 @@
+"""
+HMAC request signing between the bot and the API.
+
+The bot signs every API call with the shared BOT_API_SECRET: the signature
+covers the method, the path with its query string (which carries the acting
+user's ``telegram_id``) and a Unix timestamp. The API recomputes it in
+``users.authentication.BotServiceAuthentication`` and rejects requests whose
+timestamp is more than BOT_API_MAX_SKEW seconds off. Request bodies are not
+signed, so uploads can stream; their integrity is left to TLS.
+"""
+import hashlib
+import hmac
+import time
+
+SIGNATURE_HEADER = 'X-Bot-Signature'
+TIMESTAMP_HEADER = 'X-Bot-Timestamp'
+
+
+def sign(secret, method, full_path, timestamp):
+    """Hex HMAC-SHA256 of ``METHOD\\n/path/?query\\ntimestamp``."""
+    message = f'{method.upper()}\n{full_path}\n{timestamp}'.encode('utf-8')
+    return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+def signature_headers(secret, method, full_path, now=None):
+    timestamp = str(int(time.time() if now is None else now))
+    return {TIMESTAMP_HEADER: timestamp, SIGNATURE_HEADER: sign(secret, method, full_path, timestamp)}
+
+
+def verify(secret, method, full_path, timestamp, signature, max_skew, now=None):
+    """Whether ``signature`` is valid and ``timestamp`` within ``max_skew`` seconds of now."""
+    try:
+        skew = abs((time.time() if now is None else now) - int(timestamp))
+    except (TypeError, ValueError):
+        return False
+    if skew > max_skew:
+        return False
+    return hmac.compare_digest(sign(secret, method, full_path, timestamp), signature or '')
@@ -32,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'medical_bot.metrics.MetricsMiddleware',  # First, so it times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -77,6 +78,22 @@ DATABASES = {
     )
 }
 
+# Cache (point CACHE_URL at Redis to share cached state between workers)
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -104,6 +121,20 @@ STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Service catalog snapshot (services/catalog.py): rebuilt on changes, and at least this often (seconds)
+SERVICE_CATALOG_TTL = config('SERVICE_CATALOG_TTL', default=300, cast=int)
+
+# Document uploads (streamed to storage by users/documents/upload/)
+DOCUMENT_MAX_UPLOAD_SIZE = config('DOCUMENT_MAX_UPLOAD_SIZE', default=20 * 1024 * 1024, cast=int)  # Telegram's bot download limit
+DOCUMENT_ALLOWED_TYPES = ['application/pdf', 'image/jpeg', 'image/png']
+
+# Appointment booking (orders.availability)
+ORDER_SLOT_CAPACITY = config('ORDER_SLOT_CAPACITY', default=1, cast=int)  # Appointments that can run at the same time
+ORDER_OPENING_HOUR = config('ORDER_OPENING_HOUR', default=8, cast=int)
+ORDER_CLOSING_HOUR = config('ORDER_CLOSING_HOUR', default=18, cast=int)  # Appointments must end by then
+ORDER_SLOT_STEP = config('ORDER_SLOT_STEP', default=60, cast=int)  # Minutes between offered start times
+ORDER_BOOKING_DAYS = config('ORDER_BOOKING_DAYS', default=7, cast=int)  # Days ahead the bot offers, today included
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -113,18 +144,47 @@ AUTH_USER_MODEL = 'users.CustomUser'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'users.authentication.BotServiceAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'medical_bot.pagination.OptionalLimitOffsetPagination',
 }
 
+# Bot -> API request signing (medical_bot/service_auth.py); the bot must use the same secret
+BOT_API_SECRET = config('BOT_API_SECRET', default='')
+BOT_API_MAX_SKEW = config('BOT_API_MAX_SKEW', default=300, cast=int)  # Seconds a signed request stays valid
+BOT_AUTH_CACHE_TTL = config('BOT_AUTH_CACHE_TTL', default=60, cast=int)  # Seconds a Telegram id -> user lookup is cached
+
 # Celery settings
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default='redis://localhost:6379/0')
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
-CELERY_TIMEZONE = 'Asia/Tehran'
\ No newline at end of file
+CELERY_TIMEZONE = 'Asia/Tehran'
+
+# Bearer token for telegram/metrics/, telegram/stats/ and telegram/logs/ (staff users need none)
+MONITORING_TOKEN = config('MONITORING_TOKEN', default='')
+
+# Logging (medical_bot.logs): records are queued and written by a background thread
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+LOG_FILE = config('LOG_FILE', default='')  # e.g. webhook_logs.log, shown at telegram/logs/
+LOG_SAMPLE_RATES = config('LOG_SAMPLE_RATES', default='')  # e.g. httpx=0.05: share of sub-WARNING records kept
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sampling': {'()': 'medical_bot.logs.SamplingFilter', 'rates': LOG_SAMPLE_RATES},
+    },
+    'handlers': {
+        'queue': {'()': 'medical_bot.logs.build_queue_handler', 'filename': LOG_FILE, 'filters': ['sampling']},
+    },
+    'root': {'handlers': ['queue'], 'level': LOG_LEVEL},
+    'loggers': {
+        'django': {'handlers': ['queue'], 'level': 'INFO', 'propagate': False},
+    },
+}
@@ -1,32 +1,34 @@
 from celery import shared_task
-from django.conf import settings
-from telegram import Bot
-import jdatetime
+from django.utils import timezone
 from users.models import CustomUser
+from . import jalali
+from .dispatcher import get_dispatcher
 import logging
 
 logger = logging.getLogger(__name__)
 
-@shared_task(bind=True, retry_backoff=True)  # Enable retries with backoff
-def send_birthday_messages(self):
-    """Sends birthday messages to users on their birthday."""
+@shared_task
+def send_birthday_messages():
+    """
+    Sends birthday messages to users on their birthday.
 
-    bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
-    today = jdatetime.date.today()
-    users = CustomUser.objects.filter(birth_date__isnull=False)
+    Transient failures are retried per message by the dispatcher, so one
+    failed send no longer reruns the task (and re-greets everyone else).
+    """
+    year, month, day = jalali.to_jalali(timezone.localdate())
+    # Gregorian dates that fall on today's Jalali month/day, so the database does the matching
+    users = list(CustomUser.objects.filter(
+        birth_date__in=jalali.anniversaries(month, day, year - 120, year), telegram_id__isnull=False,
+    ))
+    if not users:
+        return
 
-    for user in users:
-        try:
-            birth_date = jdatetime.date.fromgregorian(date=user.birth_date)
-            if birth_date.month == today.month and birth_date.day == today.day:
-                message = f"تولدت مبارک، {user.full_name}! 🎉 امیدواریم روز خاصی داشته باشی!"
-                bot.send_message(chat_id=user.id, text=message)
-                logger.info(f"Birthday message sent to {user.phone_number}")
-
-        except Exception as exc:
-            logger.error(f"Error sending birthday message to {user.phone_number}: {exc}", exc_info=True)
-            # Retry the task, but with a maximum number of retries
-            if self.request.retries < 3:  # Retry a maximum of 3 times
-                raise self.retry(exc=exc, countdown=5)  # Retry after 5 seconds
-            else:
-                logger.error(f"Max retries reached for {user.phone_number}")
\ No newline at end of file
+    messages = [
+        {'chat_id': user.telegram_id, 'text': f"تولدت مبارک، {user.full_name}! 🎉 امیدواریم روز خاصی داشته باشی!"}
+        for user in users
+    ]
+    for user, result in zip(users, get_dispatcher().send_many(messages)):
+        if isinstance(result, Exception):
+            logger.error(f"Error sending birthday message to {user.phone_number}: {result}")
+        else:
+            logger.info(f"Birthday message sent to {user.phone_number}")
\ No newline at end of file
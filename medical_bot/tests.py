@@ -0,0 +1,843 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+import httpx
+import jdatetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qsl
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.test import AsyncClient
+from rest_framework.test import APIClient
+from django.utils import timezone
+from telegram import Update
+from telegram.error import Forbidden, NetworkError, RetryAfter
+from telegram.ext import Application, CallbackQueryHandler, ConversationHandler
+from .profile_cache import ProfileCache
+from .callback_router import CallbackRouter
+from .persistence import SharedPersistence, SQLiteStore
+from .update_queue import UpdateQueue
+from .dedup import UpdateDeduplicator
+from .backends import HTTPBackend, LocalBackend
+from .api_client import APIClient as BotAPIClient
+from .service_auth import SIGNATURE_HEADER, TIMESTAMP_HEADER, verify
+from .keyboards import page_keyboard, slice_page
+from . import dispatcher as dispatcher_module
+from .dispatcher import OutboundDispatcher, TokenBucket, get_dispatcher, shutdown_dispatcher
+from .metrics import Histogram, REQUEST_QUERIES, _db_stats, endpoint_label, render
+from .lifespan import LifespanMiddleware
+from .logs import QueueHandler, SamplingFilter, tail_lines
+from . import lifespan
+from . import jalali
+from users.models import CustomUser, Address, Document, FamilyMember
+from orders.models import Order
+from services.models import ServiceCategory, Service
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ProfileCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ProfileCache(ttl=60, maxsize=2, clock=self.clock)
+
+    def test_get_returns_cached_profile_until_ttl(self):
+        self.cache.set(1, {'full_name': 'Test User'})
+        self.assertEqual(self.cache.get(1), {'full_name': 'Test User'})
+        self.clock.now = 61
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set(1, {'id': 1})
+        self.cache.set(2, {'id': 2})
+        self.cache.get(1)  # 2 is now the least recently used
+        self.cache.set(3, {'id': 3})
+        self.assertIsNone(self.cache.get(2))
+        self.assertIsNotNone(self.cache.get(1))
+        self.assertIsNotNone(self.cache.get(3))
+
+    def test_patch_and_invalidate(self):
+        self.cache.set(1, {'region': ''})
+        self.cache.patch(1, region='تهران')
+        self.assertEqual(self.cache.get(1)['region'], 'تهران')
+        self.cache.invalidate(1)
+        self.assertIsNone(self.cache.get(1))
+        self.cache.patch(1, region='تهران')  # no-op for missing entries
+        self.assertIsNone(self.cache.get(1))
+
+
+class CallbackRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = CallbackRouter()
+        self.calls = []
+
+        async def handler(update, context, **params):
+            self.calls.append(params)
+            return 7
+
+        for pattern in ('cancel_order', 'cancel_<int:order_id>', 'edit_fm_<int:fm_id>', 'edit_profile'):
+            self.router.add_route(pattern, handler)
+
+    def test_resolve_exact_and_parameterized_routes(self):
+        route, params = self.router.resolve('cancel_order')
+        self.assertEqual((route.pattern, params), ('cancel_order', {}))
+        route, params = self.router.resolve('cancel_42')
+        self.assertEqual((route.pattern, params), ('cancel_<int:order_id>', {'order_id': 42}))
+        route, params = self.router.resolve('edit_fm_3')
+        self.assertEqual((route.pattern, params), ('edit_fm_<int:fm_id>', {'fm_id': 3}))
+
+    def test_unknown_or_mistyped_data_does_not_match(self):
+        for data in ('cancel_abc', 'edit_fm_', 'edit_fm_3_4', 'unknown', None):
+            self.assertEqual(self.router.resolve(data), (None, None))
+
+    def test_pattern_limits_routes(self):
+        check = self.router.pattern('edit_profile', 'cancel_<int:order_id>')
+        self.assertTrue(check('edit_profile'))
+        self.assertTrue(check('cancel_5'))
+        self.assertFalse(check('cancel_order'))
+        self.assertFalse(check('edit_fm_5'))
+
+    def test_duplicate_route_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.router.add_route('cancel_<int:order_id>', lambda update, context: None)
+
+    async def test_dispatch_answers_query_and_records_timing(self):
+        answered = []
+
+        async def answer():
+            answered.append(True)
+
+        timings = []
+        self.router.add_timing_hook(lambda route, seconds: timings.append(route))
+        update = SimpleNamespace(callback_query=SimpleNamespace(data='confirm_1', answer=answer))
+        self.assertEqual(await self.router.dispatch(update, None), ConversationHandler.END)
+        update.callback_query.data = 'cancel_9'
+        self.assertEqual(await self.router.dispatch(update, None), 7)
+        self.assertEqual(self.calls, [{'order_id': 9}])
+        self.assertEqual(timings, ['cancel_<int:order_id>'])
+        self.assertEqual(len(answered), 2)
+
+
+class PaginatedKeyboardTests(SimpleTestCase):
+    def navigation(self, markup):
+        return [button.callback_data for button in markup.inline_keyboard[-1]]
+
+    def test_navigation_buttons_carry_offsets(self):
+        rows = [[f'row {index}'] for index in range(8)]
+        self.assertEqual(len(page_keyboard(rows, 'page_fm', 0, 8).inline_keyboard), 8)
+        self.assertEqual(self.navigation(page_keyboard(rows, 'page_fm', 0, 20)), ['page_fm_8'])
+        self.assertEqual(self.navigation(page_keyboard(rows, 'page_fm', 8, 20)), ['page_fm_0', 'page_fm_16'])
+        self.assertEqual(self.navigation(page_keyboard(rows[:4], 'page_srv_3', 16, 20)), ['page_srv_3_8'])
+
+    def test_navigation_callbacks_resolve_to_page_routes(self):
+        router = CallbackRouter()
+        router.add_route('page_srv_<int:category_id>_<int:offset>', lambda update, context, **params: None)
+        route, params = router.resolve(self.navigation(page_keyboard([], 'page_srv_3', 0, 20))[0])
+        self.assertEqual(route.pattern, 'page_srv_<int:category_id>_<int:offset>')
+        self.assertEqual(params, {'category_id': 3, 'offset': 8})
+
+    def test_slice_page(self):
+        self.assertEqual(slice_page(list(range(20)), 16), ([16, 17, 18, 19], 20))
+        self.assertEqual(slice_page(list(range(20)), -4), (list(range(8)), 20))
+
+
+class SharedPersistenceTests(SimpleTestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def make_persistence(self):
+        store = SQLiteStore(self.path)
+        self.writes = []
+        write = store.write
+
+        async def counting_write(items):
+            self.writes.append(dict(items))
+            await write(items)
+        store.write = counting_write
+        return SharedPersistence(store)
+
+    async def test_user_data_is_shared_between_instances(self):
+        worker_a = self.make_persistence()
+        await worker_a.update_user_data(1, {'phone_number': '09123456789'})
+        await worker_a.update_user_data(2, {'phone_number': '09350000000'})
+        await worker_a.flush()
+        self.assertEqual(len(self.writes), 1)  # Both users in one batch
+
+        worker_b = self.make_persistence()
+        user_data = {'stale': True}
+        await worker_b.refresh_user_data(1, user_data)
+        self.assertEqual(user_data, {'phone_number': '09123456789'})
+
+    async def test_unchanged_data_is_not_rewritten(self):
+        persistence = self.make_persistence()
+        await persistence.update_user_data(1, {'phone_number': '09123456789'})
+        await persistence.flush()
+        await persistence.refresh_user_data(1, {})
+        await persistence.update_user_data(1, {'phone_number': '09123456789'})
+        await persistence.flush()
+        self.assertEqual(len(self.writes), 1)
+
+    async def test_conversation_state_is_loaded_per_update(self):
+        async def noop(update, context):
+            pass
+
+        persistence = self.make_persistence()
+        application = Application.builder().token('123:abc').persistence(persistence).build()
+        conversation = ConversationHandler(
+            entry_points=[CallbackQueryHandler(noop)], states={}, fallbacks=[], name='main', persistent=True,
+        )
+        application.add_handler(conversation)
+        update = Update.de_json({
+            'update_id': 1,
+            'message': {'message_id': 1, 'date': 0, 'text': 'Ali', 'chat': {'id': 10, 'type': 'private'},
+                        'from': {'id': 20, 'is_bot': False, 'first_name': 'Ali'}},
+        }, application.bot)
+        context = SimpleNamespace(application=application)
+
+        writer = self.make_persistence()
+        await writer.update_conversation('main', (10, 20), 5)
+        await writer.flush()
+        await persistence.load_conversations(update, context)
+        self.assertEqual(conversation._conversations.get((10, 20)), 5)
+
+        await writer.update_conversation('main', (10, 20), None)
+        await writer.flush()
+        await persistence.load_conversations(update, context)
+        self.assertIsNone(conversation._conversations.get((10, 20)))
+
+
+def make_update(update_id, chat_id):
+    chat = SimpleNamespace(id=chat_id)
+    return SimpleNamespace(update_id=update_id, effective_chat=chat, effective_user=None)
+
+
+class UpdateQueueTests(SimpleTestCase):
+    async def test_updates_keep_order_per_chat_and_run_concurrently_across_chats(self):
+        processed = []
+        running = set()
+        max_running = 0
+
+        async def process(update):
+            nonlocal max_running
+            chat_id = update.effective_chat.id
+            self.assertNotIn(chat_id, running)  # never two updates of one chat at once
+            running.add(chat_id)
+            max_running = max(max_running, len(running))
+            await asyncio.sleep(0.001)
+            running.discard(chat_id)
+            processed.append((chat_id, update.update_id))
+
+        queue = UpdateQueue(process, maxsize=100, workers=4)
+        queue.start()
+        for update_id in range(20):
+            self.assertTrue(queue.put(make_update(update_id, chat_id=update_id % 3)))
+        await queue.stop(timeout=5)
+
+        self.assertEqual(len(processed), 20)
+        for chat_id in range(3):
+            ids = [update_id for chat, update_id in processed if chat == chat_id]
+            self.assertEqual(ids, sorted(ids))
+        self.assertGreater(max_running, 1)
+        self.assertEqual(queue.stats()['processed'], 20)
+
+    async def test_consumers_do_not_inherit_the_starting_requests_context(self):
+        seen = []
+
+        async def process(update):
+            seen.append(_db_stats.get())
+
+        token = _db_stats.set([0, 0.0])  # As inside MetricsMiddleware, where the first webhook starts the queue
+        try:
+            queue = UpdateQueue(process, maxsize=10, workers=2)
+            queue.start()
+        finally:
+            _db_stats.reset(token)
+        self.assertTrue(queue.put(make_update(1, 1)))
+        await queue.stop(timeout=5)
+        self.assertEqual(seen, [None])
+
+    async def test_full_queue_sheds_updates(self):
+        async def process(update):
+            pass
+
+        queue = UpdateQueue(process, maxsize=2, workers=1)
+        self.assertTrue(queue.put(make_update(1, 1)))
+        self.assertTrue(queue.put(make_update(2, 2)))
+        self.assertFalse(queue.put(make_update(3, 3)))
+        self.assertEqual(queue.stats()['shed'], 1)
+        queue.start()  # updates queued before start are picked up
+        await queue.stop(timeout=5)
+        self.assertEqual(queue.stats()['processed'], 2)
+        self.assertEqual(queue.stats()['depth'], 0)
+
+
+class UpdateDeduplicatorTests(SimpleTestCase):
+    async def test_duplicates_are_dropped_within_window(self):
+        dedup = UpdateDeduplicator(window=2)
+        self.assertTrue(await dedup.claim(1))
+        self.assertFalse(await dedup.claim(1))
+        self.assertTrue(await dedup.claim(2))
+        self.assertTrue(await dedup.claim(3))  # evicts 1
+        self.assertTrue(await dedup.claim(1))
+        stats = dedup.stats()
+        self.assertEqual((stats['accepted'], stats['duplicates'], stats['tracked']), (4, 1, 2))
+        self.assertEqual(stats['hit_rate'], 0.2)
+
+    async def test_released_update_is_accepted_again(self):
+        dedup = UpdateDeduplicator()
+        await dedup.claim(5)
+        await dedup.release(5)
+        self.assertTrue(await dedup.claim(5))
+
+    async def test_shared_cache_catches_duplicates_from_other_workers(self):
+        cache = LocMemCache('dedup-tests', {})
+        worker_a = UpdateDeduplicator(cache=cache)
+        worker_b = UpdateDeduplicator(cache=cache)
+        self.assertTrue(await worker_a.claim(7))
+        self.assertFalse(await worker_b.claim(7))
+        self.assertFalse(await worker_b.claim(7))  # answered by the local window
+
+
+class LocalBackendTests(TestCase):
+    def setUp(self):
+        self.backend = LocalBackend()
+        self.user = CustomUser.objects.create_user(
+            phone_number='09123456789', telegram_id=1001, full_name='Test User', gender='male',
+        )
+
+    async def test_profile_and_family_members(self):
+        response = await self.backend.get_profile(1001)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['full_name'], 'Test User')
+        self.assertEqual((await self.backend.get_profile(1002)).status_code, 404)
+
+        response = await self.backend.link_account(1002, '+989123456789')  # Shared contacts come in this format
+        self.assertEqual(response.json()['full_name'], 'Test User')
+        self.assertEqual((await self.backend.get_profile(1002)).json()['full_name'], 'Test User')
+        self.assertEqual((await self.backend.get_profile(1001)).status_code, 404)
+        self.assertEqual((await self.backend.link_account(1001, '09000000000')).status_code, 404)
+        await self.backend.link_account(1001, '09123456789')
+
+        data = {'full_name': 'Test Child', 'gender': 'female', 'relationship': 'فرزند'}
+        response = await self.backend.save_family_member(1001, data)
+        self.assertEqual(response.status_code, 201)
+        fm_id = response.json()['id']
+        response = await self.backend.save_family_member(1001, {**data, 'full_name': 'Renamed'}, fm_id)
+        self.assertEqual(response.status_code, 200)
+        members = (await self.backend.list_family_members(1001)).json()
+        self.assertEqual([fm['full_name'] for fm in members], ['Renamed'])
+
+        self.assertEqual((await self.backend.delete_family_member(1001, fm_id)).status_code, 204)
+        self.assertEqual((await self.backend.delete_family_member(1001, fm_id)).status_code, 404)
+
+    async def test_list_pages(self):
+        for index in range(5):
+            await FamilyMember.objects.acreate(user=self.user, full_name=f'Member {index}', gender='male', relationship='فرزند')
+        response = await self.backend.list_family_members(1001, limit=2, offset=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 5)
+        self.assertEqual([fm['full_name'] for fm in response.json()['results']], ['Member 2', 'Member 3'])
+        self.assertEqual(len((await self.backend.list_family_members(1001)).json()), 5)
+
+    async def test_negative_offset_and_limit_are_clamped(self):
+        for index in range(3):
+            await FamilyMember.objects.acreate(user=self.user, full_name=f'Member {index}', gender='male', relationship='فرزند')
+        response = await self.backend.list_family_members(1001, limit=2, offset=-3)
+        self.assertEqual([fm['full_name'] for fm in response.json()['results']], ['Member 0', 'Member 1'])
+        self.assertEqual((await self.backend.list_family_members(1001, limit=-1)).json()['results'], [])
+
+    async def test_invalid_data_returns_errors(self):
+        response = await self.backend.save_address(1001, {'title': 'خانه'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('full_address', response.json())
+
+    async def test_orders(self):
+        category = await ServiceCategory.objects.acreate(name='Test Category')
+        service = await Service.objects.acreate(
+            category=category, name='Test Service', description='', price=100, duration=timedelta(hours=1),
+        )
+        address = await Address.objects.acreate(user=self.user, title='خانه', full_address='تهران')
+        data = {
+            'service_id': service.id, 'address_id': address.id, 'recipient_id': None,
+            'scheduled_time': (timezone.now() + timedelta(days=2)).isoformat(),
+        }
+        response = await self.backend.create_order(1001, data)
+        self.assertEqual(response.status_code, 201)
+        order_id = response.json()['id']
+
+        response = await self.backend.confirm_order(1001, order_id)
+        self.assertEqual(response.json()['status'], 'confirmed')
+        self.assertEqual((await self.backend.confirm_order(1002, order_id)).status_code, 404)
+        orders = (await self.backend.list_orders(1001)).json()
+        self.assertEqual([order['id'] for order in orders], [order_id])
+
+        page = (await self.backend.list_cancellable_orders(1001, limit=8)).json()
+        self.assertEqual([(order['id'], order['service_name']) for order in page['results']], [(order_id, 'Test Service')])
+        self.assertEqual((await self.backend.cancel_order(1001, order_id)).json()['status'], 'canceled')
+        self.assertEqual((await self.backend.cancel_order(1001, order_id)).status_code, 400)
+        self.assertEqual((await self.backend.list_cancellable_orders(1001, limit=8)).json()['count'], 0)
+
+    async def test_catalog(self):
+        await ServiceCategory.objects.acreate(name='Test Category')
+        catalog = await self.backend.get_catalog()
+        self.assertEqual([cat['name'] for cat in catalog['categories']], ['Test Category'])
+        self.assertIs(await self.backend.get_catalog(), catalog)  # parsed once per snapshot
+
+    async def test_upload_document(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        data = {'full_name': 'Test Child', 'gender': 'female', 'relationship': 'فرزند'}
+        fm_id = (await self.backend.save_family_member(1001, data)).json()['id']
+        body = b'%PDF-1.4\n' + b'0' * 100
+
+        async def chunks():
+            yield body[:50]
+            yield body[50:]
+
+        with override_settings(MEDIA_ROOT=media_root):
+            response = await self.backend.upload_document(
+                1001, fm_id, 'نسخه پزشک', 'scan.pdf', 'application/pdf', len(body), chunks(),
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(await Document.objects.acount(), 1)
+
+
+@override_settings(BOT_API_SECRET='test-secret')
+class OrderConfirmationTests(TestCase):
+    """Confirming from a reminder behaves the same through both backends."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(phone_number='09123456789', telegram_id=1001, full_name='Test User', gender='male')
+        CustomUser.objects.create_user(phone_number='09120000000', telegram_id=1002, full_name='Other User', gender='female')
+        category = ServiceCategory.objects.create(name='Test Category')
+        self.service = Service.objects.create(category=category, name='Test Service', price=100, duration=timedelta(hours=1))
+        self.address = Address.objects.create(user=self.user, title='خانه', full_address='تهران')
+
+    def http_backend(self):
+        """An ``HTTPBackend`` whose signed requests are served by this project's views."""
+        django_client = AsyncClient()
+
+        async def forward(request):
+            response = await django_client.generic(
+                request.method, request.url.raw_path.decode(), data=request.content,
+                content_type=request.headers.get('Content-Type', ''),
+                headers={name: request.headers[name] for name in (SIGNATURE_HEADER, TIMESTAMP_HEADER)},
+            )
+            return httpx.Response(response.status_code, content=response.content, headers={'Content-Type': response['Content-Type']})
+
+        client = BotAPIClient(base_url='http://testserver/api/', secret='test-secret')
+        client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(forward))
+        return HTTPBackend(client)
+
+    async def confirmation_flow(self, backend):
+        order = await Order.objects.acreate(
+            user=self.user, service=self.service, address=self.address, scheduled_time=timezone.now() + timedelta(days=2),
+        )
+        past = await Order.objects.acreate(
+            user=self.user, service=self.service, address=self.address, scheduled_time=timezone.now() - timedelta(hours=1),
+        )
+        confirmed = await backend.confirm_order(1001, order.id)
+        repeated = await backend.confirm_order(1001, order.id)  # Reminders are sent again for confirmed orders
+        foreign = await backend.confirm_order(1002, order.id)
+        await backend.cancel_order(1001, order.id)
+        canceled = await backend.confirm_order(1001, order.id)
+        late = await backend.confirm_order(1001, past.id)
+        await order.arefresh_from_db()
+        return [
+            (confirmed.status_code, confirmed.json()['status']), (repeated.status_code, repeated.json()['status']),
+            foreign.status_code, canceled.status_code, late.status_code, order.status,
+        ]
+
+    async def test_backends_agree(self):
+        expected = [(200, 'confirmed'), (200, 'confirmed'), 404, 400, 400, 'canceled']
+        self.assertEqual(await self.confirmation_flow(LocalBackend()), expected)
+        backend = self.http_backend()
+        try:
+            self.assertEqual(await self.confirmation_flow(backend), expected)
+        finally:
+            await backend.client.close()
+
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, reply_markup=None):
+        self.replies.append((text, reply_markup))
+
+
+class FakeCallbackQuery:
+    def __init__(self, data=''):
+        self.data = data
+        self.message = FakeMessage()
+
+    async def answer(self):
+        pass
+
+
+class ServiceSelectionTests(TestCase):
+    """The bot's service list is filtered by the chosen recipient's age, through the local backend."""
+
+    def setUp(self):
+        import bot
+        self.bot = bot
+        self.addCleanup(setattr, bot, 'backend', bot.backend)
+        bot.backend = LocalBackend()
+        self.addCleanup(bot.profile_cache.invalidate, 1001)
+        user = CustomUser.objects.create_user(
+            phone_number='09123456789', telegram_id=1001, full_name='Test User', gender='female',
+            birth_date=date(1990, 1, 1),
+        )
+        self.infant = FamilyMember.objects.create(
+            user=user, full_name='Test Baby', gender='male', relationship='فرزند', birth_date=timezone.localdate(),
+        )
+        self.category = ServiceCategory.objects.create(name='Test Category')
+        Service.objects.create(category=self.category, name='Child Care', price=100, duration=timedelta(hours=1), max_age=17)
+        Service.objects.create(category=self.category, name='Adult Care', price=100, duration=timedelta(hours=1), min_age=18)
+
+    async def offered_services(self, recipient_id):
+        update = SimpleNamespace(effective_user=SimpleNamespace(id=1001), callback_query=FakeCallbackQuery())
+        context = SimpleNamespace(user_data={'recipient_id': recipient_id})
+        await self.bot.show_services(update, context, self.category.id, 0)
+        (_, reply_markup), = update.callback_query.message.replies
+        return [row[0].text for row in reply_markup.inline_keyboard if row[0].callback_data.startswith('srv_')]
+
+    async def test_infant_recipient_gets_childrens_services(self):
+        self.assertEqual(await self.offered_services(str(self.infant.id)), ['Child Care'])
+        self.assertEqual(await self.offered_services(None), ['Adult Care'])
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_rate_and_burst(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=2, clock=clock)
+        self.assertEqual([bucket.take(), bucket.take()], [0.0, 0.0])
+        self.assertEqual(bucket.delay(), 0.5)
+        self.assertEqual(bucket.take(), 0.5)  # In debt: usable after half a second
+        clock.now = 1.5
+        self.assertEqual(bucket.delay(), 0.0)
+
+
+class FakeBot:
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.sent = []
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append((chat_id, text, time.monotonic()))
+        return text
+
+
+class OutboundDispatcherTests(SimpleTestCase):
+    async def run_dispatcher(self, bot, messages, **kwargs):
+        dispatcher = OutboundDispatcher(lambda: bot, **{'rate': 1000, 'chat_rate': 1000, 'backoff': 0.01, **kwargs})
+        await dispatcher.start()
+        try:
+            results = await asyncio.gather(
+                *(dispatcher.deliver(chat_id, text) for chat_id, text in messages), return_exceptions=True,
+            )
+        finally:
+            await dispatcher.stop()
+        return dispatcher, results
+
+    async def test_messages_are_sent_concurrently(self):
+        bot = FakeBot()
+        dispatcher, results = await self.run_dispatcher(bot, [(chat, f'm{chat}') for chat in range(50)])
+        self.assertEqual(results, [f'm{chat}' for chat in range(50)])
+        self.assertEqual(dispatcher.stats()['sent'], 50)
+
+    async def test_retry_after_requeues_message(self):
+        bot = FakeBot(failures=[RetryAfter(0), NetworkError('reset')])
+        dispatcher, results = await self.run_dispatcher(bot, [(1, 'hello')], concurrency=1)
+        self.assertEqual(results, ['hello'])
+        self.assertEqual((dispatcher.throttled, dispatcher.retried), (1, 2))
+
+    async def test_rejected_message_fails_without_retry(self):
+        bot = FakeBot(failures=[Forbidden('bot was blocked by the user')])
+        dispatcher, results = await self.run_dispatcher(bot, [(1, 'hello'), (2, 'world')], concurrency=1)
+        self.assertIsInstance(results[0], Forbidden)
+        self.assertEqual(results[1], 'world')
+        self.assertEqual((dispatcher.failed, dispatcher.retried), (1, 0))
+
+    async def test_chat_rate_spaces_messages_to_one_chat(self):
+        bot = FakeBot()
+        messages = [(1, 'a'), (1, 'b'), (1, 'c'), (2, 'x')]
+        await self.run_dispatcher(bot, messages, chat_rate=20)
+        one_chat = [sent_at for chat_id, _, sent_at in bot.sent if chat_id == 1]
+        self.assertGreaterEqual(one_chat[-1] - one_chat[0], 0.09)  # Burst of one, then 20 per second
+        self.assertEqual(bot.sent[1][0], 2)  # The other chat isn't held up
+
+
+class StubBotAPI(BaseHTTPRequestHandler):
+    """Answers getMe and sendMessage like the Bot API, recording the sent chats."""
+    sent = []
+
+    def do_POST(self):
+        method = self.path.rsplit('/', 1)[-1]
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bot', 'username': 'test_bot'}
+        else:
+            params = dict(parse_qsl(body))
+            self.sent.append((self.path.split('/')[-2], int(params['chat_id'])))
+            result = {'message_id': 1, 'date': 0, 'chat': {'id': int(params['chat_id']), 'type': 'private'}}
+        payload = json.dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class DefaultDispatcherTests(SimpleTestCase):
+    """``get_dispatcher`` with the real ``default_bot``, against a local stand-in for the Bot API."""
+
+    def setUp(self):
+        StubBotAPI.sent = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubBotAPI)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = dispatcher_module.TELEGRAM_API_BASE_URL
+        dispatcher_module.TELEGRAM_API_BASE_URL = f'http://127.0.0.1:{self.server.server_port}/bot'
+
+    def tearDown(self):
+        shutdown_dispatcher()
+        dispatcher_module.TELEGRAM_API_BASE_URL = self.base_url
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_sends_with_the_configured_token(self):
+        results = get_dispatcher().send_many([{'chat_id': 7, 'text': 'hello'}, {'chat_id': 8, 'text': 'world'}])
+        self.assertEqual([result.chat.id for result in results], [7, 8])
+        token = os.environ['TELEGRAM_BOT_TOKEN']
+        self.assertCountEqual(StubBotAPI.sent, [(f'bot{token}', 7), (f'bot{token}', 8)])
+
+
+class APIClientSigningTests(SimpleTestCase):
+    async def test_requests_are_signed_over_path_and_query(self):
+        seen = []
+        client = BotAPIClient(base_url='http://api.test/api/', secret='test-secret')
+        client._client = httpx.AsyncClient(
+            base_url=client.base_url, transport=httpx.MockTransport(lambda request: seen.append(request) or httpx.Response(200)),
+        )
+        await client.get('users/documents/upload/', params={'telegram_id': 1001, 'filename': 'a b+.pdf'})
+        await client.close()
+        request = seen[0]
+        self.assertEqual(request.url.raw_path, b'/api/users/documents/upload/?telegram_id=1001&filename=a%20b%2B.pdf')
+        self.assertTrue(verify(
+            'test-secret', 'GET', request.url.raw_path.decode(), request.headers[TIMESTAMP_HEADER],
+            request.headers[SIGNATURE_HEADER], max_skew=5,
+        ))
+        self.assertFalse(verify(
+            'test-secret', 'GET', '/api/users/documents/upload/?telegram_id=1002&filename=a%20b%2B.pdf', request.headers[TIMESTAMP_HEADER],
+            request.headers[SIGNATURE_HEADER], max_skew=5,
+        ))
+
+
+class MetricsTests(TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = Histogram('test_seconds', 'Test.', ['route'], buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, route='show_profile')
+        self.assertEqual(histogram.render().splitlines()[2:], [
+            'test_seconds_bucket{route="show_profile",le="0.1"} 2',
+            'test_seconds_bucket{route="show_profile",le="1.0"} 3',
+            'test_seconds_bucket{route="show_profile",le="+Inf"} 4',
+            'test_seconds_count{route="show_profile"} 4',
+            'test_seconds_sum{route="show_profile"} 3.65',
+        ])
+
+    def test_endpoint_label_collapses_ids(self):
+        self.assertEqual(endpoint_label('users/family-members/12/'), 'users/family-members/{id}/')
+        self.assertEqual(endpoint_label('orders/orders/7'), 'orders/orders/{id}')
+        self.assertEqual(endpoint_label('users/profile/'), 'users/profile/')
+
+    def test_requests_record_db_queries(self):
+        REQUEST_QUERIES.clear()
+        client = APIClient()
+        client.force_authenticate(user=CustomUser.objects.create_user(phone_number='09123456789', full_name='Test User', gender='male'))
+        client.get(reverse('family-member-list'))
+        self.assertIn('http_request_db_queries_sum{view="family-member-list"} 1', render())
+        with override_settings(MONITORING_TOKEN='scrape-token'):
+            response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer scrape-token'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE bot_handler_duration_seconds histogram', response.content.decode())
+
+    @override_settings(MONITORING_TOKEN='scrape-token')
+    def test_monitoring_endpoints_need_the_token_or_staff(self):
+        for name in ('metrics', 'webhook_stats', 'webhook_logs'):
+            with self.subTest(name=name):
+                self.assertEqual(self.client.get(reverse(name)).status_code, 403)
+                response = self.client.get(reverse(name), headers={'Authorization': 'Bearer wrong-token'})
+                self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get(reverse('webhook_stats'), headers={'Authorization': 'Bearer scrape-token'}).status_code, 200)
+        user = CustomUser.objects.create_user(phone_number='09123456789', full_name='Test User', gender='male')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+class LifespanTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(setattr, lifespan, 'state', lifespan.state)
+        self.addCleanup(setattr, lifespan, 'startup_seconds', lifespan.startup_seconds)
+
+    async def run_lifespan(self, middleware):
+        events = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            return next(events)
+
+        async def send(message):
+            sent.append(message['type'])
+        await middleware({'type': 'lifespan'}, receive, send)
+        return sent
+
+    async def test_startup_and_shutdown_run_once(self):
+        calls = []
+
+        async def on_startup():
+            calls.append(('startup', lifespan.state))
+
+        async def on_shutdown():
+            calls.append(('shutdown', lifespan.state))
+        sent = await self.run_lifespan(LifespanMiddleware(None, on_startup, on_shutdown))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertEqual(calls, [('startup', 'starting'), ('shutdown', 'stopping')])
+        self.assertIsNotNone(lifespan.startup_seconds)
+
+    async def test_failed_startup_is_reported(self):
+        async def on_startup():
+            raise RuntimeError('no token')
+        sent = await self.run_lifespan(LifespanMiddleware(None, on_startup))
+        self.assertEqual(sent, ['lifespan.startup.failed'])
+        self.assertEqual(lifespan.state, 'failed')
+
+    def test_webhook_waits_for_readiness(self):
+        lifespan.state = 'starting'
+        self.assertEqual(self.client.get(reverse('ready')).status_code, 503)
+        response = self.client.post(reverse('telegram_webhook'), {'update_id': 1}, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        lifespan.state = 'ready'
+        self.assertEqual(self.client.get(reverse('ready')).json()['status'], 'ready')
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+        self.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+class LoggingTests(SimpleTestCase):
+    def record(self, name, level=logging.INFO, msg='message', args=None):
+        return logging.LogRecord(name, level, __file__, 0, msg, args, None)
+
+    def test_queue_handler_writes_in_the_listener(self):
+        target = ListHandler()
+        handler = QueueHandler([target])
+        items = ['a']
+        handler.handle(self.record('test', msg='items: %s', args=(items,)))
+        items.append('b')  # Changed after logging; the message must not see it
+        handler.close()
+        self.assertEqual(target.lines, ["INFO items: ['a']"])
+
+    def test_sampling_keeps_warnings_and_unlisted_loggers(self):
+        sampling = SamplingFilter('httpx=0,orders=0.5,orders.models=1', random=lambda: 0.7)
+        self.assertFalse(sampling.filter(self.record('httpx')))
+        self.assertTrue(sampling.filter(self.record('httpx', logging.WARNING)))
+        self.assertFalse(sampling.filter(self.record('orders.views')))
+        self.assertTrue(sampling.filter(self.record('orders.models')))
+        self.assertTrue(sampling.filter(self.record('users.views')))
+
+    def test_tail_pages_backwards(self):
+        path = os.path.join(tempfile.mkdtemp(), 'test.log')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        lines = [f'line {index} ' + 'x' * (index % 13) for index in range(100)]
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        page, before = tail_lines(path, 7, block_size=32)
+        self.assertEqual(page, lines[-7:])
+        collected = page
+        while before:
+            page, before = tail_lines(path, 7, before, block_size=32)
+            collected = page + collected
+        self.assertEqual(collected, lines)
+
+        headers = {'Authorization': 'Bearer log-token'}
+        with override_settings(LOG_FILE=path, MONITORING_TOKEN='log-token'):
+            response = self.client.get(reverse('webhook_logs'), {'lines': 2}, headers=headers)
+            self.assertEqual(response.json()['lines'], lines[-2:])
+            response = self.client.get(reverse('webhook_logs'), {'lines': 2, 'before': response.json()['before']}, headers=headers)
+            self.assertEqual(response.json()['lines'], lines[-4:-2])
+
+
+class JalaliCodecTests(SimpleTestCase):
+    def test_round_trip_matches_jdatetime_over_table_range(self):
+        first = jalali.to_gregorian(jalali.FIRST_YEAR, 1, 1).toordinal()
+        last = jalali.to_gregorian(jalali.LAST_YEAR, 12, 29).toordinal()
+        dates = [date.fromordinal(ordinal) for ordinal in range(first - 5, last + 5)]
+        expected = [(d.year, d.month, d.day) for d in (jdatetime.date.fromgregorian(date=value) for value in dates)]
+        self.assertEqual(jalali.to_jalali_many(dates), expected)
+        self.assertEqual(jalali.to_gregorian_many(expected), dates)
+
+    def test_leap_day_and_invalid_dates(self):
+        self.assertEqual(jalali.to_gregorian(1403, 12, 30), date(2025, 3, 20))
+        for invalid in ((1404, 12, 30), (1404, 13, 1), (1404, 7, 31), (1404, 1, 0)):
+            with self.assertRaises(ValueError):
+                jalali.to_gregorian(*invalid)
+        with self.assertRaises(ValueError):
+            jalali.parse_date('1404/02')
+
+    def test_dates_outside_tables_fall_back_to_jdatetime(self):
+        value = date(1850, 6, 1)
+        converted = jdatetime.date.fromgregorian(date=value)
+        self.assertEqual(jalali.to_jalali(value), (converted.year, converted.month, converted.day))
+        self.assertEqual(jalali.to_gregorian(converted.year, converted.month, converted.day), value)
+
+    def test_formatting_parsing_and_age(self):
+        self.assertEqual(jalali.format_date(date(2026, 10, 18)), '1405/07/26')
+        self.assertEqual(jalali.format_datetime(datetime(2026, 10, 18, 9, 5, 3)), '1405/07/26 09:05:03')
+        self.assertEqual(jalali.format_dates([date(2026, 10, 18), None], sep='-'), ['1405-07-26', None])
+        self.assertEqual(jalali.parse_date('1369/05/15'), date(1990, 8, 6))
+        self.assertEqual(jalali.age(date(1990, 8, 6), today=date(2026, 8, 5)), 35)
+        self.assertEqual(jalali.age(date(1990, 8, 6), today=date(2026, 8, 6)), 36)
+        self.assertIsNone(jalali.age(None))
+
+    def test_anniversaries(self):
+        dates = jalali.anniversaries(12, 30, 1400, 1404)
+        self.assertEqual([jalali.to_jalali(value) for value in dates], [(1403, 12, 30)])
+        self.assertEqual(len(jalali.anniversaries(5, 15, 1400, 1404)), 5)
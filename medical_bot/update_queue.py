@@ -0,0 +1,148 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+# 'inline' processes updates inside the webhook request; 'queue' acknowledges
+# right away and processes them on background consumers (ASGI servers only).
+TELEGRAM_WEBHOOK_MODE = config('TELEGRAM_WEBHOOK_MODE', default='inline')
+UPDATE_QUEUE_SIZE = config('UPDATE_QUEUE_SIZE', default=1000, cast=int)
+UPDATE_QUEUE_WORKERS = config('UPDATE_QUEUE_WORKERS', default=8, cast=int)
+
+
+def chat_key(update):
+    """Updates with the same key are processed strictly in arrival order."""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return ('update', update.update_id)
+
+
+class UpdateQueue:
+    """
+    Bounded in-process queue of Telegram updates with per-chat ordering.
+
+    Every chat has its own FIFO lane. A chat key is handed to at most one
+    consumer at a time, so updates of one chat never overlap or reorder,
+    while different chats are processed concurrently by ``workers`` tasks.
+    ``put`` never blocks: once ``maxsize`` updates are waiting it refuses
+    the update (load shedding) and the webhook asks Telegram to retry later.
+    """
+
+    def __init__(self, process, maxsize=UPDATE_QUEUE_SIZE, workers=UPDATE_QUEUE_WORKERS, clock=time.monotonic):
+        self._process = process
+        self.maxsize = maxsize
+        self.workers = workers
+        self._clock = clock
+        self._lanes = {}  # chat key -> deque of (update, enqueued_at); present while the chat is busy
+        self._ready = None  # asyncio.Queue of chat keys waiting for a consumer
+        self._tasks = []
+        self.depth = 0
+        self.in_flight = 0
+        self.max_depth = 0
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.shed = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._latency_hooks = []
+
+    @property
+    def running(self):
+        return bool(self._tasks)
+
+    def start(self):
+        """Starts the consumer tasks on the running event loop."""
+        if self.running:
+            return
+        self._ready = asyncio.Queue()
+        for key in self._lanes:
+            self._ready.put_nowait(key)
+        # A fresh context each: the consumers outlive the request that started them, and must
+        # not inherit its context variables (e.g. the request's database query counters)
+        self._tasks = [
+            asyncio.create_task(self._consume(), name=f'update-consumer-{i}', context=contextvars.Context())
+            for i in range(self.workers)
+        ]
+        logger.info(f"Update queue started with {self.workers} consumers (max {self.maxsize} pending).")
+
+    async def stop(self, timeout=10):
+        """Waits up to ``timeout`` seconds for pending updates, then stops the consumers."""
+        deadline = self._clock() + timeout
+        while (self.depth or self.in_flight) and self._clock() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Update queue stopped ({self.depth} updates left unprocessed).")
+
+    def add_latency_hook(self, hook):
+        """Registers ``hook(seconds)``, called with the time from ``put`` until an update was processed."""
+        self._latency_hooks.append(hook)
+
+    def put(self, update):
+        """Enqueues an update; returns False if the queue is full."""
+        if self.depth >= self.maxsize:
+            self.shed += 1
+            logger.warning(f"Update queue full, shedding update {update.update_id}.")
+            return False
+        key = chat_key(update)
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = deque()
+            if self._ready is not None:
+                self._ready.put_nowait(key)
+        lane.append((update, self._clock()))
+        self.depth += 1
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        return True
+
+    async def _consume(self):
+        while True:
+            key = await self._ready.get()
+            lane = self._lanes[key]
+            update, enqueued_at = lane.popleft()
+            self.depth -= 1
+            self.in_flight += 1
+            waited = self._clock() - enqueued_at
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            try:
+                await self._process(update)
+                self.processed += 1
+                for hook in self._latency_hooks:
+                    hook(self._clock() - enqueued_at)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error processing queued update {update.update_id}: {e}", exc_info=True)
+            finally:
+                self.in_flight -= 1
+            # The chat goes back in line only after this update is done, keeping its order
+            if lane:
+                self._ready.put_nowait(key)
+            else:
+                del self._lanes[key]
+
+    def stats(self):
+        done = self.processed + self.failed
+        return {
+            'depth': self.depth,
+            'in_flight': self.in_flight,
+            'max_depth': self.max_depth,
+            'capacity': self.maxsize,
+            'busy_chats': len(self._lanes),
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'failed': self.failed,
+            'shed': self.shed,
+            'wait_seconds_avg': self.wait_seconds_total / done if done else 0.0,
+            'wait_seconds_max': self.wait_seconds_max,
+        }
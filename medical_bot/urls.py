@@ -1,28 +1,44 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from django.http import HttpResponse, JsonResponse
 import logging
-from .views import telegram_webhook  # Renamed for clarity
+from .views import telegram_webhook, webhook_stats  # Renamed for clarity
+from .metrics import metrics_view, monitoring_view
+from .lifespan import ready_view
+from .logs import tail_lines
 
 logger = logging.getLogger(__name__)
 
+MAX_LOG_LINES = 1000
+
 def test_webhook(request):
     """Simple view to test webhook accessibility."""
     logger.debug("Test webhook endpoint accessed")
     return HttpResponse("Webhook endpoint is accessible")
 
 def webhook_logs(request):
-    """View to display webhook logs (for debugging)."""
+    """
+    View to page backwards through the webhook logs (for debugging).
+
+    Returns the last ``?lines=`` lines (default 200) of LOG_FILE; pass the
+    returned ``before`` offset back to get the lines before them.
+    """
+    path = settings.LOG_FILE or 'webhook_logs.log'
+    try:
+        limit = max(0, min(int(request.GET.get('lines', 200)), MAX_LOG_LINES))
+        before = int(request.GET['before']) if request.GET.get('before') else None
+    except ValueError:
+        return JsonResponse({"error": "lines and before must be integers"}, status=400)
     try:
-        with open('webhook_logs.log', 'r') as f:
-            logs = f.readlines()
-        return HttpResponse("<br>".join(logs), content_type="text/html")
+        lines, start = tail_lines(path, limit, before)
     except FileNotFoundError:
         logger.warning("Webhook log file not found.")
         return JsonResponse({"error": "Log file not found"}, status=404)
     except Exception as e:
         logger.error(f"Error reading webhook logs: {e}", exc_info=True)
         return JsonResponse({"error": f"Error reading logs: {e}"}, status=500)
+    return JsonResponse({"lines": lines, "before": start or None})
 
 def home(request):
     """Simple API root view."""
@@ -37,5 +53,8 @@ urlpatterns = [
     path('api/orders/', include('orders.urls')),
     path('telegram/webhook/', telegram_webhook, name='telegram_webhook'),  # Consistent naming
     path('telegram/test/', test_webhook, name='test_webhook'),
-    path('telegram/logs/', webhook_logs, name='webhook_logs'),
+    path('telegram/metrics/', monitoring_view(metrics_view), name='metrics'),
+    path('telegram/ready/', ready_view, name='ready'),
+    path('telegram/logs/', monitoring_view(webhook_logs), name='webhook_logs'),
+    path('telegram/stats/', monitoring_view(webhook_stats), name='webhook_stats'),
 ]
\ No newline at end of file
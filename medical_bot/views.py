@@ -5,38 +5,84 @@ from telegram import Update
 from telegram.ext import Application, CallbackContext
 from decouple import config
 from bot import setup_handlers
-from django.dispatch import receiver
+from .api_client import start_api_client, close_api_client
+from .persistence import build_persistence, persist
+from .update_queue import UpdateQueue, TELEGRAM_WEBHOOK_MODE
+from .dedup import build_deduplicator
+from .dispatcher import TELEGRAM_API_BASE_URL
+from .metrics import UPDATE_SECONDS
+from . import lifespan
 from django.urls import path
-from django.core.signals import request_started
 import asyncio
 import json  # Import the json library
+import time
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Module-level Application instance
 application: Application = None  # Initialize as None with type hint
+_init_lock = asyncio.Lock()  # Concurrent first updates must not initialize twice
+
+async def process_update(update: Update):
+    """Runs the handlers for one update and persists the resulting state."""
+    await application.process_update(update)
+    await persist(application)  # Write changed conversation state before the next update
+
+# Used when TELEGRAM_WEBHOOK_MODE is 'queue'; consumers start with the first update
+update_queue = UpdateQueue(process_update)
+update_queue.add_latency_hook(lambda seconds: UPDATE_SECONDS.observe(seconds, mode='queue'))
+
+# Telegram re-delivers updates after slow or failed responses; drop the repeats
+deduplicator = build_deduplicator()
 
 async def initialize_telegram_app() -> Application:
-    """Initializes the Telegram Application instance."""
+    """
+    Initializes the Telegram Application instance.
+
+    Called once per worker by the ASGI lifespan startup (see lifespan.py);
+    without lifespan support, by the first webhook request.
+    """
     global application
-    if application is None:
-        token = config('TELEGRAM_BOT_TOKEN')
-        logger.info(f"Initializing Telegram bot with token: {token[:10]}...")  # Log first 10 characters
-        try:
-            application = Application.builder().token(token).read_timeout(30).write_timeout(30).connect_timeout(30).build()
-            setup_handlers(application)
-            await application.initialize()  # Initialize the application
-            logger.info("Telegram bot initialized.")
-        except Exception as e:
-            logger.error(f"Error during Telegram bot initialization: {e}", exc_info=True)
-            raise
+    async with _init_lock:
+        if application is None:
+            token = config('TELEGRAM_BOT_TOKEN')
+            logger.info(f"Initializing Telegram bot with token: {token[:10]}...")  # Log first 10 characters
+            try:
+                builder = Application.builder().token(token).base_url(TELEGRAM_API_BASE_URL)
+                builder = builder.read_timeout(30).write_timeout(30).connect_timeout(30)
+                persistence = build_persistence()  # Shared state so any worker can continue a conversation
+                if persistence is not None:
+                    builder = builder.persistence(persistence)
+                app = builder.build()
+                setup_handlers(app)
+                if persistence is not None:
+                    persistence.install(app)
+                await app.initialize()  # Initialize the application
+                await start_api_client(app)  # Shared pooled client for bot -> API calls
+                application = app  # Published only once fully initialized
+                logger.info("Telegram bot initialized.")
+            except Exception as e:
+                logger.error(f"Error during Telegram bot initialization: {e}", exc_info=True)
+                raise
     return application
 
+async def shutdown_telegram_app():
+    """Shuts down the Telegram Application instance and its API client."""
+    global application
+    if update_queue.running:
+        await update_queue.stop()
+    if application is not None:
+        await application.shutdown()  # Also flushes the persistence
+        await close_api_client(application)
+        if application.persistence is not None:
+            await application.persistence.store.close()
+        application = None
+        logger.info("Telegram bot shut down.")
+
 @csrf_exempt
 async def telegram_webhook(request):
     """Handles incoming Telegram updates via webhook."""
+    received = time.perf_counter()
 
     if request.method != "POST":
         logger.warning(f"Invalid HTTP method: {request.method}")
@@ -45,14 +91,39 @@ async def telegram_webhook(request):
     try:
         # Deserialize the update
         update_data = json.loads(request.body.decode('utf-8'))  # Parse the JSON
+        if not isinstance(update_data, dict) or 'update_id' not in update_data:
+            logger.error("Webhook payload is not a Telegram update.")
+            return JsonResponse({"error": "Invalid request body"}, status=400)
+        if not lifespan.accepting_updates():
+            # Worker still starting or already stopping; Telegram retries later
+            return HttpResponse(status=503, content="Service Unavailable", headers={'Retry-After': '1'})
         # Ensure application is initialized before processing the update
         if application is None:
             await initialize_telegram_app()
+        update_id = update_data['update_id']
+        if not await deduplicator.claim(update_id):
+            logger.info(f"Dropping duplicate update {update_id}.")
+            return HttpResponse(status=200, content="OK")
         update = Update.de_json(update_data, application.bot)  # Use the module-level application
-        logger.debug(f"Received update: {update.to_dict()}")  # Log the update details
+        logger.debug("Received update: %s", update_data)  # Formatted only when DEBUG is enabled
+
+        if TELEGRAM_WEBHOOK_MODE == 'queue':
+            # Acknowledge right away; consumers process it in per-chat order
+            if not update_queue.running:
+                update_queue.start()
+            if not update_queue.put(update):
+                # Telegram re-delivers the update later
+                await deduplicator.release(update_id)
+                return HttpResponse(status=503, content="Service Unavailable", headers={'Retry-After': '1'})
+            return HttpResponse(status=200, content="OK")
 
         # Process the update
-        await application.process_update(update)
+        try:
+            await process_update(update)
+        except Exception:
+            await deduplicator.release(update_id)  # Accept Telegram's retry
+            raise
+        UPDATE_SECONDS.observe(time.perf_counter() - received, mode='inline')
         logger.info("Update processed successfully.")
         return HttpResponse(status=200, content="OK")  # Simple acknowledgment
 
@@ -64,11 +135,10 @@ async def telegram_webhook(request):
         logger.error(f"Webhook error: {e}", exc_info=True)  # Log with traceback
         return HttpResponse(status=500, content="Internal Server Error")
 
-# Django signal to initialize on server start (or similar event)
-@receiver(request_started)
-def on_server_start(sender, **kwargs):
-    """Initializes the Telegram bot when the server starts."""
-    async def _async_init():
-        await initialize_telegram_app()
-
-    asyncio.run(_async_init())
\ No newline at end of file
+def webhook_stats(request):
+    """Returns webhook queue depth, wait time, load-shedding and dedup counters."""
+    return JsonResponse({
+        'mode': TELEGRAM_WEBHOOK_MODE,
+        'queue': update_queue.stats(),
+        'dedup': deduplicator.stats(),
+    })
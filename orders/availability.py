@@ -0,0 +1,191 @@
+"""
+Appointment slot availability.
+
+Each day's bookings are kept as an occupancy index: the day is split into
+RESOLUTION-minute buckets, and every open order adds one to the buckets its
+``[scheduled_time, scheduled_time + service.duration)`` interval touches. A
+slot is free when every bucket it covers is below ORDER_SLOT_CAPACITY, so
+"free slots for service X on day D" is a scan over a few dozen integers.
+
+Indexes are built from the database on first use and cached per process,
+validated against a per-day version token in the shared cache (the same
+scheme as the service catalog): order post_save/post_delete receivers bump
+the day's token, which also expires after VERSION_TTL. Bookings don't trust the cached copy:
+``reserve`` locks the day's ScheduleDay row, rebuilds that day's index from
+the database and only then saves the order, so concurrent bookings for one
+day are serialized and cannot overbook it.
+"""
+import logging
+import math
+import threading
+import uuid
+from array import array
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+RESOLUTION = 15  # Minutes per occupancy bucket
+BUCKETS = 24 * 60 // RESOLUTION
+MAX_CACHED_DAYS = 64
+VERSION_TTL = 5 * 60  # An expired token only costs a rebuild; bounds staleness after writes that send no signals
+
+
+class SlotUnavailable(Exception):
+    """The requested time has no free capacity left."""
+
+
+class DayIndex:
+    """Per-bucket count of booked appointments on one day."""
+
+    def __init__(self, day, version=None):
+        self.day = day
+        self.version = version  # Shared version token the index was built for
+        self.occupancy = array('H', [0]) * BUCKETS
+
+    def add(self, start, length):
+        """Books ``length`` minutes from ``start`` (minutes after midnight); time past midnight is ignored."""
+        for bucket in range(start // RESOLUTION, min(math.ceil((start + length) / RESOLUTION), BUCKETS)):
+            self.occupancy[bucket] += 1
+
+    def fits(self, start, length, capacity):
+        buckets = self.occupancy[start // RESOLUTION:math.ceil((start + length) / RESOLUTION)]
+        return max(buckets, default=0) < capacity
+
+    def free_slots(self, length, capacity, opening, closing, step, not_before=0):
+        """Start minutes between ``opening`` and ``closing`` where ``length`` minutes fit."""
+        first = max(opening, opening + math.ceil((not_before - opening) / step) * step)
+        return [start for start in range(first, closing - length + 1, step) if self.fits(start, length, capacity)]
+
+
+def slot_length(duration):
+    """Minutes an appointment of ``duration`` occupies (at least one minute)."""
+    return max(math.ceil(duration.total_seconds() / 60), 1)
+
+
+def day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def minute_of_day(value):
+    local = timezone.localtime(value)
+    return local.hour * 60 + local.minute
+
+
+def build_index(day, exclude=None):
+    """Reads ``day``'s open orders into a fresh index, leaving out order ``exclude``."""
+    from .models import Order
+
+    start, end = day_bounds(day)
+    orders = Order.objects.filter(scheduled_time__gte=start, scheduled_time__lt=end).exclude(status='canceled')
+    if exclude is not None:
+        orders = orders.exclude(pk=exclude)
+    index = DayIndex(day)
+    for scheduled_time, duration in orders.values_list('scheduled_time', 'service__duration'):
+        index.add(minute_of_day(scheduled_time), slot_length(duration))
+    return index
+
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def _version_key(day):
+    return f'orders:availability:{day.isoformat()}'
+
+
+def day_version(day):
+    """Returns the shared version token of ``day``, creating it on first use."""
+    key = _version_key(day)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=VERSION_TTL)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_days(*values):
+    """Bumps the version of the days of the given datetimes once the current transaction commits."""
+    days = {timezone.localtime(value).date() for value in values if value is not None}
+
+    def bump():
+        for day in days:
+            cache.set(_version_key(day), uuid.uuid4().hex, timeout=VERSION_TTL)
+    if days:
+        transaction.on_commit(bump)
+
+
+def get_index(day):
+    """Returns the cached index of ``day``, rebuilding it only after the day's version changed."""
+    version = day_version(day)
+    with _lock:
+        index = _indexes.get(day)
+        if index is not None and index.version == version:
+            _indexes.move_to_end(day)
+            return index
+    index = build_index(day)
+    index.version = version
+    with _lock:
+        _indexes[day] = index
+        _indexes.move_to_end(day)
+        while len(_indexes) > MAX_CACHED_DAYS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def free_slots(service, day, now=None):
+    """Start times (``datetime.time``) on ``day`` when ``service`` can still be booked."""
+    now = timezone.localtime(now or timezone.now())
+    if day < now.date():
+        return []
+    not_before = now.hour * 60 + now.minute + 1 if day == now.date() else 0
+    starts = get_index(day).free_slots(
+        slot_length(service.duration), settings.ORDER_SLOT_CAPACITY,
+        settings.ORDER_OPENING_HOUR * 60, settings.ORDER_CLOSING_HOUR * 60, settings.ORDER_SLOT_STEP, not_before,
+    )
+    return [time(start // 60, start % 60) for start in starts]
+
+
+def availability(service, days=None, now=None):
+    """``[(date, [time, ...]), ...]`` for the given days, by default the booking window from today."""
+    if days is None:
+        today = timezone.localdate(now)
+        days = [today + timedelta(days=offset) for offset in range(settings.ORDER_BOOKING_DAYS)]
+    return [(day, free_slots(service, day, now)) for day in days]
+
+
+def availability_payload(service, days=None):
+    """``availability`` as served by the API: ISO dates and ``HH:MM`` start times."""
+    return {
+        'service': service.id,
+        'days': [
+            {'date': day.isoformat(), 'slots': [slot.strftime('%H:%M') for slot in slots]}
+            for day, slots in availability(service, days)
+        ],
+    }
+
+
+def reserve(order):
+    """
+    Saves ``order`` if its time still has capacity; raises ``SlotUnavailable`` otherwise.
+
+    The check and the save run in one transaction holding the day's
+    ScheduleDay row lock, against an index read from the database inside
+    that lock. For an existing order, its own booking is left out.
+    """
+    from .models import ScheduleDay
+
+    day = timezone.localtime(order.scheduled_time).date()
+    with transaction.atomic():
+        ScheduleDay.objects.select_for_update().get_or_create(date=day)
+        index = build_index(day, exclude=order.pk)
+        if not index.fits(minute_of_day(order.scheduled_time), slot_length(order.service.duration), settings.ORDER_SLOT_CAPACITY):
+            logger.info(f"Slot {timezone.localtime(order.scheduled_time)} for service {order.service_id} is full.")
+            raise SlotUnavailable("این زمان دیگر آزاد نیست. لطفاً زمان دیگری انتخاب کنید.")
+        order.save()
+    return order
@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_alter_order_options_alter_order_address_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='تاریخ')),
+            ],
+            options={
+                'verbose_name': 'روز کاری',
+                'verbose_name_plural': 'روزهای کاری',
+            },
+        ),
+    ]
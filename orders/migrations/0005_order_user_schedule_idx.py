@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 11:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_schedule_day'),
+        ('services', '0004_backfill_service_eligibility'),
+        ('users', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'scheduled_time'], name='order_user_schedule_idx'),
+        ),
+    ]
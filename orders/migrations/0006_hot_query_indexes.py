@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+from medical_bot.indexes import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False  # CREATE INDEX CONCURRENTLY can't run in a transaction
+
+    dependencies = [
+        ('orders', '0005_order_user_schedule_idx'),
+        ('services', '0004_backfill_service_eligibility'),
+        ('users', '0003_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(fields=['status', 'scheduled_time'], name='order_status_schedule_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'canceled'), _negated=True), fields=['scheduled_time'], name='order_active_schedule_idx'),
+        ),
+    ]
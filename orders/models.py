@@ -1,10 +1,32 @@
+from datetime import timedelta
 from django.db import models
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 from users.models import CustomUser, Address, FamilyMember
 from services.models import Service
+from .availability import invalidate_days
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Orders can be canceled up to this long before their scheduled time
+CANCELLATION_WINDOW = timedelta(hours=24)
+CLOSED_STATUSES = ('canceled', 'completed')
+
+class CancellationClosed(Exception):
+    """The order is closed or starts within the cancellation window."""
+
+class ConfirmationClosed(Exception):
+    """The order is closed or its scheduled time has passed."""
+
+class OrderQuerySet(models.QuerySet):
+    def cancellable(self, now=None):
+        """Orders that are still open and start after the cancellation window."""
+        now = now or timezone.now()
+        return self.filter(scheduled_time__gt=now + CANCELLATION_WINDOW).exclude(status__in=CLOSED_STATUSES)
+
 class Order(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='orders', verbose_name="کاربر")
     recipient = models.ForeignKey(FamilyMember, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders', verbose_name="گیرنده خدمت")
@@ -21,6 +43,8 @@ class Order(models.Model):
         ('canceled', 'لغو شده'),
     ], default='pending', verbose_name="وضعیت")
 
+    objects = OrderQuerySet.as_manager()
+
     def __str__(self):
         recipient_name = self.recipient.full_name if self.recipient else self.user.full_name
         return f"سفارش {self.id} - {recipient_name} - {self.service.name}"
@@ -28,11 +52,78 @@ class Order(models.Model):
     class Meta:
         verbose_name = 'سفارش'
         verbose_name_plural = 'سفارش‌ها'
+        indexes = [
+            # A user's orders by time: order lists and the cancellable range scan
+            models.Index(fields=['user', 'scheduled_time'], name='order_user_schedule_idx'),
+            # Orders in one status by time: the reminder task's window of confirmed orders
+            models.Index(fields=['status', 'scheduled_time'], name='order_status_schedule_idx'),
+            # Only orders that still hold their slot: the availability scan and booking checks
+            models.Index(fields=['scheduled_time'], condition=~Q(status='canceled'), name='order_active_schedule_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so a rescheduled order also frees its old day in the availability index
+        instance._loaded_scheduled_time = instance.__dict__.get('scheduled_time')
+        return instance
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
         logger.info(f"Order {self.id} created/updated.")
 
+    def is_cancellable(self, now=None):
+        now = now or timezone.now()
+        return self.status not in CLOSED_STATUSES and self.scheduled_time > now + CANCELLATION_WINDOW
+
+    def cancel(self, now=None):
+        """Cancels the order; raises ``CancellationClosed`` once the cancellation window has begun."""
+        if not self.is_cancellable(now):
+            raise CancellationClosed("این درخواست دیگر قابل لغو نیست.")
+        self.status = 'canceled'
+        self.save(update_fields=['status'])
+
+    def is_confirmable(self, now=None):
+        now = now or timezone.now()
+        return self.status not in CLOSED_STATUSES and self.scheduled_time > now
+
+    def confirm(self, now=None):
+        """Confirms the order (again, from a repeated reminder); raises ``ConfirmationClosed`` once it is closed or past."""
+        if not self.is_confirmable(now):
+            raise ConfirmationClosed("این درخواست دیگر قابل تأیید نیست.")
+        if self.status != 'confirmed':
+            self.status = 'confirmed'
+            self.save(update_fields=['status'])
+
     def delete(self, *args, **kwargs):
         logger.warning(f"Order {self.id} deleted.")
-        super().delete(*args, **kwargs)
\ No newline at end of file
+        super().delete(*args, **kwargs)
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, **kwargs):
+    invalidate_days(instance.scheduled_time, getattr(instance, '_loaded_scheduled_time', None))
+    instance._loaded_scheduled_time = instance.scheduled_time
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    # Also sent for QuerySet.delete() (the admin's "delete selected") and for orders
+    # deleted along with their address, user or service, which skip Order.delete()
+    invalidate_days(instance.scheduled_time)
+
+
+class ScheduleDay(models.Model):
+    """
+    One row per booked day, locked while an order for that day is reserved.
+
+    See orders.availability.reserve.
+    """
+    date = models.DateField(unique=True, verbose_name="تاریخ")
+
+    def __str__(self):
+        return str(self.date)
+
+    class Meta:
+        verbose_name = 'روز کاری'
+        verbose_name_plural = 'روزهای کاری'
\ No newline at end of file
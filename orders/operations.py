@@ -0,0 +1,60 @@
+"""
+Order operations for in-process callers, mirroring the orders/ API endpoints.
+
+Synchronous ORM code; async callers wrap it with ``sync_to_async``.
+"""
+import logging
+from medical_bot.pagination import KeysetPagination, paginate, paginate_keyset
+from users.models import CustomUser
+from services.models import Service
+from rest_framework.exceptions import ValidationError
+from .models import Order, CancellationClosed, ConfirmationClosed
+from .availability import availability_payload
+from .serializers import OrderSerializer, CancellableOrderSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def list_orders(telegram_id, limit=None, cursor=None):
+    orders = Order.objects.filter(user__telegram_id=telegram_id).select_related('service__category', 'address', 'recipient')
+    return paginate_keyset(orders, OrderSerializer, KeysetPagination.ordering, limit, cursor)
+
+
+def list_cancellable_orders(telegram_id, limit=None, offset=0):
+    orders = Order.objects.cancellable().filter(user__telegram_id=telegram_id).select_related('service')
+    orders = orders.only('id', 'scheduled_time', 'service__name').order_by('scheduled_time', 'id')
+    return paginate(orders, CancellableOrderSerializer, limit, offset)
+
+
+def get_availability(service_id, day=None):
+    """Free start times for a service, on ``day`` or over the booking window."""
+    return availability_payload(Service.objects.get(pk=service_id), [day] if day else None)
+
+
+def create_order(telegram_id, data):
+    user = CustomUser.objects.get(telegram_id=telegram_id)
+    serializer = OrderSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    serializer.save(user=user)
+    logger.info(f"Order created for user {user.id}.")
+    return serializer.data
+
+
+def confirm_order(telegram_id, order_id):
+    order = Order.objects.get(user__telegram_id=telegram_id, id=order_id)
+    try:
+        order.confirm()
+    except ConfirmationClosed as e:
+        raise ValidationError({'detail': str(e)})
+    logger.info(f"Order {order.id} confirmed.")
+    return OrderSerializer(order).data
+
+
+def cancel_order(telegram_id, order_id):
+    order = Order.objects.get(user__telegram_id=telegram_id, id=order_id)
+    try:
+        order.cancel()
+    except CancellationClosed as e:
+        raise ValidationError({'detail': str(e)})
+    logger.info(f"Order {order.id} canceled.")
+    return OrderSerializer(order).data
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Order
+from .availability import reserve, SlotUnavailable
 from users.serializers import AddressSerializer, FamilyMemberSerializer
 from services.serializers import ServiceSerializer
 from users.models import Address, FamilyMember
@@ -37,18 +38,36 @@ class OrderSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         try:
-            order = Order.objects.create(**validated_data)
+            order = reserve(Order(**validated_data))
             logger.info(f"Order {order.id} created.")
             return order
+        except SlotUnavailable as e:
+            raise serializers.ValidationError({'scheduled_time': [str(e)]})
         except Exception as e:
             logger.error(f"Error creating order: {e}", exc_info=True)
             raise
 
     def update(self, instance, validated_data):
         try:
-            order = super().update(instance, validated_data)
+            if instance.status != 'canceled' and validated_data.keys() & {'scheduled_time', 'service'}:
+                # Rescheduling needs capacity at the new time
+                for attr, value in validated_data.items():
+                    setattr(instance, attr, value)
+                order = reserve(instance)
+            else:
+                order = super().update(instance, validated_data)
             logger.info(f"Order {instance.id} updated.")
             return order
+        except SlotUnavailable as e:
+            raise serializers.ValidationError({'scheduled_time': [str(e)]})
         except Exception as e:
             logger.error(f"Error updating order {instance.id}: {e}", exc_info=True)
-            raise
\ No newline at end of file
+            raise
+
+class CancellableOrderSerializer(serializers.ModelSerializer):
+    """What the bot's cancel keyboard shows: one button per order."""
+    service_name = serializers.CharField(source='service.name', read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'service_name', 'scheduled_time']
@@ -1,9 +1,9 @@
 from celery import shared_task
-from django.conf import settings  # Import settings for TELEGRAM_BOT_TOKEN
-from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from django.utils import timezone  # Use Django's timezone for consistency
-import jdatetime
 import logging
+from medical_bot import jalali
+from medical_bot.dispatcher import get_dispatcher
 from .models import Order
 
 logger = logging.getLogger(__name__)
@@ -21,19 +21,21 @@ def send_reminder():
     """
     Sends reminders to users about their upcoming orders.
     """
-    bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)  # Access token from settings
     now = timezone.now()  # Use Django's timezone-aware now()
     orders = Order.objects.filter(
         status='confirmed',
         scheduled_time__gte=now,
-        scheduled_time__lte=now + timezone.timedelta(hours=24)  # Use Django's timedelta
-    )
-    logger.info(f"Found {orders.count()} orders for reminders.")
+        scheduled_time__lte=now + timezone.timedelta(hours=24),  # Use Django's timedelta
+        user__telegram_id__isnull=False,  # Not reachable on Telegram otherwise
+    ).select_related('user', 'recipient', 'service', 'address')
+    logger.info(f"Found {len(orders)} orders for reminders.")
 
+    # Messages are built first and sent concurrently through the rate-limited dispatcher
+    reminders = []
     for order in orders:
         try:
             scheduled_time_gregorian = order.scheduled_time
-            scheduled_time_jalali = jdatetime.datetime.fromgregorian(dt=scheduled_time_gregorian)
+            scheduled_time_jalali = jalali.format_datetime(timezone.localtime(scheduled_time_gregorian))
             time_diff = scheduled_time_gregorian - now
             user = order.user
             recipient_name = order.recipient.full_name if order.recipient else user.full_name
@@ -48,20 +50,27 @@ def send_reminder():
             if 23.5 <= hours_until_event <= 24.5:  # 24-hour reminder
                 message = (
                     f"یادآوری: خدمت {order.service.name} برای {recipient_name} "
-                    f"در تاریخ {scheduled_time_jalali.strftime('%Y/%m/%d %H:%M:%S')} در آدرس {order.address.title} "
+                    f"در تاریخ {scheduled_time_jalali} در آدرس {order.address.title} "
                     f"برنامه‌ریزی شده است."
                 )
-                bot.send_message(chat_id=user.id, text=message, reply_markup=reply_markup)
-                logger.info(f"24-hour reminder sent for order {order.id} to user {user.id}")
+                reminders.append((order, '24-hour', {'chat_id': user.telegram_id, 'text': message, 'reply_markup': reply_markup}))
 
             elif 0.5 <= hours_until_event <= 1.5:  # 1-hour reminder
                 message = (
                     f"یادآوری: خدمت {order.service.name} برای {recipient_name} "
-                    f"کمتر از یک ساعت دیگر در تاریخ {scheduled_time_jalali.strftime('%Y/%m/%d %H:%M:%S')} در آدرس {order.address.title} "
+                    f"کمتر از یک ساعت دیگر در تاریخ {scheduled_time_jalali} در آدرس {order.address.title} "
                     f"برگزار خواهد شد."
                 )
-                bot.send_message(chat_id=user.id, text=message, reply_markup=reply_markup)
-                logger.info(f"1-hour reminder sent for order {order.id} to user {user.id}")
+                reminders.append((order, '1-hour', {'chat_id': user.telegram_id, 'text': message, 'reply_markup': reply_markup}))
 
         except Exception as e:
-            logger.error(f"Failed to send reminder for order {order.id}: {e}", exc_info=True)
\ No newline at end of file
+            logger.error(f"Failed to prepare reminder for order {order.id}: {e}", exc_info=True)
+
+    if not reminders:
+        return
+    results = get_dispatcher().send_many([message for _, _, message in reminders])
+    for (order, kind, message), result in zip(reminders, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to send {kind} reminder for order {order.id}: {result}")
+        else:
+            logger.info(f"{kind} reminder sent for order {order.id} to user {message['chat_id']}")
\ No newline at end of file
@@ -1,9 +1,14 @@
-from django.test import TestCase
+from datetime import datetime, time, timedelta
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APIClient
 from .models import Order
-from users.models import CustomUser, Address
+from .availability import DayIndex, free_slots
+from . import operations
+from users.models import CustomUser, Address, FamilyMember
+from users import operations as users_operations
 from services.models import Service, ServiceCategory
 import jdatetime  # Use jdatetime directly
 from django.utils import timezone  # Import Django's timezone
@@ -68,4 +73,234 @@ class OrderTests(TestCase):
         url = reverse('order-detail', kwargs={'pk': order.pk})
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
-        self.assertEqual(Order.objects.count(), 0)
\ No newline at end of file
+        self.assertEqual(Order.objects.count(), 0)
+
+class DayIndexTests(SimpleTestCase):
+    def test_slots_respect_capacity_and_duration(self):
+        index = DayIndex(None)
+        index.add(600, 60)  # 10:00-11:00
+        self.assertFalse(index.fits(600, 60, capacity=1))
+        self.assertFalse(index.fits(570, 60, capacity=1))  # 09:30-10:30 overlaps
+        self.assertTrue(index.fits(660, 60, capacity=1))
+        self.assertTrue(index.fits(600, 60, capacity=2))
+        self.assertEqual(index.free_slots(120, 1, 480, 780, 60), [480, 660])
+        self.assertEqual(index.free_slots(60, 1, 480, 780, 60, not_before=481), [540, 660, 720])
+
+
+@override_settings(ORDER_SLOT_CAPACITY=1, ORDER_OPENING_HOUR=8, ORDER_CLOSING_HOUR=12, ORDER_SLOT_STEP=60)
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(phone_number='09123456789', telegram_id=1001, full_name='Test User', gender='male')
+        self.client.force_authenticate(user=self.user)
+        category = ServiceCategory.objects.create(name='Test Category')
+        self.service = Service.objects.create(category=category, name='Test Service', price=100, duration=timedelta(hours=1))
+        self.address = Address.objects.create(user=self.user, title='Test Address', full_address='Test Full Address')
+        self.day = timezone.localdate() + timedelta(days=2)
+
+    def at(self, hour):
+        return timezone.make_aware(datetime.combine(self.day, time(hour)))
+
+    def book(self, hour):
+        data = {
+            'service_id': self.service.id, 'address_id': self.address.id, 'recipient_id': None,
+            'scheduled_time': self.at(hour).isoformat(),
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('order-list'), data, format='json')
+
+    def test_booked_slot_is_no_longer_offered(self):
+        self.assertEqual(free_slots(self.service, self.day), [time(8), time(9), time(10), time(11)])
+        self.assertEqual(self.book(9).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(free_slots(self.service, self.day), [time(8), time(10), time(11)])
+
+        response = self.client.get(reverse('order-availability'), {'service': self.service.id, 'date': self.day.isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['days'], [{'date': self.day.isoformat(), 'slots': ['08:00', '10:00', '11:00']}])
+
+    def test_full_slot_is_rejected(self):
+        self.assertEqual(self.book(9).status_code, status.HTTP_201_CREATED)
+        response = self.book(9)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('scheduled_time', response.json())
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_canceling_frees_the_slot(self):
+        order = Order.objects.get(pk=self.book(9).json()['id'])
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'canceled'
+            order.save()
+        self.assertIn(time(9), free_slots(self.service, self.day))
+        self.assertEqual(self.book(9).status_code, status.HTTP_201_CREATED)
+
+    def test_deleting_the_address_frees_the_slot(self):
+        self.assertEqual(self.book(9).status_code, status.HTTP_201_CREATED)
+        self.assertNotIn(time(9), free_slots(self.service, self.day))
+        with self.captureOnCommitCallbacks(execute=True):
+            users_operations.delete_address(self.user.telegram_id, self.address.id)  # Its orders go with it
+        self.assertFalse(Order.objects.exists())
+        self.assertIn(time(9), free_slots(self.service, self.day))
+
+    def test_booking_window(self):
+        response = self.client.get(reverse('order-availability'), {'service': self.service.id})
+        self.assertEqual(len(response.json()['days']), 7)
+        self.assertEqual(self.client.get(reverse('order-availability')).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CancellableOrderTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(phone_number='09123456789', full_name='Test User', gender='male')
+        self.client.force_authenticate(user=self.user)
+        other = CustomUser.objects.create_user(phone_number='09120000000', full_name='Other User', gender='female')
+        category = ServiceCategory.objects.create(name='Test Category')
+        self.service = Service.objects.create(category=category, name='Test Service', price=100, duration=timedelta(hours=1))
+        self.address = Address.objects.create(user=self.user, title='Test Address', full_address='Test Full Address')
+        now = timezone.now()
+        self.open_order = self.order(now + timedelta(days=3))
+        self.soon_order = self.order(now + timedelta(hours=2))
+        self.order(now + timedelta(days=2), status='canceled')
+        self.order(now + timedelta(days=2), status='completed')
+        self.order(now + timedelta(days=2), user=other)
+
+    def order(self, scheduled_time, status='pending', user=None):
+        return Order.objects.create(
+            user=user or self.user, service=self.service, address=self.address, scheduled_time=scheduled_time, status=status,
+        )
+
+    def test_lists_only_cancellable_orders(self):
+        response = self.client.get(reverse('order-cancellable'), {'limit': 8})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual(response.json()['results'], [{
+            'id': self.open_order.id, 'service_name': 'Test Service',
+            'scheduled_time': timezone.localtime(self.open_order.scheduled_time).isoformat(),
+        }])
+
+    def test_cancellation_window_is_enforced(self):
+        url = reverse('order-cancel', kwargs={'pk': self.soon_order.pk})
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.soon_order.refresh_from_db()
+        self.assertEqual(self.soon_order.status, 'pending')
+
+        response = self.client.post(reverse('order-cancel', kwargs={'pk': self.open_order.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['status'], 'canceled')
+        self.assertEqual(self.client.get(reverse('order-cancellable')).json(), [])
+
+
+class OrderListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(phone_number='09123456789', telegram_id=1001, full_name='Test User', gender='male')
+        self.client.force_authenticate(user=self.user)
+        category = ServiceCategory.objects.create(name='Test Category')
+        service = Service.objects.create(category=category, name='Test Service', price=100, duration=timedelta(hours=1))
+        address = Address.objects.create(user=self.user, title='Test Address', full_address='Test Full Address')
+        member = FamilyMember.objects.create(user=self.user, full_name='Test Child', gender='female', relationship='فرزند')
+        start = timezone.now() + timedelta(days=1)
+        # Pairs share a scheduled time, so pages must break ties on id
+        self.orders = Order.objects.bulk_create(
+            Order(user=self.user, service=service, address=address, recipient=member if index % 3 else None,
+                  scheduled_time=start + timedelta(hours=index // 2))
+            for index in range(25)
+        )
+        self.expected = [order.id for order in sorted(self.orders, key=lambda order: (order.scheduled_time, order.id))]
+
+    def walk(self, fetch, limit):
+        ids, cursor, pages = [], None, []
+        while True:
+            page = fetch(limit, cursor)
+            pages.append(page)
+            ids += [order['id'] for order in page['results']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                return ids, pages
+
+    def api_page(self, limit, cursor=None):
+        params = {'limit': limit, **({'cursor': cursor} if cursor else {})}
+        response = self.client.get(reverse('order-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_cursor_pages_walk_the_list_both_ways(self):
+        ids, pages = self.walk(self.api_page, 4)
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(len(pages), 7)
+        self.assertIsNone(pages[0]['previous_cursor'])
+        self.assertIn('cursor=', pages[0]['next'])
+
+        back = self.api_page(4, pages[3]['previous_cursor'])
+        self.assertEqual(back['results'], pages[2]['results'])
+        self.assertEqual(back['next_cursor'], pages[2]['next_cursor'])
+        first = self.api_page(4, pages[1]['previous_cursor'])
+        self.assertEqual(first['results'], pages[0]['results'])
+        self.assertIsNone(first['previous_cursor'])
+
+    def test_in_process_pages_match_the_api(self):
+        ids, _ = self.walk(lambda limit, cursor: operations.list_orders(1001, limit, cursor), 6)
+        self.assertEqual(ids, self.expected)
+        self.assertEqual([order['id'] for order in operations.list_orders(1001)], self.expected)
+
+    def test_list_without_limit_stays_a_plain_array(self):
+        response = self.client.get(reverse('order-list'))
+        self.assertEqual([order['id'] for order in response.json()], self.expected)
+
+    def test_query_count_is_constant_per_page(self):
+        first = self.api_page(10)
+        for cursor in (None, first['next_cursor']):
+            with self.subTest(cursor=cursor), self.assertNumQueries(1):
+                self.api_page(10, cursor)
+
+    def test_invalid_cursor_is_rejected(self):
+        garbage = ('x1.2', 'n1', 'nzz.1', 'n1.', 'nabc', 'n 1.1', 'n-1.1', 'p1_0.1', 'n١.1', 'N1.1', '%%%',
+                   'n1.' + 'f' * 20, 'n1.8000000000000000', 'n' + 'f' * 16 + '.1')
+        for cursor in garbage:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('order-list'), {'limit': 4, 'cursor': cursor})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                with self.assertRaises(ValidationError):
+                    operations.list_orders(1001, 4, cursor)
+
+    def test_negative_limit_returns_an_empty_page(self):
+        self.assertEqual(self.api_page(-4)['results'], [])
+        self.assertEqual(operations.list_orders(1001, -4)['results'], [])
+
+
+class IndexUsageTests(TestCase):
+    """The hot order queries are planned on their indexes (see ``Order.Meta.indexes``)."""
+
+    def setUp(self):
+        self.users = CustomUser.objects.bulk_create(
+            CustomUser(phone_number=f'0912{index:07}', telegram_id=index + 1, full_name='Test User', gender='male')
+            for index in range(50)
+        )
+        category = ServiceCategory.objects.create(name='Test Category')
+        service = Service.objects.create(category=category, name='Test Service', price=100, duration=timedelta(hours=1))
+        address = Address.objects.create(user=self.users[0], title='Test Address', full_address='Test Full Address')
+        self.now = timezone.now()
+        statuses = ['pending', 'confirmed', 'completed', 'canceled']
+        Order.objects.bulk_create(
+            Order(user=self.users[index % 50], service=service, address=address, status=statuses[index % 4],
+                  scheduled_time=self.now + timedelta(hours=index - 1000))
+            for index in range(2000)
+        )
+
+    def assertUsesIndex(self, queryset, name):
+        self.assertIn(name, queryset.explain())
+
+    def test_reminder_window(self):
+        # Same filter as orders.tasks.send_reminder
+        self.assertUsesIndex(Order.objects.filter(
+            status='confirmed', scheduled_time__gte=self.now, scheduled_time__lte=self.now + timedelta(hours=24),
+            user__telegram_id__isnull=False,
+        ), 'order_status_schedule_idx')
+
+    def test_users_cancellable_orders(self):
+        self.assertUsesIndex(Order.objects.filter(user=self.users[5]).cancellable(self.now), 'order_user_schedule_idx')
+
+    def test_availability_scan(self):
+        # Same filter as orders.availability.build_index
+        self.assertUsesIndex(Order.objects.filter(
+            scheduled_time__gte=self.now, scheduled_time__lt=self.now + timedelta(days=1),
+        ).exclude(status='canceled'), 'order_active_schedule_idx')
@@ -1,7 +1,13 @@
+from datetime import date
 from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from .models import Order
-from .serializers import OrderSerializer
+from medical_bot.pagination import KeysetPagination, OptionalLimitOffsetPagination
+from services.models import Service
+from .models import Order, CancellationClosed, ConfirmationClosed
+from .serializers import OrderSerializer, CancellableOrderSerializer
+from .availability import availability_payload
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,12 +19,15 @@ class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination  # ?limit=&cursor= on (scheduled_time, id)
 
     def get_queryset(self):
         """
-        Return a list of all orders for the current user.
+        Return a list of all orders for the current user, with the nested
+        service, category, address and recipient joined in (one query per page).
         """
-        return Order.objects.filter(user=self.request.user)
+        orders = Order.objects.filter(user=self.request.user).select_related('service__category', 'address', 'recipient')
+        return orders.order_by('scheduled_time', 'id')
 
     def create(self, request, *args, **kwargs):
         """
@@ -61,6 +70,60 @@ class OrderViewSet(viewsets.ModelViewSet):
         logger.warning(f"Order {instance.id} deleted.")
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """
+        Free start times for ``?service=`` on ``?date=`` (YYYY-MM-DD), or on
+        every day of the booking window when no date is given.
+        """
+        try:
+            service = Service.objects.get(pk=int(request.query_params['service']))
+            day = request.query_params.get('date')
+            days = [date.fromisoformat(day)] if day else None
+        except (KeyError, ValueError, Service.DoesNotExist):
+            raise ValidationError({'detail': 'A valid service and an optional YYYY-MM-DD date are required.'})
+        return Response(availability_payload(service, days))
+
+    @action(detail=False, methods=['get'])
+    def cancellable(self, request):
+        """
+        Orders the user can still cancel, soonest first, with only the fields
+        the cancel keyboard needs. Paginated with ``?limit=&offset=``.
+        """
+        orders = Order.objects.cancellable().filter(user=request.user).select_related('service')
+        orders = orders.only('id', 'scheduled_time', 'service__name').order_by('scheduled_time', 'id')
+        paginator = OptionalLimitOffsetPagination()  # The cancel keyboard pages by offset
+        page = paginator.paginate_queryset(orders, request, view=self)
+        if page is not None:
+            return paginator.get_paginated_response(CancellableOrderSerializer(page, many=True).data)
+        return Response(CancellableOrderSerializer(orders, many=True).data)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """
+        Cancel an order; refused once the order is closed or within the cancellation window.
+        """
+        instance = self.get_object()
+        try:
+            instance.cancel()
+        except CancellationClosed as e:
+            raise ValidationError({'detail': str(e)})
+        logger.info(f"Order {instance.id} canceled.")
+        return Response(self.get_serializer(instance).data)
+
+    @action(detail=True, methods=['post'])
+    def confirm(self, request, pk=None):
+        """
+        Confirm an order (the reminder's button); refused once the order is closed or its time has passed.
+        """
+        instance = self.get_object()
+        try:
+            instance.confirm()
+        except ConfirmationClosed as e:
+            raise ValidationError({'detail': str(e)})
+        logger.info(f"Order {instance.id} confirmed.")
+        return Response(self.get_serializer(instance).data)
+
     def perform_create(self, serializer):
         """
         Create a new order instance.
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import logging
+import threading
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = 'services:catalog:version'
+
+
+class CatalogSnapshot:
+    """The serialized category tree plus services, with its strong ETag."""
+
+    def __init__(self, version, body, etag):
+        self.version = version  # Shared version token the snapshot was built for
+        self.body = body  # UTF-8 JSON bytes, served as-is
+        self.etag = etag
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def current_version():
+    """Returns the shared catalog version token, creating it on first use."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, uuid.uuid4().hex, timeout=settings.SERVICE_CATALOG_TTL)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def invalidate_catalog():
+    """
+    Bumps the catalog version once the current transaction commits.
+
+    Writes that send no signals (``QuerySet.update()``, raw SQL) don't get
+    here; the version also expires after SERVICE_CATALOG_TTL seconds, so
+    they show up within that time.
+    """
+    def bump():
+        cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, timeout=settings.SERVICE_CATALOG_TTL)
+        logger.info("Service catalog invalidated.")
+    transaction.on_commit(bump)
+
+
+def build_catalog():
+    from .models import ServiceCategory, Service
+    from .serializers import ServiceCategorySerializer, CatalogServiceSerializer
+
+    categories = ServiceCategorySerializer(ServiceCategory.objects.order_by('id'), many=True).data
+    services = CatalogServiceSerializer(Service.objects.order_by('id'), many=True).data
+    content = json.dumps({'categories': categories, 'services': services}, ensure_ascii=False, separators=(',', ':'))
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    # Splice the digest in as "version" so clients can compare without hashing
+    body = ('{"version":"%s",%s' % (digest, content[1:])).encode('utf-8')
+    return body, f'"{digest}"'
+
+
+def get_catalog_snapshot():
+    """Returns the catalog snapshot, rebuilding it only after the version changed."""
+    global _snapshot
+    version = current_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _lock:
+        if _snapshot is None or _snapshot.version != version:
+            body, etag = build_catalog()
+            _snapshot = CatalogSnapshot(version, body, etag)
+            logger.info(f"Service catalog snapshot rebuilt ({len(body)} bytes).")
+        return _snapshot
@@ -0,0 +1,18 @@
+from django_filters import rest_framework as filters
+from .models import Service
+
+
+class ServiceFilter(filters.FilterSet):
+    """``?category=&age=&gender=`` filtering, applied in the database (see ``ServiceQuerySet.eligible``)."""
+    age = filters.NumberFilter(method='filter_age', min_value=0)
+    gender = filters.ChoiceFilter(method='filter_gender', choices=[('male', 'مرد'), ('female', 'زن')])
+
+    class Meta:
+        model = Service
+        fields = ['category', 'age', 'gender']
+
+    def filter_age(self, queryset, name, value):
+        return queryset.eligible(age=int(value))
+
+    def filter_gender(self, queryset, name, value):
+        return queryset.eligible(gender=value)
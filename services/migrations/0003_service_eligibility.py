@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0002_service_description_servicecategory_parent_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='allowed_gender',
+            field=models.CharField(choices=[('any', 'همه'), ('male', 'مرد'), ('female', 'زن')], default='any', max_length=10, verbose_name='جنسیت مجاز'),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='max_age',
+            field=models.PositiveSmallIntegerField(default=150, verbose_name='حداکثر سن'),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='min_age',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='حداقل سن'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['category', 'allowed_gender', 'min_age', 'max_age'], name='service_eligibility_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+# Age rules the bot used to apply by matching service names: adults (18-59) saw
+# every service, children only theirs and the elderly only theirs. Each rule
+# is one range per service, so the same services stay visible to every age.
+CHILDREN_MARKER = 'کودکان'
+ELDERLY_MARKER = 'سالمندان'
+
+
+def backfill_eligibility(apps, schema_editor):
+    Service = apps.get_model('services', 'Service')
+    Service.objects.filter(name__contains=CHILDREN_MARKER).update(min_age=0, max_age=59)
+    Service.objects.filter(name__contains=ELDERLY_MARKER).update(min_age=18, max_age=150)
+    Service.objects.exclude(name__contains=CHILDREN_MARKER).exclude(name__contains=ELDERLY_MARKER).update(min_age=18, max_age=59)
+
+
+def reset_eligibility(apps, schema_editor):
+    Service = apps.get_model('services', 'Service')
+    Service.objects.update(min_age=0, max_age=150, allowed_gender='any')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0003_service_eligibility'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_eligibility, reset_eligibility),
+    ]
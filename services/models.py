@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 import logging
+from .catalog import invalidate_catalog
 
 logger = logging.getLogger(__name__)
 
@@ -22,12 +25,30 @@ class ServiceCategory(models.Model):
         logger.warning(f"ServiceCategory '{self.name}' (ID: {self.id}) deleted.")
         super().delete(*args, **kwargs)
 
+# Upper bound stored in max_age for services without an age limit
+MAX_AGE = 150
+
+class ServiceQuerySet(models.QuerySet):
+    def eligible(self, age=None, gender=None):
+        """Services a recipient of the given age and gender may receive."""
+        queryset = self
+        if gender is not None:
+            queryset = queryset.filter(allowed_gender__in=['any', gender])
+        if age is not None:
+            queryset = queryset.filter(min_age__lte=age, max_age__gte=age)
+        return queryset
+
 class Service(models.Model):
     category = models.ForeignKey(ServiceCategory, on_delete=models.CASCADE, related_name='services', verbose_name="دسته بندی")
     name = models.CharField(max_length=100, verbose_name="نام")
     description = models.TextField(verbose_name="توضیحات")
     price = models.PositiveIntegerField(verbose_name="قیمت")
     duration = models.DurationField(verbose_name="مدت زمان")
+    min_age = models.PositiveSmallIntegerField(default=0, verbose_name="حداقل سن")
+    max_age = models.PositiveSmallIntegerField(default=MAX_AGE, verbose_name="حداکثر سن")
+    allowed_gender = models.CharField(max_length=10, choices=[('any', 'همه'), ('male', 'مرد'), ('female', 'زن')], default='any', verbose_name="جنسیت مجاز")
+
+    objects = ServiceQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.name} ({self.category.name})"
@@ -35,6 +56,10 @@ class Service(models.Model):
     class Meta:
         verbose_name = 'خدمت'
         verbose_name_plural = 'خدمت‌ها'
+        indexes = [
+            # Equality columns first, then the age range (see ServiceQuerySet.eligible)
+            models.Index(fields=['category', 'allowed_gender', 'min_age', 'max_age'], name='service_eligibility_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
@@ -42,4 +67,12 @@ class Service(models.Model):
 
     def delete(self, *args, **kwargs):
         logger.warning(f"Service '{self.name}' (ID: {self.id}) deleted.")
-        super().delete(*args, **kwargs)
\ No newline at end of file
+        super().delete(*args, **kwargs)
+
+
+@receiver([post_save, post_delete], sender=ServiceCategory)
+@receiver([post_save, post_delete], sender=Service)
+def catalog_changed(sender, **kwargs):
+    # Signals rather than save()/delete() overrides: QuerySet.delete() (the admin's
+    # "delete selected") skips Model.delete() but still sends post_delete per row
+    invalidate_catalog()
@@ -0,0 +1,10 @@
+"""Service lookups for in-process callers, mirroring the services/ API endpoints."""
+from medical_bot.pagination import paginate
+from .models import Service
+from .serializers import ServiceSerializer
+
+
+def list_services(category_id, age=None, gender=None, limit=None, offset=0):
+    """Services of a category a recipient of ``age``/``gender`` is eligible for."""
+    services = Service.objects.filter(category_id=category_id).eligible(age=age, gender=gender)
+    return paginate(services.select_related('category').order_by('id'), ServiceSerializer, limit, offset)
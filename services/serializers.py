@@ -11,4 +11,11 @@ class ServiceSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Service
-        fields = ['id', 'name', 'description', 'price', 'duration', 'category']
\ No newline at end of file
+        fields = ['id', 'name', 'description', 'price', 'duration', 'category', 'min_age', 'max_age', 'allowed_gender']
+
+class CatalogServiceSerializer(serializers.ModelSerializer):
+    """Flat service representation used in the catalog snapshot."""
+
+    class Meta:
+        model = Service
+        fields = ['id', 'name', 'description', 'price', 'duration', 'category', 'min_age', 'max_age', 'allowed_gender']
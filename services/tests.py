@@ -1,9 +1,13 @@
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
+from .catalog import CATALOG_VERSION_KEY
 from .models import ServiceCategory, Service
 from users.models import CustomUser  # Import your CustomUser model
+from datetime import timedelta
+from importlib import import_module
 
 class ServiceCategoryTests(TestCase):
     def setUp(self):
@@ -50,4 +54,106 @@ class ServiceTests(TestCase):
         url = reverse('services-list') + '?search=Test'
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
\ No newline at end of file
+        self.assertEqual(len(response.data), 1)
+
+class CatalogTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(phone_number='09123456789', full_name='Test User', gender='male')
+        self.client.force_authenticate(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = ServiceCategory.objects.create(name='Test Category')
+            self.service = Service.objects.create(
+                category=self.category,
+                name='Test Service',
+                description='Test Description',
+                price=100,
+                duration=timedelta(hours=1)
+            )
+
+    def test_get_catalog(self):
+        response = self.client.get(reverse('catalog'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['ETag'].startswith('"'))
+        data = response.json()
+        self.assertEqual([cat['id'] for cat in data['categories']], [self.category.id])
+        self.assertEqual(data['services'][0]['category'], self.category.id)
+        self.assertEqual(response['ETag'], f'"{data["version"]}"')
+
+    def test_conditional_get_returns_not_modified(self):
+        etag = self.client.get(reverse('catalog'))['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('catalog'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_catalog_is_rebuilt_after_service_change(self):
+        etag = self.client.get(reverse('catalog'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.price = 200
+            self.service.save()
+        response = self.client.get(reverse('catalog'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['services'][0]['price'], 200)
+
+    def test_catalog_is_rebuilt_after_bulk_delete(self):
+        etag = self.client.get(reverse('catalog'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.filter(pk=self.service.pk).delete()  # What the admin's "delete selected" does
+        response = self.client.get(reverse('catalog'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['services'], [])
+
+    def test_unsignaled_update_shows_up_once_the_version_expires(self):
+        etag = self.client.get(reverse('catalog'))['ETag']
+        Service.objects.update(price=300)  # Sends no signals
+        self.assertEqual(self.client.get(reverse('catalog'), HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        cache.delete(CATALOG_VERSION_KEY)  # As after SERVICE_CATALOG_TTL seconds
+        response = self.client.get(reverse('catalog'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['services'][0]['price'], 300)
+
+
+class ServiceEligibilityTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(phone_number='09123456789', full_name='Test User', gender='male')
+        self.client.force_authenticate(user=self.user)
+        self.category = ServiceCategory.objects.create(name='Test Category')
+        self.other_category = ServiceCategory.objects.create(name='Other Category')
+        self.children = self.make_service('ویزیت کودکان', min_age=0, max_age=17)
+        self.adults = self.make_service('ویزیت عمومی', min_age=18, max_age=59)
+        self.elderly = self.make_service('مراقبت سالمندان', min_age=60)
+        self.women = self.make_service('مامایی', allowed_gender='female')
+        self.make_service('ویزیت عمومی', category=self.other_category)
+
+    def make_service(self, name, category=None, **eligibility):
+        return Service.objects.create(
+            category=category or self.category, name=name, description='', price=100, duration=timedelta(hours=1), **eligibility,
+        )
+
+    def list_ids(self, **params):
+        response = self.client.get(reverse('services-list'), {'category': self.category.id, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {service['id'] for service in response.json()}
+
+    def test_age_filter(self):
+        self.assertEqual(self.list_ids(age=7), {self.children.id, self.women.id})
+        self.assertEqual(self.list_ids(age=30), {self.adults.id, self.women.id})
+        self.assertEqual(self.list_ids(age=70), {self.elderly.id, self.women.id})
+
+    def test_gender_filter(self):
+        self.assertEqual(self.list_ids(age=30, gender='male'), {self.adults.id})
+        self.assertEqual(self.list_ids(age=30, gender='female'), {self.adults.id, self.women.id})
+        self.assertEqual(len(self.list_ids()), 4)
+
+    def test_backfill_from_name_convention(self):
+        from django.apps import apps
+        backfill = import_module('services.migrations.0004_backfill_service_eligibility').backfill_eligibility
+        Service.objects.update(min_age=0, max_age=150)
+        backfill(apps, None)
+        self.assertEqual(self.list_ids(age=7), {self.children.id})
+        # Adults kept seeing the children's and elderly services, as the bot showed them before
+        self.assertEqual(self.list_ids(age=30), {self.children.id, self.adults.id, self.elderly.id, self.women.id})
+        self.assertEqual(self.list_ids(age=70), {self.elderly.id})
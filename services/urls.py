@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ServiceCategoryViewSet, ServiceViewSet
+from .views import ServiceCategoryViewSet, ServiceViewSet, CatalogView
 
 router = DefaultRouter()
 router.register(r'categories', ServiceCategoryViewSet, basename='categories')
 router.register(r'services', ServiceViewSet, basename='services')
 
 urlpatterns = [
+    path('catalog/', CatalogView.as_view(), name='catalog'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,8 +1,15 @@
 import logging
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import parse_etags
 from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from .models import ServiceCategory, Service
 from .serializers import ServiceCategorySerializer, ServiceSerializer
+from .catalog import get_catalog_snapshot
+from users.authentication import IsBotService
+from .filters import ServiceFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 
@@ -11,7 +18,7 @@ logger = logging.getLogger(__name__)
 class ServiceCategoryViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = ServiceCategory.objects.all()
     serializer_class = ServiceCategorySerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated | IsBotService]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     search_fields = ['name']
 
@@ -28,12 +35,12 @@ class ServiceCategoryViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
 
 class ServiceViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Service.objects.all()
+    queryset = Service.objects.select_related('category').order_by('id')
     serializer_class = ServiceSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated | IsBotService]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     search_fields = ['name', 'description']
-    filterset_fields = ['category']
+    filterset_class = ServiceFilter
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -51,6 +58,29 @@ class ServiceViewSet(viewsets.ReadOnlyModelViewSet):
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            logger.info(f"Service list page retrieved (offset {self.paginator.offset}).")
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
         serializer = self.get_serializer(queryset, many=True)
         logger.info("Service list retrieved.")
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+class CatalogView(APIView):
+    """
+    Serves the whole category tree plus services as one pre-serialized snapshot.
+
+    The response carries a strong ETag; clients that send it back in
+    ``If-None-Match`` get a 304 until a category or service changes.
+    """
+    permission_classes = [IsAuthenticated | IsBotService]
+
+    def get(self, request, *args, **kwargs):
+        snapshot = get_catalog_snapshot()
+        if snapshot.etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(snapshot.body, content_type='application/json')
+        response['ETag'] = snapshot.etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
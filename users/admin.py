@@ -9,7 +9,7 @@ class CustomUserAdmin(UserAdmin):
     list_display = ['phone_number', 'full_name', 'gender', 'email']  # Removed 'age' from list_display
     list_filter = ['gender']
     fieldsets = (
-        (None, {'fields': ('phone_number', 'password')}),
+        (None, {'fields': ('phone_number', 'telegram_id', 'password')}),
         ('Personal Info', {'fields': ('full_name', 'birth_date', 'gender', 'medical_conditions', 'email', 'region')}),
         ('Permissions', {'fields': ('is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions')}),
     )
@@ -19,7 +19,7 @@ class CustomUserAdmin(UserAdmin):
             'fields': ('phone_number', 'full_name', 'gender', 'password')  # Removed password1/2
         }),
     )
-    search_fields = ['phone_number', 'full_name']
+    search_fields = ['phone_number', 'telegram_id', 'full_name']
     ordering = ['phone_number']
 
 class AddressAdmin(admin.ModelAdmin):
@@ -0,0 +1,107 @@
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from rest_framework import authentication, exceptions, permissions
+from medical_bot.service_auth import SIGNATURE_HEADER, TIMESTAMP_HEADER, verify
+
+logger = logging.getLogger(__name__)
+
+
+class UserCache:
+    """
+    Short-lived in-process map of Telegram id -> ``CustomUser``.
+
+    Saves the user lookup on every signed bot request. Entries expire after
+    ``ttl`` seconds; ``CustomUser.save``/``delete`` evict the user in this
+    process, so other workers may serve a changed user for up to ``ttl``.
+    """
+
+    def __init__(self, ttl=60, maxsize=4096, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._entries = OrderedDict()  # Telegram id -> (expires_at, user)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id):
+        """Returns a copy of the active user with this Telegram id, or None."""
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry is not None and entry[0] > self._clock():
+                self._entries.move_to_end(telegram_id)
+                self.hits += 1
+                return copy.copy(entry[1])  # Views may change the instance they get
+            self.misses += 1
+        from .models import CustomUser
+        user = CustomUser.objects.filter(telegram_id=telegram_id, is_active=True).first()
+        if user is not None:
+            with self._lock:
+                self._entries[telegram_id] = (self._clock() + self.ttl, user)
+                self._entries.move_to_end(telegram_id)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+            user = copy.copy(user)
+        return user
+
+    def discard(self, user_id):
+        """Evicts every entry of the given user (their Telegram id may have just changed)."""
+        with self._lock:
+            for telegram_id in [key for key, (_, user) in self._entries.items() if user.pk == user_id]:
+                del self._entries[telegram_id]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(ttl=settings.BOT_AUTH_CACHE_TTL)
+
+
+class BotRequest:
+    """``request.auth`` of a signed bot request; ``telegram_id`` is the acting user, if any."""
+
+    def __init__(self, telegram_id=None):
+        self.telegram_id = telegram_id
+
+
+class BotServiceAuthentication(authentication.BaseAuthentication):
+    """
+    Authenticates requests signed by the bot (see ``medical_bot.service_auth``).
+
+    The ``telegram_id`` query parameter, covered by the signature, names the
+    user the bot acts for and becomes ``request.user``. Signed requests
+    without one (registration, the catalog) or for a Telegram account no user
+    is linked to get an anonymous user and only pass ``IsBotService``. Unsigned
+    requests are left to the other authenticators.
+    """
+
+    def authenticate(self, request):
+        signature = request.headers.get(SIGNATURE_HEADER)
+        if signature is None:
+            return None
+        if not settings.BOT_API_SECRET:
+            raise exceptions.AuthenticationFailed('Bot authentication is not configured.')
+        if not verify(settings.BOT_API_SECRET, request.method, request.get_full_path(),
+                      request.headers.get(TIMESTAMP_HEADER), signature, settings.BOT_API_MAX_SKEW):
+            logger.warning(f"Rejected bot request with an invalid or expired signature: {request.method} {request.path}")
+            raise exceptions.AuthenticationFailed('Invalid or expired request signature.')
+        try:
+            telegram_id = int(request.query_params['telegram_id'])
+        except KeyError:
+            return AnonymousUser(), BotRequest()
+        except ValueError:
+            raise exceptions.AuthenticationFailed('Invalid telegram_id.')
+        return user_cache.get(telegram_id) or AnonymousUser(), BotRequest(telegram_id)
+
+
+class IsBotService(permissions.BasePermission):
+    """Allows signed bot requests, with or without an acting user."""
+
+    def has_permission(self, request, view):
+        return isinstance(request.auth, BotRequest)
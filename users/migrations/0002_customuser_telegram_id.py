@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 11:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='telegram_id',
+            field=models.BigIntegerField(blank=True, null=True, unique=True, verbose_name='شناسه تلگرام'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Prefetch
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils.translation import gettext_lazy as _
 
@@ -16,9 +17,14 @@ class CustomUserManager(BaseUserManager):
         extra_fields.setdefault('is_superuser', True)
         return self.create_user(phone_number, password, **extra_fields)
 
+    def with_profile(self):
+        """Users with everything ``CustomUserSerializer`` nests prefetched: three extra queries however much there is."""
+        return self.prefetch_related(*profile_prefetches())
+
 class CustomUser(AbstractUser):
     full_name = models.CharField(max_length=100, verbose_name='نام و نام خانوادگی')
     phone_number = models.CharField(max_length=20, unique=True, verbose_name='شماره تلفن')
+    telegram_id = models.BigIntegerField(unique=True, null=True, blank=True, verbose_name='شناسه تلگرام')  # Also the private chat id
     birth_date = models.DateField(null=True, blank=True, verbose_name='تاریخ تولد')  # Use DateField
     gender = models.CharField(max_length=10, choices=[('male', 'مرد'), ('female', 'زن')], verbose_name='جنسیت')
     medical_conditions = models.TextField(blank=True, verbose_name='بیماری‌های زمینه‌ای')
@@ -30,9 +36,31 @@ class CustomUser(AbstractUser):
 
     objects = CustomUserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # The birthday task looks users up by a list of birth dates; most users have none
+            models.Index(fields=['birth_date'], condition=models.Q(birth_date__isnull=False), name='user_birth_date_idx'),
+        ]
+
     def __str__(self):
         return self.full_name
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        forget_user(self.pk)
+
+    def delete(self, *args, **kwargs):
+        user_id = self.pk
+        result = super().delete(*args, **kwargs)
+        forget_user(user_id)
+        return result
+
+
+def forget_user(user_id):
+    """Drops the user from the bot authentication cache of this process."""
+    from .authentication import user_cache  # Imports DRF, which needs the models loaded
+    user_cache.discard(user_id)
+
 class Address(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='addresses', verbose_name='کاربر')
     title = models.CharField(max_length=50, verbose_name='عنوان آدرس')
@@ -62,5 +90,19 @@ class Document(models.Model):
     description = models.CharField(max_length=200, verbose_name='توضیحات')
     uploaded_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ آپلود')  # Use DateTimeField
 
+    class Meta:
+        indexes = [
+            # A family member's documents in upload order (profile payload)
+            models.Index(fields=['family_member', 'uploaded_at'], name='document_member_uploaded_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.description} - {self.family_member.full_name}"
\ No newline at end of file
+        return f"{self.description} - {self.family_member.full_name}"
+
+def profile_prefetches():
+    """Prefetches for the profile payload: family members with their documents, and addresses."""
+    return [
+        Prefetch('family_members', queryset=FamilyMember.objects.order_by('id')),
+        Prefetch('family_members__documents', queryset=Document.objects.order_by('uploaded_at', 'id')),
+        Prefetch('addresses', queryset=Address.objects.order_by('id')),
+    ]
@@ -0,0 +1,148 @@
+"""
+Profile, family member, address and document operations for in-process callers.
+
+These mirror the users/ API endpoints (same serializers, same payloads) for
+code running inside the Django process, such as the bot's local backend.
+The functions are synchronous ORM code; async callers wrap them with
+``sync_to_async``. Missing objects raise ``ObjectDoesNotExist`` and invalid
+input raises DRF's ``ValidationError``.
+"""
+import logging
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from medical_bot.pagination import paginate
+from orders.models import Order
+from orders.serializers import OrderSerializer
+from services.catalog import get_catalog_snapshot
+from .models import CustomUser, Address, FamilyMember, Document, profile_prefetches
+from .serializers import CustomUserSerializer, AddressSerializer, FamilyMemberSerializer, DocumentSerializer, CreateCustomUserSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def get_user(telegram_id):
+    return CustomUser.objects.get(telegram_id=telegram_id)
+
+
+def get_profile(telegram_id):
+    user = CustomUser.objects.with_profile().get(telegram_id=telegram_id)
+    return CustomUserSerializer(user).data
+
+
+def session_bootstrap(user):
+    """
+    Everything the bot needs to start a conversation, in one payload.
+
+    Returns the profile (with family members, their ages and documents, and
+    addresses), the orders that can still be canceled and the current
+    catalog version, which matches the ``version`` field of
+    services/catalog/. Costs four queries while the catalog snapshot is
+    current.
+    """
+    prefetch_related_objects([user], *profile_prefetches())
+    orders = Order.objects.cancellable().filter(user=user).select_related('service__category', 'address', 'recipient').order_by('scheduled_time')
+    return {
+        'profile': CustomUserSerializer(user).data,
+        'cancellable_orders': OrderSerializer(orders, many=True).data,
+        'catalog_version': get_catalog_snapshot().etag.strip('"'),
+    }
+
+
+def bootstrap(telegram_id):
+    return session_bootstrap(get_user(telegram_id))
+
+
+def register_user(data):
+    serializer = CreateCustomUserSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    serializer.save()
+    logger.info(f"User registered: {serializer.validated_data.get('phone_number')}")
+    return serializer.data
+
+
+def phone_variants(phone_number):
+    """Ways the same (Iranian) number may have been stored: ``+989...``, ``989...`` and ``09...``."""
+    digits = ''.join(c for c in phone_number if c.isdigit())
+    return {phone_number, digits, '+' + digits, '0' + digits[-10:]}
+
+
+def link_telegram_id(telegram_id, phone_number):
+    """
+    Attaches a Telegram account to the user registered with ``phone_number``.
+
+    Only for phone numbers Telegram has verified (a shared own contact); the
+    id moves over from any other user it was attached to.
+    """
+    with transaction.atomic():
+        user = CustomUser.objects.select_for_update().filter(phone_number__in=phone_variants(phone_number)).order_by('id').first()
+        if user is None:
+            raise CustomUser.DoesNotExist(f"No user with phone number {phone_number}.")
+        if user.telegram_id != telegram_id:
+            for previous in CustomUser.objects.filter(telegram_id=telegram_id).exclude(pk=user.pk):
+                previous.telegram_id = None
+                previous.save(update_fields=['telegram_id'])
+            user.telegram_id = telegram_id
+            user.save(update_fields=['telegram_id'])
+            logger.info(f"Telegram account {telegram_id} linked to user: {phone_number}")
+    return get_profile(telegram_id)
+
+
+def update_profile(telegram_id, data):
+    serializer = CustomUserSerializer(CustomUser.objects.with_profile().get(telegram_id=telegram_id), data=data, partial=True)
+    serializer.is_valid(raise_exception=True)
+    serializer.save()
+    return serializer.data
+
+
+def list_family_members(telegram_id, limit=None, offset=0):
+    members = FamilyMember.objects.filter(user__telegram_id=telegram_id).order_by('id')
+    return paginate(members, FamilyMemberSerializer, limit, offset)
+
+
+def save_family_member(telegram_id, data, fm_id=None):
+    """Creates a family member, or replaces the one with ``fm_id``."""
+    user = get_user(telegram_id)
+    instance = FamilyMember.objects.get(user=user, id=fm_id) if fm_id is not None else None
+    serializer = FamilyMemberSerializer(instance, data=data)
+    serializer.is_valid(raise_exception=True)
+    serializer.save(user=user)
+    logger.info(f"Family member saved for user: {user.phone_number}")
+    return serializer.data
+
+
+def delete_family_member(telegram_id, fm_id):
+    FamilyMember.objects.get(user__telegram_id=telegram_id, id=fm_id).delete()
+
+
+def list_addresses(telegram_id, limit=None, offset=0):
+    addresses = Address.objects.filter(user__telegram_id=telegram_id).order_by('id')
+    return paginate(addresses, AddressSerializer, limit, offset)
+
+
+def save_address(telegram_id, data, addr_id=None):
+    """Creates an address, or replaces the one with ``addr_id``."""
+    user = get_user(telegram_id)
+    instance = Address.objects.get(user=user, id=addr_id) if addr_id is not None else None
+    serializer = AddressSerializer(instance, data=data)
+    serializer.is_valid(raise_exception=True)
+    serializer.save(user=user)
+    logger.info(f"Address saved for user: {user.phone_number}")
+    return serializer.data
+
+
+def delete_address(telegram_id, addr_id):
+    Address.objects.get(user__telegram_id=telegram_id, id=addr_id).delete()
+
+
+def store_document(family_member, description, upload):
+    """Saves an uploaded file (see ``uploads.receive_upload``) as a document of ``family_member``."""
+    document = Document(family_member=family_member, description=description)
+    document.file.save(upload.name, upload, save=False)
+    document.save()
+    logger.info(f"Document uploaded for family member: {family_member.full_name} ({upload.size} bytes)")
+    return document
+
+
+def upload_document(telegram_id, family_member_id, description, upload):
+    family_member = FamilyMember.objects.get(user__telegram_id=telegram_id, id=family_member_id)
+    return DocumentSerializer(store_document(family_member, description, upload)).data
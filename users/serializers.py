@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import CustomUser, Address, FamilyMember, Document
-from jdatetime import date, datetime
+from django.utils import timezone
+from medical_bot import jalali
 from django.core.exceptions import ValidationError
 
 class DocumentSerializer(serializers.ModelSerializer):
@@ -9,12 +10,9 @@ class DocumentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Document
         fields = ['id', 'family_member', 'file', 'description', 'uploaded_at', 'uploaded_at_jalali']
-        extra_kwargs = {
-            'uploaded_at': {'write_only': True}
-        }
 
     def get_uploaded_at_jalali(self, obj):
-        return datetime.fromgregorian(date=obj.uploaded_at.date()).strftime('%Y/%m/%d %H:%M:%S') if obj.uploaded_at else None
+        return jalali.format_datetime(timezone.localtime(obj.uploaded_at)) if obj.uploaded_at else None
 
 class FamilyMemberSerializer(serializers.ModelSerializer):
     birth_date_jalali = serializers.SerializerMethodField(read_only=True)
@@ -28,18 +26,26 @@ class FamilyMemberSerializer(serializers.ModelSerializer):
         }
 
     def get_birth_date_jalali(self, obj):
-        return date.fromgregorian(date=obj.birth_date).strftime('%Y/%m/%d') if obj.birth_date else None
+        return jalali.format_date(obj.birth_date)
 
     def get_age(self, obj):
         return calculate_age(obj.birth_date)
 
+class ProfileFamilyMemberSerializer(FamilyMemberSerializer):
+    """A family member as nested in the profile, with their documents."""
+    documents = DocumentSerializer(many=True, read_only=True)
+
+    class Meta(FamilyMemberSerializer.Meta):
+        fields = FamilyMemberSerializer.Meta.fields + ['documents']
+
 class AddressSerializer(serializers.ModelSerializer):
     class Meta:
         model = Address
         fields = ['id', 'title', 'full_address', 'latitude', 'longitude']
 
 class CustomUserSerializer(serializers.ModelSerializer):
-    family_members = FamilyMemberSerializer(many=True, read_only=True)
+    """The profile; load users with ``CustomUser.objects.with_profile()`` so nesting costs a fixed number of queries."""
+    family_members = ProfileFamilyMemberSerializer(many=True, read_only=True)
     addresses = AddressSerializer(many=True, read_only=True)
     birth_date_jalali = serializers.SerializerMethodField(read_only=True)
     age = serializers.SerializerMethodField(read_only=True)
@@ -52,34 +58,26 @@ class CustomUserSerializer(serializers.ModelSerializer):
         }
 
     def get_birth_date_jalali(self, obj):
-        return date.fromgregorian(date=obj.birth_date).strftime('%Y/%m/%d') if obj.birth_date else None
+        return jalali.format_date(obj.birth_date)
 
     def get_age(self, obj):
         return calculate_age(obj.birth_date)
 
 def calculate_age(birth_date):
     """Calculates age from a birth date."""
-    if not birth_date:
-        return None
-    today = date.today()
-    birth_date = date.fromgregorian(date=birth_date)
-    age = today.year - birth_date.year
-    if (today.month, today.day) < (birth_date.month, birth_date.day):
-        age -= 1
-    return age
+    return jalali.age(birth_date)
 
 class CreateCustomUserSerializer(serializers.ModelSerializer):
     birth_date_jalali = serializers.CharField(write_only=True, required=False, allow_blank=True, label='تاریخ تولد شمسی')
 
     class Meta:
         model = CustomUser
-        fields = ['phone_number', 'full_name', 'birth_date', 'birth_date_jalali', 'gender', 'medical_conditions', 'email', 'region']
+        fields = ['phone_number', 'telegram_id', 'full_name', 'birth_date', 'birth_date_jalali', 'gender', 'medical_conditions', 'email', 'region']
 
     def validate_birth_date_jalali(self, value):
         if value:
             try:
-                jdate = date.parse(value)
-                return date(jdate.year, jdate.month, jdate.day).togregorian()
+                return jalali.parse_date(value)
             except ValueError:
                 raise serializers.ValidationError("فرمت تاریخ تولد شمسی نامعتبر است. (مثال: 1370/02/15)")
         return None
@@ -1,3 +1,316 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from datetime import date, timedelta
+from urllib.parse import urlencode
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from medical_bot import jalali
+from medical_bot.service_auth import signature_headers
+from orders.models import Order
+from services.models import ServiceCategory, Service
+from .models import CustomUser, Address, FamilyMember, Document
+from .authentication import user_cache
+from .uploads import UploadRejected, UploadWriter
+from . import operations
 
-# Create your tests here.
+PDF_BYTES = b'%PDF-1.4\n' + b'0' * 1000
+
+
+class DocumentUploadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(phone_number='09123456789', full_name='Test User', gender='male')
+        self.client.force_authenticate(user=self.user)
+        self.member = FamilyMember.objects.create(user=self.user, full_name='Test Child', gender='female', relationship='فرزند')
+
+    def upload(self, body, content_type='application/pdf', **params):
+        query = {'family_member': self.member.id, 'description': 'نسخه پزشک', 'filename': 'scan.pdf', **params}
+        url = reverse('document-upload') + '?' + urlencode(query)
+        return self.client.post(url, data=body, content_type=content_type)
+
+    def test_upload_streams_body_into_storage(self):
+        response = self.upload(PDF_BYTES)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        document = Document.objects.get()
+        self.assertEqual(document.family_member, self.member)
+        self.assertEqual(document.description, 'نسخه پزشک')
+        with document.file.open('rb') as stored:
+            self.assertEqual(stored.read(), PDF_BYTES)
+
+    def test_content_not_matching_type_is_rejected(self):
+        response = self.upload(b'\x89PNG\r\n\x1a\n' + b'0' * 100)
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        response = self.upload(PDF_BYTES, content_type='application/zip')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        self.assertFalse(Document.objects.exists())
+
+    @override_settings(DOCUMENT_MAX_UPLOAD_SIZE=500)
+    def test_oversized_upload_is_rejected(self):
+        response = self.upload(PDF_BYTES)
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertFalse(Document.objects.exists())
+
+    def test_other_users_family_member_is_rejected(self):
+        other = CustomUser.objects.create_user(phone_number='09350000000', full_name='Other', gender='female')
+        member = FamilyMember.objects.create(user=other, full_name='Other Child', gender='male', relationship='فرزند')
+        response = self.upload(PDF_BYTES, family_member=member.id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class UploadWriterTests(SimpleTestCase):
+    def write(self, content_type, *chunks):
+        writer = UploadWriter(content_type)
+        self.addCleanup(writer.abort)
+        for chunk in chunks:
+            writer.write(chunk)
+        return writer.finish()
+
+    def test_signature_split_across_chunks(self):
+        upload = self.write('application/pdf', b'%P', b'DF', b'-1.4\n', b'0' * 100)
+        self.assertEqual(upload.read(), b'%PDF-1.4\n' + b'0' * 100)
+        with self.assertRaises(UploadRejected):
+            self.write('image/png', b'\x89P', b'NG\r\n', b'\x00\x00\x00\x00')
+
+    def test_file_shorter_than_longest_signature_is_checked_at_the_end(self):
+        self.assertEqual(self.write('image/jpeg', b'\xff\xd8', b'\xff\xe0').size, 4)
+        with self.assertRaises(UploadRejected):
+            self.write('image/png', b'\x89PNG')
+
+
+class ListPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(phone_number='09123456789', full_name='Test User', gender='male')
+        self.client.force_authenticate(user=self.user)
+        for index in range(5):
+            Address.objects.create(user=self.user, title=f'Address {index}', full_address='تهران')
+
+    def test_list_is_unpaginated_without_limit(self):
+        response = self.client.get(reverse('address-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()), 5)
+
+    def test_limit_and_offset_return_one_page(self):
+        response = self.client.get(reverse('address-list'), {'limit': 2, 'offset': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['count'], 5)
+        self.assertEqual([addr['title'] for addr in data['results']], ['Address 2', 'Address 3'])
+        self.assertIsNotNone(data['next'])
+
+    def test_negative_offset_returns_first_page(self):
+        response = self.client.get(reverse('address-list'), {'limit': 2, 'offset': -3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([addr['title'] for addr in response.json()['results']], ['Address 0', 'Address 1'])
+
+
+class SessionBootstrapTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(phone_number='09123456789', full_name='Test User', gender='male')
+        self.client.force_authenticate(user=self.user)
+        self.member = FamilyMember.objects.create(
+            user=self.user, full_name='Test Child', gender='female', relationship='فرزند', birth_date=date(2015, 1, 1),
+        )
+        self.address = Address.objects.create(user=self.user, title='خانه', full_address='تهران')
+        with self.captureOnCommitCallbacks(execute=True):
+            category = ServiceCategory.objects.create(name='Test Category')
+            self.service = Service.objects.create(
+                category=category, name='Test Service', description='', price=100, duration=timedelta(hours=1),
+            )
+        now = timezone.now()
+        self.open_order = self.make_order(now + timedelta(days=3))
+        self.make_order(now + timedelta(hours=2))  # inside the cancellation window
+        self.make_order(now + timedelta(days=3), status='canceled')
+
+    def make_order(self, scheduled_time, status='pending'):
+        return Order.objects.create(
+            user=self.user, service=self.service, address=self.address, scheduled_time=scheduled_time, status=status,
+        )
+
+    def test_bootstrap_returns_session_in_one_response(self):
+        response = self.client.get(reverse('profile-bootstrap'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['profile']['full_name'], 'Test User')
+        self.assertEqual([fm['full_name'] for fm in data['profile']['family_members']], ['Test Child'])
+        self.assertIsNotNone(data['profile']['family_members'][0]['age'])
+        self.assertEqual([addr['title'] for addr in data['profile']['addresses']], ['خانه'])
+        self.assertEqual([order['id'] for order in data['cancellable_orders']], [self.open_order.id])
+
+        catalog = self.client.get(reverse('catalog')).json()
+        self.assertEqual(data['catalog_version'], catalog['version'])
+
+    def test_bootstrap_query_count(self):
+        self.client.get(reverse('profile-bootstrap'))  # builds the catalog snapshot
+        self.client.force_authenticate(user=CustomUser.objects.get(pk=self.user.pk))  # no prefetched relations
+        with self.assertNumQueries(4):  # family members, their documents, addresses, orders
+            self.client.get(reverse('profile-bootstrap'))
+
+
+class ProfileQueryBudgetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            phone_number='09123456789', telegram_id=1001, full_name='Test User', gender='male',
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def add_family(self, size):
+        members = FamilyMember.objects.bulk_create(
+            FamilyMember(user=self.user, full_name=f'Member {index}', gender='female', relationship='فرزند',
+                         birth_date=date(2000 + index % 20, 1 + index % 12, 1))
+            for index in range(size)
+        )
+        Document.objects.bulk_create(
+            Document(family_member=member, file=f'documents/{member.id}.pdf', description='نسخه') for member in members
+        )
+        Address.objects.create(user=self.user, title=f'Address {size}', full_address='تهران')
+
+    def test_me_returns_the_profile_object(self):
+        self.add_family(2)
+        response = self.client.get(reverse('profile-me'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['full_name'], 'Test User')
+        self.assertEqual([fm['full_name'] for fm in data['family_members']], ['Member 0', 'Member 1'])
+        self.assertEqual([doc['description'] for doc in data['family_members'][0]['documents']], ['نسخه'])
+
+        response = self.client.patch(reverse('profile-me'), {'region': 'تهران'}, format='json')
+        self.assertEqual(response.json()['region'], 'تهران')
+
+    def test_me_query_count_does_not_grow_with_family_size(self):
+        total = 0
+        for size in (1, 10, 100):
+            self.add_family(size - total)
+            total = size
+            with self.subTest(family_members=size):
+                with self.assertNumQueries(4):  # user, family members, their documents, addresses
+                    response = self.client.get(reverse('profile-me'))
+                self.assertEqual(len(response.json()['family_members']), size)
+
+    def test_profile_operation_query_count(self):
+        self.add_family(100)
+        with self.assertNumQueries(4):
+            profile = operations.get_profile(1001)
+        self.assertEqual(len(profile['family_members']), 100)
+
+
+@override_settings(BOT_API_SECRET='test-secret')
+class BotServiceAuthenticationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CustomUser.objects.create_user(
+            phone_number='09123456789', telegram_id=1001, full_name='Test User', gender='male',
+        )
+        Address.objects.create(user=self.user, title='خانه', full_address='تهران')
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+
+    def signed(self, method, path, secret='test-secret', now=None, **kwargs):
+        headers = signature_headers(secret, method, path, now=now)
+        return self.client.generic(method, path, headers=headers, **kwargs)
+
+    def test_signed_request_acts_as_telegram_id_user(self):
+        response = self.signed('GET', reverse('address-list') + '?telegram_id=1001')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([addr['title'] for addr in response.json()], ['خانه'])
+
+    def test_bad_or_expired_signature_is_rejected(self):
+        path = reverse('address-list') + '?telegram_id=1001'
+        self.assertEqual(self.signed('GET', path, secret='wrong').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.signed('GET', path, now=0).status_code, status.HTTP_403_FORBIDDEN)
+        # The acting user is part of what is signed
+        headers = signature_headers('test-secret', 'GET', path)
+        response = self.client.get(reverse('address-list') + '?telegram_id=1002', headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_unsigned_requests_still_need_a_login(self):
+        response = self.client.get(reverse('address-list'), {'telegram_id': 1001})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_signed_requests_only_reach_the_bots_actions(self):
+        for telegram_id in ('?telegram_id=1001', ''):
+            with self.subTest(telegram_id=telegram_id):
+                response = self.signed('GET', reverse('profile-list') + telegram_id)
+                self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+                response = self.signed('DELETE', reverse('profile-detail', kwargs={'pk': self.user.pk}) + telegram_id)
+                self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(CustomUser.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(self.signed('GET', reverse('profile-me') + '?telegram_id=1001').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.signed('GET', reverse('profile-bootstrap') + '?telegram_id=1001').status_code, status.HTTP_200_OK)
+
+    def test_service_requests_without_a_user(self):
+        response = self.signed('POST', reverse('profile-register'), data=json.dumps({
+            'phone_number': '09111111111', 'telegram_id': 1002, 'full_name': 'New User', 'gender': 'female',
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.signed('GET', reverse('profile-me') + '?telegram_id=1002').json()['full_name'], 'New User')
+        response = self.signed('GET', reverse('profile-me') + '?telegram_id=1003')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)  # Unregistered: the bot offers to register
+        response = self.signed('GET', reverse('address-list') + '?telegram_id=1003')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_user_lookup_is_cached_until_the_user_changes(self):
+        path = reverse('address-list') + '?telegram_id=1001'
+        self.signed('GET', path)
+        with self.assertNumQueries(1):  # Only the address list
+            self.signed('GET', path)
+        self.user.telegram_id = 1003
+        self.user.save()
+        self.assertEqual(self.signed('GET', path).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_only_the_bot_links_telegram_accounts(self):
+        response = self.signed('POST', reverse('profile-link'), data=json.dumps({
+            'telegram_id': 1002, 'phone_number': '989123456789',
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.telegram_id, 1002)
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(reverse('profile-link'), {'telegram_id': 1004, 'phone_number': '09123456789'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.post(reverse('profile-register'), {
+            'phone_number': '09111111111', 'telegram_id': 1004, 'full_name': 'New User', 'gender': 'female',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class IndexUsageTests(TestCase):
+    """The birthday task and document lists are planned on their indexes."""
+
+    def setUp(self):
+        users = CustomUser.objects.bulk_create(
+            CustomUser(phone_number=f'0912{index:07}', telegram_id=index + 1, full_name='Test User', gender='male',
+                       birth_date=date(1980, 1, 1) + timedelta(days=index * 37) if index % 3 else None)
+            for index in range(300)
+        )
+        self.members = FamilyMember.objects.bulk_create(
+            FamilyMember(user=users[index], full_name='Test Member', gender='female', relationship='فرزند')
+            for index in range(100)
+        )
+        Document.objects.bulk_create(
+            Document(family_member=self.members[index % 100], file=f'documents/{index}.pdf') for index in range(1000)
+        )
+
+    def test_birthday_lookup(self):
+        # Same filter as medical_bot.tasks.send_birthday_messages
+        queryset = CustomUser.objects.filter(
+            birth_date__in=jalali.anniversaries(1, 1, 1900, 2025), telegram_id__isnull=False,
+        )
+        self.assertIn('user_birth_date_idx', queryset.explain())
+
+    def test_member_documents_in_upload_order(self):
+        queryset = Document.objects.filter(family_member=self.members[7]).order_by('uploaded_at', 'id')
+        self.assertIn('document_member_uploaded_idx', queryset.explain())
@@ -0,0 +1,95 @@
+import os
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of the document types the bot accepts
+SIGNATURES = [
+    (b'%PDF-', 'application/pdf'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+]
+SNIFF_LENGTH = max(len(signature) for signature, _ in SIGNATURES)
+
+
+class UploadRejected(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff_content_type(head):
+    """Returns the content type recognised from a file's first bytes, or None."""
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+class UploadWriter:
+    """
+    Writes a document into a temporary file chunk by chunk.
+
+    The declared type, the size and the file signature are checked as data
+    arrives, so an oversized or mislabelled upload is rejected as soon as it
+    is detected and at most one chunk is held in memory. The signature is
+    checked once SNIFF_LENGTH bytes have arrived, however the body was split
+    into chunks (or at the end, for shorter files). ``finish`` returns a
+    ``TemporaryUploadedFile``, which ``FileSystemStorage`` moves into place
+    without another copy.
+    """
+
+    def __init__(self, content_type, content_length=None, filename=None):
+        self.max_size = settings.DOCUMENT_MAX_UPLOAD_SIZE
+        self.content_type = (content_type or '').split(';')[0].strip().lower()
+        if self.content_type not in settings.DOCUMENT_ALLOWED_TYPES:
+            raise UploadRejected(f"Unsupported file type: {self.content_type or 'unknown'}", 415)
+        if content_length is not None and content_length > self.max_size:
+            raise UploadRejected("File is too large.", 413)
+        name = os.path.basename(filename or '') or 'document'
+        self.file = TemporaryUploadedFile(name, self.content_type, 0, None)
+        self.size = 0
+        self.head = b''  # First bytes, until the signature was checked
+
+    def check_signature(self):
+        if sniff_content_type(self.head) != self.content_type:
+            raise UploadRejected("File content does not match its type.", 415)
+        self.head = None
+
+    def write(self, chunk):
+        if self.head is not None:
+            self.head = (self.head + chunk)[:SNIFF_LENGTH]
+            if len(self.head) == SNIFF_LENGTH:
+                self.check_signature()
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise UploadRejected("File is too large.", 413)
+        self.file.write(chunk)
+
+    def finish(self):
+        if self.size == 0:
+            raise UploadRejected("Empty upload.", 400)
+        if self.head is not None:
+            self.check_signature()
+        self.file.size = self.size
+        self.file.seek(0)
+        return self.file
+
+    def abort(self):
+        self.file.close()
+
+
+def receive_upload(stream, content_type, content_length, filename):
+    """Copies a raw request body into a temporary file with ``UploadWriter``."""
+    writer = UploadWriter(content_type, content_length, filename)
+    try:
+        while stream is not None:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            writer.write(chunk)
+        return writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
@@ -5,19 +5,40 @@ from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from .models import CustomUser, Address, FamilyMember, Document
 from .serializers import CustomUserSerializer, AddressSerializer, FamilyMemberSerializer, DocumentSerializer, CreateCustomUserSerializer
+from .uploads import receive_upload, UploadRejected
+from .operations import store_document, session_bootstrap, link_telegram_id
+from .authentication import BotRequest, IsBotService
 
 logger = logging.getLogger(__name__)
 
 class CustomUserViewSet(viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
     serializer_class = CustomUserSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    # Signed bot requests only reach the actions the bot uses (me, register, link, bootstrap),
+    # not the default list/retrieve/update/destroy routes
+    permission_classes = [permissions.IsAuthenticated & ~IsBotService]
 
     def get_queryset(self):
-        return CustomUser.objects.filter(id=self.request.user.id)
+        return CustomUser.objects.with_profile().filter(id=self.request.user.id)
+
+    @action(detail=False, methods=['get', 'patch'], permission_classes=[permissions.IsAuthenticated | IsBotService])
+    def me(self, request):
+        """The caller's profile as a single object; PATCH updates it."""
+        user = self.get_queryset().first()
+        if user is None:  # A bot request for a Telegram account no user is linked to
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        serializer = self.get_serializer(user)
+        if request.method == 'PATCH':
+            serializer = self.get_serializer(user, data=request.data, partial=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            logger.info(f"Profile updated for user: {user.phone_number}")
+        return Response(serializer.data)
 
-    @action(detail=False, methods=['post'])
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated | IsBotService])
     def register(self, request):
+        if request.data.get('telegram_id') is not None and not isinstance(request.auth, BotRequest):
+            return Response({"error": "Only the bot can link a Telegram account."}, status=status.HTTP_403_FORBIDDEN)
         serializer = CreateCustomUserSerializer(data=request.data)
         if serializer.is_valid():
             try:
@@ -31,12 +52,29 @@ class CustomUserViewSet(viewsets.ModelViewSet):
             logger.warning(f"Invalid user registration data: {serializer.errors}")
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], permission_classes=[IsBotService])
+    def link(self, request):
+        """Links the Telegram account to the user with the phone number the account shared as its own contact."""
+        try:
+            telegram_id, phone_number = int(request.data['telegram_id']), str(request.data['phone_number'])
+        except (KeyError, TypeError, ValueError):
+            return Response({"error": "telegram_id and phone_number are required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response(link_telegram_id(telegram_id, phone_number))
+        except CustomUser.DoesNotExist:
+            return Response({"error": "No user is registered with this phone number."}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def bootstrap(self, request):
+        """Profile, family members, addresses, cancellable orders and catalog version in one response."""
+        return Response(session_bootstrap(request.user))
+
 class AddressViewSet(viewsets.ModelViewSet):
     serializer_class = AddressSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Address.objects.filter(user=self.request.user)
+        return Address.objects.filter(user=self.request.user).order_by('id')
 
     def perform_create(self, serializer):
         try:
@@ -59,7 +97,7 @@ class FamilyMemberViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return FamilyMember.objects.filter(user=self.request.user)
+        return FamilyMember.objects.filter(user=self.request.user).order_by('id')
 
     def perform_create(self, serializer):
         try:
@@ -83,7 +121,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
     parser_classes = (MultiPartParser, FormParser)
 
     def get_queryset(self):
-        return Document.objects.filter(family_member__user=self.request.user)
+        return Document.objects.filter(family_member__user=self.request.user).order_by('id')
 
     def perform_create(self, serializer):
         try:
@@ -91,4 +129,45 @@ class DocumentViewSet(viewsets.ModelViewSet):
             logger.info(f"Document created for family member: {serializer.instance.family_member.full_name}")
         except Exception as e:
             logger.error(f"Error creating document: {e}", exc_info=True)
-            raise
\ No newline at end of file
+            raise
+
+    @action(detail=False, methods=['post'], parser_classes=[])
+    def upload(self, request):
+        """
+        Streams a raw file body into storage.
+
+        The body is the file itself with its Content-Type; the family member,
+        description and file name come as query parameters. Unlike the
+        multipart create, the file is never buffered in memory.
+        """
+        params = request.query_params
+        family_member_id = params.get('family_member', '')
+        family_member = None
+        if family_member_id.isdigit():
+            family_member = FamilyMember.objects.filter(user=request.user, id=family_member_id).first()
+        if family_member is None:
+            return Response({"error": "Unknown family member."}, status=status.HTTP_400_BAD_REQUEST)
+        description = params.get('description', '')[:200]
+        if not description:
+            return Response({"error": "Description is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        content_length = request.META.get('CONTENT_LENGTH')
+        try:
+            upload = receive_upload(
+                request.stream,
+                request.content_type,
+                int(content_length) if content_length else None,
+                params.get('filename'),
+            )
+        except UploadRejected as e:
+            logger.warning(f"Document upload rejected for user {request.user.phone_number}: {e}")
+            return Response({"error": str(e)}, status=e.status)
+
+        try:
+            document = store_document(family_member, description, upload)
+        except Exception as e:
+            logger.error(f"Error storing uploaded document: {e}", exc_info=True)
+            return Response({"error": "Failed to store document."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            upload.close()
+        return Response(DocumentSerializer(document, context={'request': request}).data, status=status.HTTP_201_CREATED)